@@ -1,21 +1,26 @@
 import asyncio
 import os
 import json
+import logging
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
 from dotenv import load_dotenv
-from redis import Redis
-import requests
 from dto import dto as DTO
 from routers.order import send_message
+from services.notifications import PermanentError, notifier
+from auth.database import async_session_maker
+from services.order_state import ACCEPTED, DECLINED, OrderStateError, change_state
+from services.order_stream import OrderStreamConsumer
+from services.redis_pool import redis_client
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Получение токена из .env
 API_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_CHAT_IDS = os.getenv("ADMIN_CHAT_ID", "").split()  # Администраторские чаты
-REDIS_HOST = os.getenv("REDIS_HOST", "0.0.0.0")
 
 # Проверка токена
 if not API_TOKEN:
@@ -25,11 +30,8 @@ if not API_TOKEN:
 bot = Bot(token=API_TOKEN)
 dp = Dispatcher()
 
-# Настройка Redis
-redis_client = Redis(host=REDIS_HOST, port=6379, decode_responses=True)
-
-# Переменная для отслеживания последнего обработанного заказа
-last_processed_order_id = 0
+# Администратор нажал «Отклонить» и пишет причину: чат → номер заказа в Redis
+awaiting_decline_reason = {}
 
 
 # Форматирование заказа
@@ -74,107 +76,148 @@ class Order:
         self.CLIENT_BOT_TOKEN = os.environ.get("CLIENT_BOT_TOKEN")
         if not self.CLIENT_BOT_TOKEN:
             raise ValueError("CLIENT_BOT_TOKEN не задан в файле .env")
+        notifier.register("client", self.CLIENT_BOT_TOKEN)
 
     def _format_telegram_message(self, order_dto: DTO.Order) -> str:
         return f"Ваш заказ №{order_dto.number}, начали готовить!"
 
     def _send_telegram_message(self, chat_id: int, message: str):
-        try:
-            response = requests.get(
-                f"https://api.telegram.org/bot{self.CLIENT_BOT_TOKEN}/sendMessage",
-                params={"chat_id": chat_id, "text": message}
-            )
-            if response.status_code != 200:
-                print(f"Ошибка отправки в Telegram: {response.text}")
-        except Exception as e:
-            print(f"Ошибка отправки в Telegram: {e}")
+        # Доставка, повторы и dead-letter — в очереди уведомлений
+        notifier.enqueue(chat_id, message, bot="client")
 
 
 order_handler = Order()
 
 
 # Генерация клавиатуры
-def get_order_keyboard():
+def get_order_keyboard(order_id, number=None):
+    # В callback_data ключ заказа: уведомления могут прийти пачкой или сводкой,
+    # поэтому кнопка должна знать, к какому заказу относится
+    suffix = f" №{number}" if number is not None else ""
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="Принять", callback_data="accept"),
-            InlineKeyboardButton(text="Отклонить", callback_data="decline")
+            InlineKeyboardButton(text=f"Принять{suffix}", callback_data=f"accept:{order_id}"),
+            InlineKeyboardButton(text=f"Отклонить{suffix}", callback_data=f"decline:{order_id}")
         ]
     ])
     return kb
 
 
+async def load_order(order_id):
+    data = await redis_client.get(f"order:{order_id}")
+    return json.loads(data) if data else None
+
+
+async def move_order(order, state, **extra):
+    """
+    Перевод заказа в базе; событие для WebSocket и доски кухни уходит
+    через outbox. Возвращает текст ошибки, если переход невозможен.
+    """
+    # У заказов, сохранённых до появления id в Redis, его нет
+    if order.get("id") is None:
+        return None
+    try:
+        async with async_session_maker() as session:
+            await change_state(session, order["id"], state, **extra)
+    except OrderStateError as e:
+        return str(e)
+    return None
+
+
 # Обработчик callback-событий
 @dp.callback_query()
 async def handle_callback(callback: CallbackQuery):
-    # Получение данных из callback_data
-    if callback.data == "accept":
+    # Получение данных из callback_data: действие и ключ заказа
+    action, _, order_id = (callback.data or "").partition(":")
+    order = await load_order(order_id) if order_id else None
+    if order is None:
+        await callback.answer("Заказ не найден", show_alert=True)
+        return
+
+    if action == "accept":
+        error = await move_order(order, ACCEPTED)
+        if error:
+            await callback.answer(f"Заказ №{order.get('number')} уже не принять: {error}", show_alert=True)
+            return
         # Отправка сообщения 
         msg = "Ваш заказ принят! Мы начали его готовить!"
-        req = requests.get(
-                f"https://api.telegram.org/bot{order_handler.CLIENT_BOT_TOKEN}/sendMessage",
-                params={
-                    "chat_id": orderr["client"], 
-                    "text": msg
-                }
-            )
-        print(orderr["client"])
+        order_handler._send_telegram_message(order["client"], msg)
         
         # Сообщение сотруднику
-        await callback.message.answer("Вы приняли заказ! Клиенту отправлено уведомление.")
+        await callback.message.answer(f"Вы приняли заказ №{order.get('number')}! Клиенту отправлено уведомление.")
     
-    elif callback.data == "decline":
+    elif action == "decline":
         # Запрос причины отказа
+        awaiting_decline_reason[callback.message.chat.id] = order_id
         await callback.message.answer(
-            "Пожалуйста, укажите причину отклонения заказа, отправив её следующим сообщением.",
+            f"Пожалуйста, укажите причину отклонения заказа №{order.get('number')}, отправив её следующим сообщением.",
         )
-        
-        # Ожидание причины от администратора
-        @dp.message()
-        async def handle_decline_reason(message: types.Message):
-            reason = message.text
-            client_chat_id = orderr["client"]
-            client_message = (
-                f"Ваш заказ был отклонен. Мы извиняемся за неудобства.\n"
-                f"Причина: {reason}"
-            )
-            order_handler._send_telegram_message(client_chat_id, client_message)
-            
-            # Сообщение сотруднику
-            await message.answer("Клиенту отправлено уведомление об отказе.")
     
     # Закрытие callback-запроса
     await callback.answer()
 
 
-# Функция проверки новых заказов
+# Ожидание причины от администратора
+@dp.message(lambda message: message.chat.id in awaiting_decline_reason)
+async def handle_decline_reason(message: types.Message):
+    order = await load_order(awaiting_decline_reason.pop(message.chat.id))
+    if order is None:
+        await message.answer("Заказ не найден.")
+        return
+    reason = message.text
+    error = await move_order(order, DECLINED, reason=reason)
+    if error:
+        await message.answer(f"Заказ №{order.get('number')} уже не отклонить: {error}")
+        return
+    client_message = (
+        f"Ваш заказ был отклонен. Мы извиняемся за неудобства.\n"
+        f"Причина: {reason}"
+    )
+    order_handler._send_telegram_message(order["client"], client_message)
+    
+    # Сообщение сотруднику
+    await message.answer("Клиенту отправлено уведомление об отказе.")
+
+
+async def notify_admins(order_id, order):
+    """
+    Уведомление администраторов о заказе: чаты отправляются параллельно
+    с учётом лимитов Telegram, при наплыве заказов — сводками. Возвращается
+    после ответа Telegram; если хоть один чат не получил сообщение из-за
+    временной ошибки, бросает DeliveryFailed — запись потока не
+    подтверждается и будет повторена (чаты, которые уже получили заказ,
+    получат его ещё раз)
+    """
+    formatted_order = format_order(order)
+    keyboard = get_order_keyboard(order_id, order.get("number")).model_dump(exclude_none=True)
+    results = await asyncio.gather(*(
+        notifier.send(chat_id, formatted_order, bot="admin", reply_markup=keyboard, digestible=True)
+        for chat_id in ADMIN_CHAT_IDS
+    ), return_exceptions=True)
+    failed = None
+    for chat_id, result in zip(ADMIN_CHAT_IDS, results):
+        if isinstance(result, PermanentError):
+            # Чат не найден или бот удалён из него — повтор не поможет
+            logger.warning("Order %s was not sent to admin chat %s: %s", order_id, chat_id, result)
+        elif isinstance(result, BaseException):
+            failed = failed or result
+    if failed is not None:
+        raise failed
+
+
+async def handle_order_event(order_id, order):
+    await notify_admins(order_id, order)
+
+
+order_consumer = OrderStreamConsumer(redis_client, handle_order_event)
+
+
+# Чтение новых заказов из потока Redis (вместо опроса order_id каждые 0.1 с)
 async def check_for_new_orders():
-    global last_processed_order_id
-    while True:
-        try:
-            last_order_id = redis_client.get("order_id")
-            if last_order_id and int(last_order_id) > last_processed_order_id:
-                last_processed_order_id = int(last_order_id)
-                last_order_data = redis_client.get(f"order:{last_order_id}")
-                if last_order_data:
-                    global orderr
-                    orderr = json.loads(last_order_data)
-                    formatted_order = format_order(orderr)
-
-                    # Отправляем уведомления администраторам
-                    for chat_id in ADMIN_CHAT_IDS:
-                        try:
-                            await bot.send_message(chat_id, formatted_order, reply_markup=get_order_keyboard())
-                        except Exception as e:
-                            print(f"Ошибка отправки сообщения в чат {chat_id}: {e}")
-
-        except Exception as e:
-            print(f"Ошибка при проверке заказов: {e}")
-
-        await asyncio.sleep(0.1)
+    await order_consumer.run()
 
 
 # Команда /start
 @dp.message(Command("start"))
 async def start_command(message: types.Message):
-    await message.answer(f"Бот запущен и проверяет новые заказы каждую секунду. Ваш ID: {message.chat.id}")
+    await message.answer(f"Бот запущен и получает новые заказы. Ваш ID: {message.chat.id}")
@@ -1,14 +1,61 @@
+import logging
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routers.routers import *
 from starlette.responses import FileResponse 
-from redis import Redis
 from scalar_fastapi import get_scalar_api_reference
 from fastapi.staticfiles import StaticFiles
+from services.availability import availability
+from services.catalog import category_catalog, product_catalog
+from services.catalog_sync import catalog_sync
+from services.images import image_cache
+from services.notifications import notifier
+from services.order_events import order_events
+from services.order_partitions import order_partitions
+from services.outbox import outbox_relay
+from services.redis_pool import close_redis
+from config import HTTPX_LOG_LEVEL, IMAGE_WARM
+from services.sbis import sbis_service
 
 
-app = FastAPI(tags=["Freestyle BOT"])
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await image_cache.start()
+    if IMAGE_WARM:
+        product_catalog.subscribe(lambda snapshot: image_cache.warm(snapshot.images))
+    # Каталог СБИС обновляется в фоне, эндпоинты читают его из памяти
+    product_catalog.start()
+    category_catalog.start()
+    catalog_sync.start()
+    availability.start()
+    notifier.start()
+    outbox_relay.start()
+    # Подписка воркера на события заказов для WebSocket
+    order_events.start()
+    # Секции order на месяцы вперёд и архивация старых
+    order_partitions.start()
+    yield
+    await order_partitions.stop()
+    await order_events.stop()
+    await outbox_relay.stop()
+    # Неотправленные уведомления дожидаемся недолго, остальное уходит в dead-letter
+    await notifier.stop()
+    await availability.stop()
+    await catalog_sync.stop()
+    await product_catalog.stop()
+    await category_catalog.stop()
+    await image_cache.stop()
+    # Закрываем общий пул соединений к СБИС
+    await sbis_service.aclose()
+    await close_redis()
+
+
+# httpx пишет в INFO полный URL запроса, а в URL Bot API лежит токен бота
+logging.getLogger("httpx").setLevel(HTTPX_LOG_LEVEL)
+
+app = FastAPI(tags=["Freestyle BOT"], lifespan=lifespan)
 # Обработчик для статических файлов
 # app.mount("/images", StaticFiles(directory="static"), name="images")
 
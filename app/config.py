@@ -9,7 +9,98 @@ DB_NAME = os.environ.get("DB_NAME")
 DB_USER = os.environ.get("DB_USER")
 DB_PASS = os.environ.get("DB_PASS")
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
-REDIS_HOST = os.environ.get("REDIS_HOST")
-REDIS_PORT = os.environ.get("REDIS_PORT")
+REDIS_HOST = os.environ.get("REDIS_HOST", "127.0.0.1")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
+REDIS_DB = int(os.environ.get("REDIS_DB", 0))
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", 50))
+REDIS_POOL_TIMEOUT = float(os.environ.get("REDIS_POOL_TIMEOUT", 5))
+# Должен быть больше ORDER_STREAM_BLOCK_MS, иначе блокирующее чтение потока оборвётся
+REDIS_SOCKET_TIMEOUT = float(os.environ.get("REDIS_SOCKET_TIMEOUT", 15))
 ADMIN_CHAT_ID = os.environ.get("ADMIN_CHAT_ID")
-CLIENT_BOT_TOKEN = os.environ.get("CLIENT_BOT_TOKEN")
\ No newline at end of file
+CLIENT_BOT_TOKEN = os.environ.get("CLIENT_BOT_TOKEN")
+
+ORDER_STREAM = os.environ.get("ORDER_STREAM", "orders:stream")
+ORDER_STREAM_GROUP = os.environ.get("ORDER_STREAM_GROUP", "admin-bot")
+ORDER_STREAM_MAXLEN = int(os.environ.get("ORDER_STREAM_MAXLEN", 10000))
+ORDER_STREAM_BATCH = int(os.environ.get("ORDER_STREAM_BATCH", 20))
+ORDER_STREAM_BLOCK_MS = int(os.environ.get("ORDER_STREAM_BLOCK_MS", 5000))
+ORDER_STREAM_CLAIM_IDLE_MS = int(os.environ.get("ORDER_STREAM_CLAIM_IDLE_MS", 60000))
+
+OUTBOX_BATCH = int(os.environ.get("OUTBOX_BATCH", 50))
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", 1))
+OUTBOX_RETRY_BASE = float(os.environ.get("OUTBOX_RETRY_BASE", 2))
+OUTBOX_RETRY_MAX = float(os.environ.get("OUTBOX_RETRY_MAX", 300))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 20))
+
+# Ответы POST /order по Idempotency-Key: хранятся сутки, ключ в работе — не дольше 30 с
+IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", 86400))
+IDEMPOTENCY_LOCK_TTL = int(os.environ.get("IDEMPOTENCY_LOCK_TTL", 30))
+IDEMPOTENCY_WAIT = float(os.environ.get("IDEMPOTENCY_WAIT", 10))
+
+ORDER_EVENTS_CHANNEL = os.environ.get("ORDER_EVENTS_CHANNEL", "orders:events")
+WS_SEND_TIMEOUT = float(os.environ.get("WS_SEND_TIMEOUT", 5))
+WS_QUEUE_SIZE = int(os.environ.get("WS_QUEUE_SIZE", 32))
+
+# Границы суток для отчётов о продажах
+SALES_TIMEZONE = os.environ.get("SALES_TIMEZONE", "Asia/Sakhalin")
+
+# Месячные секции order: создаются заранее на ORDER_PARTITIONS_AHEAD месяцев;
+# секции старше ORDER_RETENTION_MONTHS (0 — хранить всё) выгружаются в архив
+ORDER_PARTITIONS_AHEAD = int(os.environ.get("ORDER_PARTITIONS_AHEAD", 3))
+ORDER_PARTITION_INTERVAL = float(os.environ.get("ORDER_PARTITION_INTERVAL", 3600))
+ORDER_RETENTION_MONTHS = int(os.environ.get("ORDER_RETENTION_MONTHS", 0))
+ORDER_ARCHIVE_DIR = os.environ.get("ORDER_ARCHIVE_DIR", "archive/orders")
+
+APP_CLIENT_ID = os.environ.get("APP_CLIENT_ID")
+APP_SECRET = os.environ.get("APP_SECRET")
+APP_SECRET_KEY = os.environ.get("APP_SECRET_KEY")
+SBIS_OAUTH_URL = os.environ.get("SBIS_OAUTH_URL", "https://online.sbis.ru/oauth/service/")
+SBIS_API_URL = os.environ.get("SBIS_API_URL", "https://api.sbis.ru/retail")
+SBIS_HTTP2 = os.environ.get("SBIS_HTTP2", "1") == "1"
+SBIS_MAX_CONNECTIONS = int(os.environ.get("SBIS_MAX_CONNECTIONS", 20))
+SBIS_MAX_CONCURRENCY = int(os.environ.get("SBIS_MAX_CONCURRENCY", 10))
+SBIS_TIMEOUT = float(os.environ.get("SBIS_TIMEOUT", 10))
+SBIS_LIST_TIMEOUT = float(os.environ.get("SBIS_LIST_TIMEOUT", 30))
+SBIS_PAGE_SIZE = int(os.environ.get("SBIS_PAGE_SIZE", 200))
+SBIS_PAGE_CONCURRENCY = int(os.environ.get("SBIS_PAGE_CONCURRENCY", 4))
+SBIS_BREAKER_WINDOW = int(os.environ.get("SBIS_BREAKER_WINDOW", 20))
+SBIS_BREAKER_MIN_CALLS = int(os.environ.get("SBIS_BREAKER_MIN_CALLS", 5))
+SBIS_BREAKER_FAILURE_RATE = float(os.environ.get("SBIS_BREAKER_FAILURE_RATE", 0.5))
+SBIS_BREAKER_SLOW_CALL = float(os.environ.get("SBIS_BREAKER_SLOW_CALL", 5))
+SBIS_BREAKER_OPEN_SECONDS = float(os.environ.get("SBIS_BREAKER_OPEN_SECONDS", 30))
+SBIS_BREAKER_HALF_OPEN_CALLS = int(os.environ.get("SBIS_BREAKER_HALF_OPEN_CALLS", 2))
+SBIS_POINT = os.environ.get("SBIS_POINT")
+SBIS_PRODUCTS_PRICE_LIST = os.environ.get("SBIS_PRODUCTS_PRICE_LIST")
+SBIS_CATEGORY_PRICE_LIST = os.environ.get("SBIS_CATEGORY_PRICE_LIST")
+SBIS_RESOLVER_TTL = int(os.environ.get("SBIS_RESOLVER_TTL", 3600))
+SBIS_TOKEN_TTL = int(os.environ.get("SBIS_TOKEN_TTL", 3600))
+SBIS_TOKEN_REFRESH_MARGIN = int(os.environ.get("SBIS_TOKEN_REFRESH_MARGIN", 300))
+SBIS_CATALOG_REFRESH_INTERVAL = int(os.environ.get("SBIS_CATALOG_REFRESH_INTERVAL", 300))
+SBIS_CATALOG_RETRY_INTERVAL = int(os.environ.get("SBIS_CATALOG_RETRY_INTERVAL", 30))
+CATALOG_ROOT_CATEGORY = int(os.environ.get("CATALOG_ROOT_CATEGORY", 2110))
+CATALOG_EXCLUDED_CATEGORIES = [int(c) for c in os.environ.get("CATALOG_EXCLUDED_CATEGORIES", "2382").split()]
+AVAILABILITY_POLL_INTERVAL = int(os.environ.get("AVAILABILITY_POLL_INTERVAL", 30))
+ORDER_STOCK_POLICY = os.environ.get("ORDER_STOCK_POLICY", "flag")
+FOOD_SYNC_INTERVAL = int(os.environ.get("FOOD_SYNC_INTERVAL", 0))
+FOOD_SYNC_BATCH_SIZE = int(os.environ.get("FOOD_SYNC_BATCH_SIZE", 500))
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")
+NOTIFY_WORKERS = int(os.environ.get("NOTIFY_WORKERS", 4))
+NOTIFY_QUEUE_SIZE = int(os.environ.get("NOTIFY_QUEUE_SIZE", 10000))
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get("NOTIFY_MAX_ATTEMPTS", 6))
+NOTIFY_RETRY_BASE = float(os.environ.get("NOTIFY_RETRY_BASE", 1))
+NOTIFY_RETRY_MAX = float(os.environ.get("NOTIFY_RETRY_MAX", 60))
+NOTIFY_DEAD_LETTER_PATH = os.environ.get("NOTIFY_DEAD_LETTER_PATH", "notifications/dead-letter.jsonl")
+HTTPX_LOG_LEVEL = os.environ.get("HTTPX_LOG_LEVEL", "WARNING")
+TELEGRAM_GLOBAL_RATE = float(os.environ.get("TELEGRAM_GLOBAL_RATE", 25))
+TELEGRAM_CHAT_RATE = float(os.environ.get("TELEGRAM_CHAT_RATE", 1))
+TELEGRAM_GROUP_RATE = float(os.environ.get("TELEGRAM_GROUP_RATE", 20 / 60))
+NOTIFY_DIGEST_THRESHOLD = int(os.environ.get("NOTIFY_DIGEST_THRESHOLD", 5))
+NOTIFY_DIGEST_MAX = int(os.environ.get("NOTIFY_DIGEST_MAX", 10))
+PUBLIC_BASE_URL = os.environ.get("PUBLIC_BASE_URL", "").rstrip("/")
+IMAGE_CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", "images/cache")
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+IMAGE_WIDTHS = [int(w) for w in os.environ.get("IMAGE_WIDTHS", "160 320 640 1280").split()]
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+IMAGE_WARM = os.environ.get("IMAGE_WARM", "1") == "1"
+# Сколько секунд отдавать последнее меню, пока версия в Redis недоступна
+MENU_STALE_TTL = float(os.environ.get("MENU_STALE_TTL", 5))
\ No newline at end of file
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Literal, Optional
 from pydantic import BaseModel, ConfigDict
 
 class User(BaseModel):
@@ -26,6 +26,11 @@ class Order(BaseModel):
     cutlery: Optional[int] = None
 
 
+class OrderStateChange(BaseModel):
+    state: Literal["new", "accepted", "cooking", "ready", "delivered", "declined"]
+    reason: Optional[str] = None
+
+
 class Category(BaseModel):
     categoryName: Optional[str] = None
     food: Optional[list] = []
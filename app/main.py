@@ -11,7 +11,9 @@ async def bott():
     
 
 async def fastapi():
-    config = uvicorn.Config("app:app", host="0.0.0.0", port=8001, log_level="info", reload=True, ws="websockets")
+    # События заказов — короткий JSON: сжатие не нужно, а на каждом сокете держит
+    # буферы zlib (~33 КБ), что заметно при тысячах подключённых клиентов
+    config = uvicorn.Config("app:app", host="0.0.0.0", port=8001, log_level="info", reload=True, ws="websockets", ws_per_message_deflate=False)
     server = uvicorn.Server(config)
     await server.serve()
     print("FastAPI started")
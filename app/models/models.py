@@ -1,4 +1,5 @@
-from sqlalchemy import Column, ForeignKey, Integer, MetaData, String, Boolean, ARRAY, JSON, text
+from sqlalchemy import Column, ForeignKey, Integer, BigInteger, MetaData, String, Boolean, ARRAY, JSON, Date, DateTime, Index, CheckConstraint, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base, Mapped, DeclarativeMeta
 metadata = MetaData()
 Base: DeclarativeMeta = declarative_base()
@@ -20,23 +21,91 @@ class User(Base):
 
 class Order(Base):
     __tablename__ = "order"
-    id: Mapped[int] = Column(Integer, unique=True, primary_key=True)
+    # Ключ секционированной таблицы — (id, createdAt); id по-прежнему из одной последовательности
+    id: Mapped[int] = Column(Integer, primary_key=True, autoincrement=True)
     number: Mapped[int] = Column(Integer, nullable=True)
     items: Mapped[list] = Column(ARRAY(JSON), nullable=True)
     total: Mapped[int] = Column(Integer, default=0)
     date: Mapped[str] = Column(String, nullable=True)
     address: Mapped[str] = Column(String, nullable=True)
-    state: Mapped[str] = Column(String, nullable=True)
+    # new → accepted → cooking → ready → delivered, отказ — declined (services.order_state)
+    state: Mapped[str] = Column(String, nullable=False, default="new", server_default=text("'new'"))
     isDelivery: Mapped[bool] = Column(Boolean, default=False)
     payment: Mapped[str] = Column(String, nullable=True)
     comment: Mapped[str] = Column(String, nullable=True)
     client: Mapped[str] = Column(ForeignKey("user.id"), nullable=True)
     cutlery: Mapped[str] = Column(Integer, nullable=True, default=1)
+    # Время создания; date — строка от клиента. Секции order_pYYYY_MM по месяцам (services.order_partitions)
+    createdAt = Column(DateTime(timezone=True), primary_key=True, nullable=False, server_default=text("now()"))
+
+    __table_args__ = (
+        CheckConstraint("state IN ('new', 'accepted', 'cooking', 'ready', 'delivered', 'declined')", name="order_state_check"),
+        # Доска кухни (state IN активные) и список заказов с фильтром по state, по порядку id
+        Index("order_state_idx", "state", "id"),
+        Index("order_created_idx", "createdAt"),
+        {"postgresql_partition_by": 'RANGE ("createdAt")'},
+    )
 
 
     def as_dict(self):
         return {c.name: getattr(self, c.name) for c in self.__tablename__.columns}
 
+class OrderOutbox(Base):
+    """
+    Побочные эффекты заказа (Redis, Telegram), записанные в одной транзакции
+    с заказом; публикует их services.outbox.OutboxRelay
+    """
+    __tablename__ = "order_outbox"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    # Без внешнего ключа: order секционирована, id уникален только вместе с createdAt
+    orderId = Column(Integer, nullable=False)
+    topic = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    lastError = Column(String, nullable=True)
+    createdAt = Column(DateTime(timezone=True), nullable=False, server_default=text("now()"))
+    availableAt = Column(DateTime(timezone=True), nullable=False, server_default=text("now()"))
+    # Исчерпаны OUTBOX_MAX_ATTEMPTS: строка больше не публикуется и ждёт разбора
+    deadAt = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (Index("order_outbox_available_idx", "availableAt", "id", postgresql_where=text('"deadAt" IS NULL')),)
+
+class OrderItem(Base):
+    """
+    Строка заказа из Order.items в виде таблицы для отчётов по продажам
+    """
+    __tablename__ = "order_item"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    # Без внешнего ключа, как в order_outbox; строки удаляются вместе с заказом явно
+    orderId = Column(Integer, nullable=False)
+    # id позиции из корзины (номенклатура СБИС); у старых заказов может не быть
+    foodId = Column(Integer, nullable=True)
+    foodName = Column(String, nullable=True)
+    count = Column(Integer, nullable=False)
+    # Цена за единицу на момент заказа
+    price = Column(Integer, nullable=False)
+    # День продажи в SALES_TIMEZONE; NULL у старых заказов с неразборчивой датой
+    day = Column(Date, nullable=True)
+
+    __table_args__ = (
+        Index("order_item_order_idx", "orderId"),
+        Index("order_item_food_day_idx", "foodId", "day"),
+    )
+
+class FoodSalesDaily(Base):
+    """
+    Продажи блюда за день, обновляются вместе с заказом (services.sales);
+    позиции без id учитываются под foodId = 0
+    """
+    __tablename__ = "food_sales_daily"
+    day = Column(Date, primary_key=True)
+    foodId = Column(Integer, primary_key=True)
+    foodName = Column(String, nullable=True)
+    count = Column(BigInteger, nullable=False, default=0, server_default=text("0"))
+    revenue = Column(BigInteger, nullable=False, default=0, server_default=text("0"))
+    # Число заказов с этим блюдом
+    orders = Column(Integer, nullable=False, default=0, server_default=text("0"))
+
 class Category(Base):
     __tablename__ = "category"
     id = Column(Integer, unique=True, primary_key=True)
@@ -55,6 +124,12 @@ class Food(Base):
     description = Column(String, nullable=True)
     image = Column(String, nullable=True)
     category = Column(Integer, nullable=True)
+    externalId = Column(Integer, unique=True, nullable=True)
+    # Родитель в номенклатуре СБИС (hierarchicalParent); category — id локальной категории
+    externalCategory = Column(Integer, nullable=True)
+    # Исходная ссылка на картинку в СБИС; image — ссылка через прокси /sbis/image
+    externalImage = Column(String, nullable=True)
+    isDeleted = Column(Boolean, nullable=False, default=False, server_default=text("false"))
 
     def as_dict(self):
         return {c.name: getattr(self, c.name) for c in self.__tablename__.columns}
@@ -1,10 +1,12 @@
 import json
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, Request, Response, WebSocket, WebSocketDisconnect, status
 from sqlalchemy import delete, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from auth.database import get_async_session
 from dto import dto as DTO
 from models.models import *
+from services.etag import etag_matches
+from services.menu import MenuCache, get_menu_cache, menu_cache
 from typing import Any, Optional
 
 
@@ -16,6 +18,7 @@ async def category_add(catDTO: DTO.Category, session: AsyncSession = Depends(get
     query = insert(Category).values(catDTO.model_dump())
     await session.execute(query)
     await session.commit()
+    await menu_cache.invalidate()
 
 @categoryRouter.get('/')
 async def category_name_get(session: AsyncSession = Depends(get_async_session)):
@@ -34,6 +37,7 @@ async def update_categories(id: int, catDTO: DTO.Category, session: AsyncSession
     query = update(Category).where(Category.id == id).values(food=catDTO.food)
     await session.execute(query)
     await session.commit()
+    await menu_cache.invalidate()
     return "success"
 
 @categoryRouter.patch('/{id}')
@@ -41,35 +45,17 @@ async def update_category_name(id: int, name: str, session: AsyncSession = Depen
     query = update(Category).where(Category.id == id).values(categoryName = name)
     await session.execute(query)
     await session.commit()
+    await menu_cache.invalidate()
     return "success"
 
 @categoryRouter.get('/dis')
-async def distributing_foods(session: AsyncSession = Depends(get_async_session)):
-    query_food_id = select(Food.id)
-    query_food = select(Food)
-    query_cat_name = select(Category.categoryName)
-    query_cat_foods = select(Category.food)
-
-
-    result_food_id = await session.execute(query_food_id)
-    result_food = await session.execute(query_food)
-    result_cat_name = await session.execute(query_cat_name)
-    result_cat_food = await session.execute(query_cat_foods)
-
-
-    cat_name = result_cat_name.mappings().all()
-    cat_foods = result_cat_food.mappings().all()
-    food_id = result_food_id.mappings().all()
-    foods = result_food.mappings().all()
-
-    result = []
-
-    for el in range(len(cat_name)):
-        result.append({
-            "categoryName": cat_name[el]["categoryName"],
-            "foods": []
-        })
-        for e in range(len(food_id)):
-            if food_id[e]["id"] in cat_foods[el]["food"]:
-                result[el]["foods"].append(foods[e]["Food"])
-    return result
\ No newline at end of file
+async def distributing_foods(request: Request, menu: MenuCache = Depends(get_menu_cache)):
+    """
+    Категории с блюдами для витрины. Ответ собран заранее (services.menu);
+    с If-None-Match неизменившееся меню отдаётся как 304 без тела.
+    """
+    cached = await menu.get()
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
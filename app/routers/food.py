@@ -3,11 +3,15 @@ from sqlalchemy import delete, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from dotenv import load_dotenv
-from .sbis import FoodsRequest, TokenValidation, SBIService, AuthorizationData, get_categories
+from .sbis import FoodsRequest, TokenValidation, SBIService, AuthorizationData, get_categories, token_manager, sbis_service
 import os
 from auth.database import get_async_session
 from dto import dto as DTO
 from models.models import Food
+from services.catalog import CatalogStore, category_catalog
+from services.catalog_sync import catalog_sync
+from services.menu import menu_cache
+from services.sbis import SBISUnavailable
 load_dotenv()
 APP_CLIENT_ID = os.getenv("APP_CLIENT_ID")
 APP_SECRET = os.getenv("APP_SECRET")
@@ -21,6 +25,7 @@ class FoodService:
             query = insert(Food).values(**food_dto.model_dump())
             await session.execute(query)
             await session.commit()
+            await menu_cache.invalidate()
             return {"message": "Food added successfully"}
         except Exception as e:
             await session.rollback()
@@ -31,7 +36,9 @@ class FoodService:
         Получение списка блюд (опционально по категории)
         """
         try:
-            query = select(Food) if category is None else select(Food).where(Food.category == category)
+            query = select(Food).where(Food.isDeleted.is_(False))
+            if category is not None:
+                query = query.where(Food.category == category)
             result = await session.execute(query)
             foods = result.scalars().all()
             if not foods:
@@ -71,44 +78,49 @@ class FoodService:
     #     except Exception as e:
     #         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to fetch foods: {str(e)}")
         
-    async def get_foods_categories(self, request: FoodsRequest, token: TokenValidation) -> List[dict]:
+    async def get_foods_categories(self, catalog: CatalogStore) -> List[dict]:
         """
-        Получение списка категорий из API СБИСа с cost = null
+        Список категорий (позиции с cost = null) из снимка каталога СБИС
         """
         try:
-            foods = await SBIService.get_foods(request, token)
-            if not foods.get('nomenclatures'):
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No foods found")
-            
-            # Фильтруем товары с cost = null и формируем список категорий
-            filtered_categories = [
-                {
-                    "name": food.get("name"),
-                    "hierarchicalId": food.get("hierarchicalId"),
-                    # "hierarchicalParent":food.get("hierarchicalParent")
-                }
-                for food in foods['nomenclatures']
-                if food.get('cost') is None and food.get("hierarchicalParent") != None  # Проверяем условия
-            ]
-            
-            if not filtered_categories:
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No categories with cost = null found")
-            
-            return filtered_categories
+            snapshot = await catalog.get()
+        except SBISUnavailable as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)},
+            )
         except Exception as e:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to fetch categories: {str(e)}")
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Failed to fetch categories: {str(e)}")
+
+        if not snapshot.items:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No foods found")
+        tree = snapshot.tree
+        filtered_categories = [
+            {
+                "name": category.get("name"),
+                "hierarchicalId": category.get("hierarchicalId"),
+            }
+            for key, category in tree.nodes.items()
+            if tree.parent[key] is not None and category.get("cost") is None and not tree.is_excluded(key)
+        ]
+        if not filtered_categories:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No categories with cost = null found")
+        return filtered_categories
 
     async def get_food_by_id(self, food_id: int, session: AsyncSession) -> Food:
         """
         Получение блюда по ID
         """
         try:
-            query = select(Food).where(Food.id == food_id)
+            query = select(Food).where(Food.id == food_id, Food.isDeleted.is_(False))
             result = await session.execute(query)
             food = result.scalar_one_or_none()
             if not food:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Food not found")
             return food
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to fetch food by ID: {str(e)}")
 
@@ -117,12 +129,14 @@ class FoodService:
         Получение блюда по имени
         """
         try:
-            query = select(Food).where(Food.foodName == name)
+            query = select(Food).where(Food.foodName == name, Food.isDeleted.is_(False))
             result = await session.execute(query)
             food = result.scalar_one_or_none()
             if not food:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Food not found")
             return food
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to fetch food by name: {str(e)}")
 
@@ -136,6 +150,7 @@ class FoodService:
             if result.rowcount == 0:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Food not found for deletion")
             await session.commit()
+            await menu_cache.invalidate()
             return {"message": "Food deleted successfully"}
         except Exception as e:
             await session.rollback()
@@ -151,6 +166,7 @@ class FoodService:
             if result.rowcount == 0:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Food not found for update")
             await session.commit()
+            await menu_cache.invalidate()
             return {"message": "Food updated successfully"}
         except Exception as e:
             await session.rollback()
@@ -178,9 +194,29 @@ async def add_all_foods(
         await food_service.add_food(food, session)
     return {"message": "All foods added successfully"}
 
+@foodRouter.post("/sync")
+async def sync_foods(
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Синхронизация таблицы food с номенклатурой СБИС
+    """
+    try:
+        return await catalog_sync.sync(session)
+    except Exception as e:
+        await session.rollback()
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to sync foods: {str(e)}")
+
+@foodRouter.get("/sync")
+async def get_last_sync():
+    """
+    Отчёт последней синхронизации
+    """
+    return catalog_sync.last_report
+
 
 
-sbis = SBIService()
+sbis = sbis_service
 @foodRouter.get("/")
 async def get_foods(
     category: Optional[int] = None,
@@ -203,9 +239,7 @@ async def get_foods_categories(
     price_list_id: Optional[int] = None,
     session: AsyncSession = Depends(get_async_session),
 ):
-    token: TokenValidation = await sbis.get_token(AuthorizationData(app_client_id=APP_CLIENT_ID, app_secret=APP_SECRET, app_secret_key=APP_SECRET_KEY))
-    request = FoodsRequest(pointId=2378, priceListId=31)
-    return await food_service.get_foods_categories(request, token)
+    return await food_service.get_foods_categories(category_catalog)
 
 @foodRouter.get("/{id}")
 async def get_food_by_id(
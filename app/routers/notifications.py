@@ -0,0 +1,34 @@
+from dataclasses import asdict
+
+from fastapi import APIRouter, Depends, Query
+
+from services.notifications import TelegramNotifier, get_notifier
+
+notificationsRouter = APIRouter()
+
+
+@notificationsRouter.get("/metrics")
+async def get_metrics(telegram: TelegramNotifier = Depends(get_notifier)):
+    """
+    Глубина очереди, счётчики доставки и задержка от постановки до отправки
+    """
+    return telegram.status()
+
+
+@notificationsRouter.get("/dead")
+async def get_dead_letters(
+    limit: int = Query(50, ge=1, le=1000),
+    telegram: TelegramNotifier = Depends(get_notifier),
+):
+    """
+    Последние недоставленные сообщения
+    """
+    return [asdict(notification) for notification in list(telegram.dead)[-limit:]]
+
+
+@notificationsRouter.post("/dead/retry")
+async def retry_dead_letters(telegram: TelegramNotifier = Depends(get_notifier)):
+    """
+    Повторная отправка недоставленных сообщений
+    """
+    return {"requeued": telegram.retry_dead()}
@@ -1,19 +1,88 @@
+import asyncio
 import os
 import json
-import requests
-from typing import List, Dict, Any
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, insert
-import redis
+from sqlalchemy import DateTime, Integer, Select, cast, func, literal, literal_column, select
 
-from auth.database import get_async_session
-from models.models import Order, User
+from auth.database import async_session_maker, get_async_session
+from config import SALES_TIMEZONE
+from models.models import Order, OrderOutbox, User
 from dto import dto as DTO
+from services.availability import AvailabilityTracker, availability
+from services.idempotency import (
+    IdempotencyInProgress,
+    IdempotencyKeyReused,
+    IdempotencyStore,
+    IdempotencyUnavailable,
+    fingerprint,
+    get_idempotency_store,
+)
+from services.notifications import TelegramNotifier, notifier
+from services.order_events import OrderEventHub, get_order_events
+from services.order_partitions import OrderPartitionManager, get_order_partitions
+from services.order_state import (
+    ACTIVE_STATES,
+    NEW,
+    InvalidTransition,
+    OrderNotFound,
+    change_state,
+)
+from services.order_stream import save_order
+from services.outbox import (
+    TOPIC_ORDER_CREATED,
+    TOPIC_ORDER_EVENT,
+    TOPIC_TELEGRAM,
+    OutboxRelay,
+    insert_order_with_outbox,
+    jsonb,
+    outbox_relay,
+)
+from services.redis_pool import MeteredRedis, redis_client, redis_status
+from services.sales import order_lines
+
+ORDER_COLUMNS = {column.name: column for column in Order.__table__.columns}
+# Поля заказа на доске кухни и в событии о новом заказе
+BOARD_FIELDS = ("id", "number", "state", "items", "total", "isDelivery", "address", "comment", "date", "client")
+
+
+@dataclass
+class OrderFilter:
+    """
+    Фильтры списка и выгрузки заказов (query-параметры)
+    """
+    state: Optional[List[str]] = Query(None)
+    isDelivery: Optional[bool] = None
+    client: Optional[int] = None
+    dateFrom: Optional[datetime] = None
+    dateTo: Optional[datetime] = None
+
+
+def order_time(value: datetime):
+    """
+    Граница по createdAt; время без часового пояса — местное (SALES_TIMEZONE)
+    """
+    if value.tzinfo is not None:
+        return value
+    return func.timezone(SALES_TIMEZONE, cast(value, DateTime()))
+
 
 class OrderService:
-    def __init__(self):
+    def __init__(
+        self,
+        stock: AvailabilityTracker = availability,
+        telegram: TelegramNotifier = notifier,
+        redis: MeteredRedis = redis_client,
+        outbox: OutboxRelay = outbox_relay,
+    ):
+        self.stock = stock
+        self.outbox = outbox
+        self.telegram = telegram
         # Конфигурация Telegram
         self.TELEGRAM_BOT_TOKEN = os.environ.get(
             'BOT_TOKEN', 
@@ -23,12 +92,10 @@ class OrderService:
             'CLIENT_BOT_TOKEN', 
             '6937107637:AAFarU8swL-mp7oLC0sMz44A7-F3q0QuD4Y'
         )
-        # Подключение к Redis
-        self.redis_client = redis.Redis(
-            host=os.environ.get('REDIS_HOST', '127.0.0.1'),
-            port=int(os.environ.get('REDIS_PORT', 6379)),
-            decode_responses=True
-        )
+        self.telegram.register("admin", self.TELEGRAM_BOT_TOKEN)
+        self.telegram.register("client", self.CLIENT_BOT_TOKEN)
+        # Общий асинхронный пул Redis (services.redis_pool)
+        self.redis = redis
 
     def _format_telegram_message(self, order_dto: DTO.Order) -> str:
         """
@@ -56,49 +123,130 @@ class OrderService:
         
         return full_message
 
-    def _send_telegram_message(self, chat_id: int, message: str, token: str):
+    def _send_telegram_message(self, chat_id: int, message: str, bot: str = "client"):
         """
-        Отправка сообщения в Telegram
+        Постановка сообщения в очередь отправки Telegram (не ждёт доставки)
         """
-        try:
-            requests.get(
-                f"https://api.telegram.org/bot{token}/sendMessage",
-                params={
-                    "chat_id": chat_id, 
-                    "text": message
-                }
-            )
-        except Exception as e:
-            print(f"Ошибка отправки в Telegram: {e}")
+        self.telegram.enqueue(chat_id, message, bot=bot)
 
-    async def get_all_orders(self, session: AsyncSession) -> List[Order]:
+    def _orders_query(self, filters: OrderFilter, fields: Optional[List[str]] = None) -> Select:
         """
-        Получение всех заказов из базы данных
+        Выборка заказов с фильтрами и проекцией (id выбирается всегда —
+        он нужен курсору)
         """
+        columns = [ORDER_COLUMNS[name] for name in fields] if fields else list(ORDER_COLUMNS.values())
+        if Order.id not in columns:
+            columns.insert(0, Order.id)
+        query = select(*columns)
+        if filters.state:
+            query = query.where(Order.state.in_(filters.state))
+        if filters.isDelivery is not None:
+            query = query.where(Order.isDelivery == filters.isDelivery)
+        if filters.client is not None:
+            query = query.where(Order.client == filters.client)
+        # Диапазон по createdAt: планировщик читает только секции этих месяцев
+        if filters.dateFrom:
+            query = query.where(Order.createdAt >= order_time(filters.dateFrom))
+        if filters.dateTo:
+            query = query.where(Order.createdAt <= order_time(filters.dateTo))
+        return query
+
+    async def list_orders(
+        self,
+        session: AsyncSession,
+        filters: OrderFilter,
+        fields: Optional[List[str]] = None,
+        cursor: Optional[int] = None,
+        limit: int = 50,
+        descending: bool = True,
+    ) -> Tuple[List[dict], Optional[int]]:
+        """
+        Страница заказов по ключу id: WHERE id < cursor ORDER BY id LIMIT n
+        идёт по первичному ключу и не зависит от глубины, в отличие от OFFSET.
+        Возвращает строки и курсор следующей страницы.
+        """
+        query = self._orders_query(filters, fields)
+        if cursor is not None:
+            query = query.where(Order.id < cursor if descending else Order.id > cursor)
+        query = query.order_by(Order.id.desc() if descending else Order.id.asc()).limit(limit + 1)
+        result = await session.execute(query)
+        rows = [dict(row) for row in result.mappings()]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1]["id"]
+        return rows, next_cursor
+
+    async def export_orders(
+        self,
+        filters: OrderFilter,
+        fields: Optional[List[str]] = None,
+        batch: int = 1000,
+    ) -> AsyncIterator[bytes]:
+        """
+        Все заказы построчно в NDJSON через серверный курсор: в памяти не
+        больше одной пачки. Сессия своя — зависимость FastAPI закрывается
+        до окончания потоковой отдачи.
+        """
+        query = self._orders_query(filters, fields).order_by(Order.id).execution_options(yield_per=batch)
+        async with async_session_maker() as session:
+            result = await session.stream(query)
+            async for partition in result.mappings().partitions():
+                yield "".join(
+                    json.dumps(dict(row), ensure_ascii=False, default=str) + "\n" for row in partition
+                ).encode()
+
+    async def active_orders(self, session: AsyncSession) -> List[dict]:
+        """
+        Незавершённые заказы для доски кухни (по индексу order_state_idx)
+        """
+        query = (
+            select(*(ORDER_COLUMNS[name] for name in BOARD_FIELDS))
+            .where(Order.state.in_(ACTIVE_STATES))
+            .order_by(Order.id)
+        )
+        result = await session.execute(query)
+        return [dict(row) for row in result.mappings()]
+
+    async def board_stream(self, hub: OrderEventHub, heartbeat: float = 15) -> AsyncIterator[str]:
+        """
+        Поток SSE доски кухни: сначала событие snapshot с активными
+        заказами, затем order на каждое изменение. Подписка оформляется
+        до запроса снимка, поэтому изменения между ними не теряются
+        (могут прийти повторно — доска применяет их идемпотентно).
+        """
+        subscriber = hub.subscribe(everything=True)
         try:
-            query = select(Order)
-            result = await session.execute(query)
-            return result.scalars().all()
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
-                detail=str(e)
-            )
+            async with async_session_maker() as session:
+                snapshot = await self.active_orders(session)
+            yield "retry: 3000\n"
+            yield f"event: snapshot\ndata: {json.dumps(snapshot, ensure_ascii=False, default=str)}\n\n"
+            while True:
+                try:
+                    data = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    # Комментарий держит соединение открытым через прокси
+                    yield ": ping\n\n"
+                    continue
+                if data is None:
+                    # Доска не успевала читать; браузер переподключится и получит новый снимок
+                    return
+                yield f"event: order\ndata: {data}\n\n"
+        finally:
+            hub.disconnect(subscriber)
 
     async def save_to_redis(self, data: DTO.Order, session: AsyncSession) -> Dict[str, Any]:
         """
-        Сохранение данных в Redis
+        Сохранение заказа в Redis и публикация события в поток заказов,
+        который читает бот администраторов
         """
         try:
             query = select(User.chatID).where(data.client == User.id)
             result = await session.execute(query)
             chat_id = result.mappings().all()
-            print(chat_id)
-            print(data)
             data.client = chat_id[0]["chatID"]
-            order_id = self.redis_client.incr("order_id")
-            redis_key = f"order:{order_id}"
-            self.redis_client.set(redis_key, json.dumps(data.model_dump()))
+            # Номер, ключ заказа для кнопок бота и запись в потоке — одним скриптом
+            order_id = await save_order(self.redis, data.model_dump())
             return {"status": "success", "order_id": order_id, "chat_id": chat_id}
         # return {"status": "success", "chat_id": chat_id}
         except Exception as e:
@@ -114,28 +262,22 @@ class OrderService:
         session: AsyncSession
     ):
         """
-        Полный процесс создания заказа:
-        1. Сохранение в базу данных
-        2. Отправка в Telegram
-        3. Сохранение в Redis
-        """
-        # try:
-            # 1. Сохранение в базу данных
-        query = insert(Order).values(order_dto.model_dump())
-        result = await session.execute(query)
-        await session.commit()
+        Создание заказа одним запросом к базе: заказ со строками и
+        прибавкой к сводке продаж (services.sales), а побочные эффекты
+        (сообщение клиенту в Telegram, публикация в Redis для бота
+        администраторов) — в order_outbox той же транзакцией.
+        Публикует их OutboxRelay в фоне, ответ не ждёт ни Telegram, ни Redis.
 
-        # 2. Отправка в Telegram
-        telegram_message = self._format_telegram_message(order_dto)
-        
-        # Получаем chat ID администраторов для рассылки
-        admin_query = select(User.chatID).where(User.role == "admin")
-        admin_result = await session.execute(admin_query)
-        admin_chat_ids = os.getenv('ADMIN_CHAT_ID', '').split(' ')
+        Наличие позиций проверяется по карте остатков в памяти: при политике
+        reject заказ отклоняется, при flag — принимается с пометкой.
+        """
+        unavailable = self.stock.check(order_dto.items or []) if self.stock.policy != "off" else []
+        if unavailable and self.stock.policy == "reject":
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={"message": "Some items are not available", "items": unavailable},
+            )
 
-        # for admin_chat_id in admin_chat_ids:
-        #     self._send_telegram_message(admin_chat_id, telegram_message, self.TELEGRAM_BOT_TOKEN)
-        
         text_for_send = (
             f"Спасибо за заказ!\n\n"
             f"Ваш заказ №{order_dto.number} принят и находится в обработке.\n"
@@ -152,27 +294,34 @@ class OrderService:
             f"💮🍜 "
         )
 
-        self._send_telegram_message(chatID, text_for_send, self.CLIENT_BOT_TOKEN)
-        # 3. Сохранение в Redis
-        await self.save_to_redis(order_dto, session)
-
-        return {"status": "success", "order_number": order_dto.number}
+        # Состояние задаёт только машина состояний, не клиент
+        order = {**order_dto.model_dump(), "state": NEW}
+        # Бот администраторов отвечает клиенту по chatID, а не по id пользователя
+        client_chat = select(User.chatID).where(User.id == order_dto.client).scalar_subquery()
+        query = insert_order_with_outbox(order, [
+            (TOPIC_TELEGRAM, jsonb({"chatId": chatID, "text": text_for_send, "bot": "client"})),
+            (TOPIC_ORDER_CREATED, jsonb(order).op("||")(func.jsonb_build_object(
+                literal_column("'client'"), client_chat, literal_column("'userId'"), literal(order_dto.client, Integer),
+            ))),
+            (TOPIC_ORDER_EVENT, jsonb({name: order[name] for name in BOARD_FIELDS if name != "id"})),
+        ], order_lines(order_dto.items))
+        await session.execute(query)
+        await session.commit()
+        self.outbox.wake()
 
-        # except Exception as e:
-        #     await session.rollback()
-        #     raise HTTPException(
-        #         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
-        #         detail=str(e)
-        #     )
+        response = {"status": "success", "order_number": order_dto.number}
+        if unavailable:
+            response["unavailable"] = unavailable
+        return response
 
 
-    def redis_health_check(self) -> Dict[str, str]:
+    async def redis_health_check(self) -> Dict[str, Any]:
         """
-        Проверка работоспособности Redis
+        Проверка работоспособности Redis и состояние пула соединений
         """
         try:
-            self.redis_client.ping()
-            return {"status": "ok", "message": "Redis is working"}
+            await self.redis.ping()
+            return {"status": "ok", "message": "Redis is working", **redis_status(self.redis)}
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE, 
@@ -183,28 +332,11 @@ class OrderService:
         Отправка сообщения в Telegram
         """
         try:
-            self._send_telegram_message(client, message, self.CLIENT_BOT_TOKEN)
+            self._send_telegram_message(client, message)
             return {"status": "success"}
         except Exception as e:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
-class OrderWebsocketManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
-
-manager = OrderWebsocketManager()
-
-
 # Создаем сервис
 order_service = OrderService()
 
@@ -215,21 +347,132 @@ orderRouter = APIRouter()
 async def create_order(
     order: DTO.Order, 
     chatID: int,
-    session: AsyncSession = Depends(get_async_session)
+    session: AsyncSession = Depends(get_async_session),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    idempotency: IdempotencyStore = Depends(get_idempotency_store),
 ):
     """
-    Создание заказа с сохранением в БД, отправкой в Telegram и Redis
+    Создание заказа с сохранением в БД, отправкой в Telegram и Redis.
+
+    С заголовком Idempotency-Key повтор запроса возвращает первый ответ
+    (с заголовком Idempotent-Replayed: true) и не создаёт новый заказ;
+    если Redis недоступен — 503 с Retry-After, заказ не создаётся.
     """
-    return await order_service.create_order(order, chatID, session)
+    if not idempotency_key:
+        return await order_service.create_order(order, chatID, session)
+
+    async def handler():
+        try:
+            return status.HTTP_200_OK, await order_service.create_order(order, chatID, session)
+        except HTTPException as e:
+            if e.status_code >= 500:
+                raise
+            # Отказ (например, 409 по остаткам) тоже ответ: повтор получит его же
+            return e.status_code, {"detail": e.detail}
+
+    try:
+        stored = await idempotency.run(
+            "order", idempotency_key, fingerprint(order.model_dump(), chatID), handler
+        )
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except IdempotencyInProgress as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except IdempotencyUnavailable as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    headers = {"Idempotent-Replayed": "true"} if stored.replayed else None
+    return JSONResponse(stored.body, status_code=stored.status_code, headers=headers)
+
+def parse_fields(fields: Optional[str] = Query(None, description="Колонки через запятую, например id,number,state")) -> Optional[List[str]]:
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in ORDER_COLUMNS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"message": "Unknown fields", "fields": unknown, "allowed": list(ORDER_COLUMNS)},
+        )
+    return names
 
 @orderRouter.get("/")
 async def get_orders(
+    request: Request,
+    response: Response,
+    filters: OrderFilter = Depends(),
+    fields: Optional[List[str]] = Depends(parse_fields),
+    cursor: Optional[int] = Query(None, description="X-Next-Cursor предыдущей страницы"),
+    limit: int = Query(50, ge=1, le=500),
+    order: Literal["asc", "desc"] = "desc",
     session: AsyncSession = Depends(get_async_session)
 ):
     """
-    Получение всех заказов из базы данных
+    Заказы постранично, по умолчанию новые первыми. Курсор следующей
+    страницы — в заголовках X-Next-Cursor и Link (rel="next"); на
+    последней странице их нет.
     """
-    return await order_service.get_all_orders(session)
+    rows, next_cursor = await order_service.list_orders(
+        session, filters, fields, cursor=cursor, limit=limit, descending=order == "desc"
+    )
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    return rows
+
+@orderRouter.get("/export")
+async def export_orders(
+    filters: OrderFilter = Depends(),
+    fields: Optional[List[str]] = Depends(parse_fields),
+):
+    """
+    Выгрузка заказов в NDJSON (одна строка JSON на заказ) потоком
+    """
+    return StreamingResponse(
+        order_service.export_orders(filters, fields),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="orders.ndjson"'},
+    )
+
+@orderRouter.patch("/{order_id}/state")
+async def change_order_state(
+    order_id: int,
+    change: DTO.OrderStateChange,
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Перевод заказа в следующее состояние:
+    new → accepted → cooking → ready → delivered, отказ (declined) — из new или accepted
+    """
+    extra = {"reason": change.reason} if change.reason else {}
+    try:
+        return await change_state(session, order_id, change.state, **extra)
+    except OrderNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except InvalidTransition as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": str(e), "current": e.current, "allowed": e.allowed},
+        )
+
+@orderRouter.get("/board")
+async def kitchen_board(hub: OrderEventHub = Depends(get_order_events)):
+    """
+    Доска кухни (Server-Sent Events): snapshot с активными заказами,
+    затем order на каждое изменение во всех воркерах
+    """
+    return StreamingResponse(
+        order_service.board_stream(hub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @orderRouter.post("/redis")
 async def save_to_redis(data: DTO.Order, session: AsyncSession = Depends(get_async_session)):
@@ -243,42 +486,50 @@ async def redis_health():
     """
     Проверка работоспособности Redis
     """
-    return order_service.redis_health_check()
+    return await order_service.redis_health_check()
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    async def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
-            print(connection)
+@orderRouter.get("/outbox")
+async def outbox_status(session: AsyncSession = Depends(get_async_session)):
+    """
+    Состояние публикации событий заказов: очередь в order_outbox, строки с исчерпанными попытками (deadAt) и метрики
+    """
+    pending, dead = (await session.execute(select(
+        func.count().filter(OrderOutbox.deadAt.is_(None)),
+        func.count().filter(OrderOutbox.deadAt.is_not(None)),
+    ).select_from(OrderOutbox))).one()
+    return {**order_service.outbox.status(), "pending": pending, "deadRows": dead}
 
+@orderRouter.get("/partitions")
+async def partitions_status(partitions: OrderPartitionManager = Depends(get_order_partitions)):
+    """
+    Месячные секции order и состояние их обслуживания и архивации
+    """
+    return {**partitions.status(), "partitions": await partitions.partitions()}
 
-manager = ConnectionManager()
 @orderRouter.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.disconnect(websocket)
-    # try:
-    #     while True:
-    #         global currentPayment
-    #         currentPayment = {}
-    #         data = await websocket.receive_text()
-    #         print(data)
-    #         await manager.broadcast(f'[{data},'.join(json.dumps(currentPayment)) + ']')
-    #         print(currentPayment)
-            
-    # except WebSocketDisconnect:
-    #     await manager.disconnect(websocket)
+async def order_updates(
+    websocket: WebSocket,
+    client: Optional[int] = None,
+    order: List[int] = Query([]),
+    hub: OrderEventHub = Depends(get_order_events),
+):
+    """
+    Изменения заказов: ?client=<id пользователя> — все его заказы,
+    ?order=<id> (можно несколько) — конкретные заказы
+    """
+    if client is None and not order:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="client or order is required")
+        return
+    await websocket.accept()
+    subscriber = hub.connect(websocket, client, order)
+    try:
+        while True:
+            # Клиент ничего не присылает; чтение нужно, чтобы заметить закрытие
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.disconnect(subscriber)
 
 
 @orderRouter.post("/send-message")
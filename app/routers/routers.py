@@ -11,6 +11,8 @@ from routers.promocode import promoRouter
 from routers.sbis import sbisRouter
 from routers.cart import router as cartRouter
 from routers.favorites import router as favoritesRouter
+from routers.notifications import notificationsRouter
+from routers.sales import salesRouter
 
 from yookassa import Configuration, Payment
 import uuid
@@ -40,4 +42,6 @@ router.include_router(payment_router, prefix='/payments', tags=["Оплата"])
 router.include_router(promoRouter, prefix='/promocode', tags=["Промокоды"])
 router.include_router(sbisRouter, prefix='/sbis', tags=["SBIS"])
 router.include_router(cartRouter, prefix="/cart", tags=["Корзина"])
-router.include_router(favoritesRouter, prefix="/favorites", tags=["Избранное"])
\ No newline at end of file
+router.include_router(favoritesRouter, prefix="/favorites", tags=["Избранное"])
+router.include_router(notificationsRouter, prefix="/notifications", tags=["Уведомления"])
+router.include_router(salesRouter, prefix="/sales", tags=["Продажи"])
\ No newline at end of file
@@ -0,0 +1,39 @@
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth.database import get_async_session
+from services import sales
+
+salesRouter = APIRouter()
+
+
+def sales_period(dateFrom: Optional[date] = None, dateTo: Optional[date] = None):
+    if dateFrom is not None and dateTo is not None and dateFrom > dateTo:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="dateFrom is after dateTo")
+    return dateFrom, dateTo
+
+
+@salesRouter.get("/top")
+async def top_sellers(
+    period: tuple = Depends(sales_period),
+    limit: int = Query(10, ge=1, le=100),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Самые продаваемые блюда за период (по умолчанию — последние 30 дней)
+    """
+    return await sales.top_sellers(session, *period, limit=limit)
+
+
+@salesRouter.get("/revenue")
+async def revenue(
+    period: tuple = Depends(sales_period),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Выручка и число проданных позиций по дням за период
+    """
+    return await sales.revenue(session, *period)
@@ -1,174 +1,164 @@
 import base64
 import re
-import requests
 from pydantic import AnyUrl, BaseModel
-from dotenv import load_dotenv
-import os
 import asyncio
-from datetime import datetime
 from fastapi import APIRouter
 import logging
-from typing import Union
 logging.basicConfig(level=logging.INFO)
 from fastapi import UploadFile, Request, HTTPException
-import os
 import json
 from typing import Optional
-from fastapi import APIRouter, Query, Depends
-import requests
-import base64
-import json
-import asyncio
+from fastapi import APIRouter, Query, Depends, Path, Response
+from fastapi.responses import FileResponse
+from config import CATALOG_ROOT_CATEGORY
+from services.catalog import (
+    CatalogSnapshot,
+    CatalogStore,
+    get_category_catalog,
+    get_product_catalog,
+)
+from services.availability import AvailabilityTracker, get_availability
+from services.images import FORMATS, image_cache
+from services.sbis_resolver import SBISResolver, get_sbis_resolver
+from services.sbis import (
+    AuthorizationData,
+    FoodsRequest,
+    SBIService,
+    SBISError,
+    SBISUnavailable,
+    TokenValidation,
+    get_sbis_service,
+    sbis_service,
+)
 sbisRouter = APIRouter()
 
 
 IMAGE_DIR = "/images"
 
-load_dotenv()
-APP_CLIENT_ID = os.getenv("APP_CLIENT_ID")
-APP_SECRET = os.getenv("APP_SECRET")
-APP_SECRET_KEY = os.getenv("APP_SECRET_KEY")
-
-class TokenValidation(BaseModel):
-    access_token: str
-    sid: str
-    token: str
-    
-class AuthorizationData(BaseModel):
-    app_client_id: str
-    app_secret: str
-    app_secret_key: str
-    
-
-class FoodsRequest(BaseModel):
-    pointId: int
-    priceListId: int
-    withBalance: Union[bool, None] = True
-    withBarcode: Union[bool, None] = True
-    onlyPublished: Union[bool, None] = True
-    pageSize: Union[str, None] = '2000'
-    noStopList: Union[bool, None] = True
-    
-class SBIService():
-    @staticmethod
-    async def get_token(data: AuthorizationData) -> TokenValidation:
-        url = 'https://online.sbis.ru/oauth/service/'
-        json={"app_client_id": f'{data.app_client_id}',"app_secret": f"{data.app_secret}","secret_key": f"{data.app_secret_key}"}
-        url = 'https://online.sbis.ru/oauth/service/'    
-        response = requests.post(url, json=json)
-        response.encoding = 'utf-8'
-        return TokenValidation(**response.json())
-
-    @staticmethod
-    async def get_point_id(token: TokenValidation) -> dict:
-        parameters = {
-        'withPhones': 'true',
-        'withPrices': 'true'
-        }
-        url = 'https://api.sbis.ru/retail/point/list?'  
-        headers = {
-        "X-SBISAccessToken": f"{token.access_token}"
-        }  
-        response = requests.get(url, params=parameters, headers=headers)
-        return response.json()
-
-    @staticmethod
-    async def get_price_lists(token: TokenValidation, point_id: int) -> dict:
-        parameters = {
-        'pointId': point_id,
-        'actualDate': f'{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}'
-        }
-        url = 'https://api.sbis.ru/retail/nomenclature/price-list?'  
-        headers = {
-        "X-SBISAccessToken": f"{token.access_token}"
-        }  
-        response = requests.get(url, params=parameters, headers=headers)
-        return response.json()
-    
-    @staticmethod
-    async def get_foods(request: FoodsRequest, token: TokenValidation) -> dict:
-        parameters = request.model_dump()
-        url = 'https://api.sbis.ru/retail/nomenclature/list?'
-        headers = {
-                "X-SBISAccessToken": f"{token.access_token}"
-        }
-        response = requests.get(url, params = parameters, headers = headers)
-        return response.json()
-    @staticmethod
-    async def get_image(token, image, name):
-        url = f"https://api.sbis.ru/retail/img"
-        headers = {
-            "Content-Type": "application/json; charset=utf-8",
-            "Accept": "image/*",
-            "X-SBISAccessToken": f"{token.access_token}"
-        }
-        replaced = image.replace("/img?params=", "")
-        params = {
-            "params": replaced
-        }
-        response = requests.get(url, params=params, headers=headers)
-
-        if response.status_code == 200:
-            try:
-                from PIL import Image
-                from io import BytesIO
-
-                image_data = BytesIO(response.content)
-                img = Image.open(image_data)
-                img.save(f"images/{name}.png")
-                return f"Image saved as {name}.png"
-            except Exception as e:
-                return f"Failed to process image: {str(e)}"
-        else:
-            return f"Error while reading response: {response.status_code}, {response.text}"
-  
-sbis = SBIService()
+sbis = sbis_service
+token_manager = sbis.token_manager
 
 @sbisRouter.post('/register')
-async def register():
-    token: TokenValidation = await sbis.get_token(AuthorizationData(app_client_id=APP_CLIENT_ID, app_secret=APP_SECRET, app_secret_key=APP_SECRET_KEY))
-    poinID: dict = await sbis.get_point_id(token)
-    menu: dict = await sbis.get_price_lists(token, poinID['salesPoints'][0]['id'])
+async def register(resolver: SBISResolver = Depends(get_sbis_resolver)):
+    try:
+        poinID: dict = await resolver.points()
+        await resolver.price_list("products")
+    except SBISUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except SBISError as e:
+        raise HTTPException(status_code=502, detail=str(e))
     return poinID
 
-@sbisRouter.get("/categories1")
-async def get_categories():
-    token: TokenValidation = await sbis.get_token(AuthorizationData(app_client_id=APP_CLIENT_ID, app_secret=APP_SECRET, app_secret_key=APP_SECRET_KEY))
-    poinID: dict = await sbis.get_point_id(token)
-    menu: dict = await sbis.get_price_lists(token, poinID['salesPoints'][0]['id'])
-    foods: list = await sbis.get_foods(FoodsRequest(pointId=poinID['salesPoints'][0]['id'], priceListId=menu["priceLists"][1]["id"]), token)
+async def get_snapshot(catalog: CatalogStore) -> CatalogSnapshot:
+    """
+    Снимок каталога; если его ещё нет, а СБИС недоступен — 503
+    """
+    try:
+        return await catalog.get()
+    except SBISUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"SBIS catalog unavailable: {e}")
+
+def catalog_headers(catalog: CatalogStore, snapshot: CatalogSnapshot) -> dict:
+    """
+    Версия и возраст снимка; при сбоях обновления ответ помечается как устаревший
+    """
+    headers = {
+        "X-Catalog-Version": str(snapshot.version),
+        "X-Catalog-Age": f"{snapshot.age:.0f}",
+    }
+    if catalog.is_stale:
+        headers["X-Catalog-Stale"] = "1"
+        headers["Warning"] = '110 - "Response is Stale"'
+    return headers
+
+def catalog_response(catalog: CatalogStore, snapshot: CatalogSnapshot, key, value) -> Response:
+    """
+    Готовый JSON из снимка каталога
+    """
+    return Response(
+        content=snapshot.render(key, value),
+        media_type="application/json",
+        headers=catalog_headers(catalog, snapshot),
+    )
 
-    return  foods
+@sbisRouter.get("/catalog")
+async def get_catalog_status(
+    products: CatalogStore = Depends(get_product_catalog),
+    categories: CatalogStore = Depends(get_category_catalog),
+):
+    """
+    Версия и возраст снимков каталога СБИС
+    """
+    return [products.status(), categories.status()]
+
+@sbisRouter.get("/health")
+async def get_sbis_health(
+    sbis: SBIService = Depends(get_sbis_service),
+    resolver: SBISResolver = Depends(get_sbis_resolver),
+    products: CatalogStore = Depends(get_product_catalog),
+    categories: CatalogStore = Depends(get_category_catalog),
+    stock: AvailabilityTracker = Depends(get_availability),
+):
+    """
+    Состояние интеграции со СБИС: предохранитель, кэши, снимки каталога и остатки
+    """
+    return {
+        "breaker": sbis.breaker.status(),
+        "resolver": resolver.status(),
+        "catalogs": [products.status(), categories.status()],
+        "availability": stock.status(),
+    }
+
+@sbisRouter.post("/resolver/reset")
+async def reset_resolver(resolver: SBISResolver = Depends(get_sbis_resolver)):
+    """
+    Сброс кэша точки продаж и прайс-листов
+    """
+    resolver.invalidate()
+    return resolver.status()
+
+@sbisRouter.get("/categories1")
+async def get_categories(catalog: CatalogStore = Depends(get_category_catalog)):
+    snapshot = await get_snapshot(catalog)
+    return catalog_response(catalog, snapshot, "nomenclatures", {"nomenclatures": snapshot.items})
 
 @sbisRouter.get("/categories")
-async def get_categories():
-    token: TokenValidation = await sbis.get_token(
-        AuthorizationData(
-            app_client_id=APP_CLIENT_ID,
-            app_secret=APP_SECRET,
-            app_secret_key=APP_SECRET_KEY
-        )
+async def get_categories(catalog: CatalogStore = Depends(get_category_catalog)):
+    snapshot = await get_snapshot(catalog)
+    # Всё, что лежит прямо в корневой папке меню (2110): подкатегории и
+    # товары с ценой, как и раньше. Только категории — /sbis/category-tree
+    return catalog_response(
+        catalog, snapshot, ("parent", CATALOG_ROOT_CATEGORY),
+        snapshot.by_parent.get(CATALOG_ROOT_CATEGORY, []),
     )
-    
-    # Получаем список точек продаж и прайс-листов
-    poinID: dict = await sbis.get_point_id(token)
-    menu: dict = await sbis.get_price_lists(token, poinID['salesPoints'][0]['id'])
-    
-    # Получаем список продуктов
-    foods: dict = await sbis.get_foods(
-        FoodsRequest(
-            pointId=poinID['salesPoints'][0]['id'],
-            priceListId=menu["priceLists"][1]["id"]
-        ),
-        token
-    )
-    
-    # Фильтруем только те товары, у которых hierarchicalParent равен None
-    categories = [
-        item for item in foods["nomenclatures"] if item.get("hierarchicalParent") == 2110
-    ]
-    
-    return categories
+
+@sbisRouter.get("/category-tree")
+async def get_category_tree(
+    root: Optional[int] = Query(None, description="Корень поддерева, по умолчанию — папка меню"),
+    catalog: CatalogStore = Depends(get_product_catalog),
+):
+    """
+    Вложенное дерево категорий с количеством товаров в каждом поддереве
+    """
+    snapshot = await get_snapshot(catalog)
+    root = CATALOG_ROOT_CATEGORY if root is None else root
+    if root not in snapshot.tree.nodes or snapshot.tree.is_excluded(root):
+        raise HTTPException(status_code=404, detail="Category not found")
+    return catalog_response(catalog, snapshot, ("tree", root), snapshot.tree.nested(root))
+
+@sbisRouter.get("/category/{category_id}/breadcrumbs")
+async def get_category_breadcrumbs(category_id: int, response: Response, catalog: CatalogStore = Depends(get_product_catalog)):
+    """
+    Путь от корня до категории
+    """
+    snapshot = await get_snapshot(catalog)
+    response.headers.update(catalog_headers(catalog, snapshot))
+    breadcrumbs = snapshot.tree.breadcrumbs(category_id)
+    if breadcrumbs is None:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return breadcrumbs
 
 
 
@@ -287,141 +277,114 @@ async def get_categories():
 #     return filtered_results
 
 
-# Предполагается, что у вас есть уже настроенные зависимости для токена и моделе
-
 @sbisRouter.get("/sbis-products")
 async def get_sbis_products(
-    categoryId: Optional[int] = Query(None, description="ID категории для фильтрации товаров"),
+    categoryId: Optional[int] = Query(None, description="ID категории для фильтрации товаров (включая вложенные)"),
+    catalog: CatalogStore = Depends(get_product_catalog),
 ):
-    token: TokenValidation = await sbis.get_token(
-        AuthorizationData(
-            app_client_id=APP_CLIENT_ID,
-            app_secret=APP_SECRET,
-            app_secret_key=APP_SECRET_KEY
-        )
-    )
-
-    # Получаем список точек продаж и прайс-листов
-    point_id_data: dict = await sbis.get_point_id(token)
-    point_id = point_id_data['salesPoints'][0]['id']
-    menu: dict = await sbis.get_price_lists(token, point_id)
-
-    # Получаем список продуктов
-    foods: dict = await sbis.get_foods(
-        FoodsRequest(
-            pointId=point_id,
-            priceListId=menu["priceLists"][3]["id"],
-            withBalance=True,
-            withBarcode=False,
-            onlyPublished=False,
-        ),
-        token
-    )
-
-    def decode_base64_param(encoded_param: str):
-        """Декодирует параметр base64 и извлекает PhotoURL"""
-        decoded_bytes = base64.b64decode(encoded_param)
-        decoded_str = decoded_bytes.decode('utf-8')
-        decoded_json = json.loads(decoded_str)
-        return decoded_json.get('PhotoURL')
-
-    async def process_product(item):
-        # Проверяем, есть ли изображения у продукта
-        if 'images' in item and item['images']:
-            encoded_param = item['images'][0].split('?params=')[-1]
-            photo_url = decode_base64_param(encoded_param)
-
-            if photo_url:  # Если изображение успешно декодировано
-                return {
-                    "id": item["id"],
-                    "name": item["name"],
-                    "status": "Image available",
-                    "image": photo_url,
-                    "price": item["cost"],
-                    "description": item.get("description_simple"),
-                    "category": item["hierarchicalParent"],
-                }
-        return None  # Пропускаем товары без изображений
-
-    # Фильтруем товары: исключаем категорию 2382 (электронные сигареты)
-    filtered_items = [
-        item for item in foods["nomenclatures"] 
-        if (categoryId is None or item.get("hierarchicalParent") == categoryId)
-        and item.get("hierarchicalParent") != 2382  # Исключаем категорию 2382
-    ]
-
-    # Асинхронно обрабатываем товары
-    tasks = [process_product(item) for item in filtered_items]
-    processed_items = await asyncio.gather(*tasks)
-
-    # Исключаем None (товары без изображений)
-    processed_items = [item for item in processed_items if item is not None]
-
-    return processed_items
-
-
+    snapshot = await get_snapshot(catalog)
+    if categoryId is None:
+        return catalog_response(catalog, snapshot, "products", snapshot.products)
+    # Товары поддерева посчитаны при сборке снимка, исключённые категории туда не попадают
+    products = snapshot.tree.products.get(categoryId)
+    if products is None:
+        return catalog_response(catalog, snapshot, "empty", [])
+    return catalog_response(catalog, snapshot, ("products", categoryId), products)
+
+
+@sbisRouter.get("/search")
+async def search_products(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=100, description="Поисковый запрос"),
+    categoryId: Optional[int] = Query(None, description="Искать только в категории (включая вложенные)"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    catalog: CatalogStore = Depends(get_product_catalog),
+):
+    """
+    Поиск товаров по названию и описанию с учётом опечаток
+    """
+    snapshot = await get_snapshot(catalog)
+    response.headers.update(catalog_headers(catalog, snapshot))
+    found = snapshot.search.search(q)
+    if categoryId is not None:
+        paths = snapshot.tree.paths
+        found = [product for product in found if categoryId in paths.get(product["category"], ())]
+    return {
+        "total": len(found),
+        "limit": limit,
+        "offset": offset,
+        "items": found[offset:offset + limit],
+    }
+
+
+@sbisRouter.get("/suggest")
+async def suggest_products(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=20),
+    catalog: CatalogStore = Depends(get_product_catalog),
+):
+    """
+    Подсказки названий товаров по мере ввода
+    """
+    snapshot = await get_snapshot(catalog)
+    response.headers.update(catalog_headers(catalog, snapshot))
+    return snapshot.search.suggest(q, limit)
 
 
 @sbisRouter.get("/sbis-product/{product_id}")
-async def get_product_by_id(product_id: int):
-    token: TokenValidation = await sbis.get_token(
-        AuthorizationData(
-            app_client_id=APP_CLIENT_ID,
-            app_secret=APP_SECRET,
-            app_secret_key=APP_SECRET_KEY
-        )
-    )
-
-    # Получаем список точек продаж и прайс-листов
-    poinID: dict = await sbis.get_point_id(token)
-    menu: dict = await sbis.get_price_lists(token, poinID['salesPoints'][0]['id'])
-
-    # Получаем список продуктов
-    foods: dict = await sbis.get_foods(
-        FoodsRequest(
-            pointId=poinID['salesPoints'][0]['id'],
-            priceListId=menu["priceLists"][3]["id"],
-            withBalance=True,
-            withBarcode=False,
-            onlyPublished=False,
-        ),
-        token
-    )
-
-    def decode_base64_param(encoded_param: str):
-        decoded_bytes = base64.b64decode(encoded_param)
-        decoded_str = decoded_bytes.decode('utf-8')
-        
-        # Парсим JSON строку
-        decoded_json = json.loads(decoded_str)
-        return decoded_json.get('PhotoURL')
+async def get_product_by_id(product_id: int, response: Response, catalog: CatalogStore = Depends(get_product_catalog)):
+    snapshot = await get_snapshot(catalog)
+    response.headers.update(catalog_headers(catalog, snapshot))
 
-    # Ищем товар с заданным id
-    product = next((item for item in foods['nomenclatures'] if item['id'] == product_id), None)
-    
+    product = snapshot.products_by_id.get(product_id)
     if product:
-        # Проверяем, есть ли изображения у продукта
-        if 'images' in product and product['images']:
-            image_url = product['images'][0]
-            # Извлекаем параметр из URL
-            encoded_param = image_url.split('?params=')[-1]  # Извлекаем часть после ?params=
-            photo_url = decode_base64_param(encoded_param)  # Декодируем base64 и извлекаем PhotoURL
-        else:
-            photo_url = None
-
-        # Возвращаем информацию о товаре
-        return {
-            "id": product["id"],
-            "name": product["name"],
-            "status": "Image available",
-            "image": photo_url,
-            "price": product["cost"],
-            "description": product.get("description_simple"),
-            "category": product["hierarchicalParent"],
-        }
+        return product
     else:
         # Если товар не найден
         return {
             "status": "Product not found",
             "id": product_id
         }
+
+
+@sbisRouter.get("/image/{key}")
+async def get_image(
+    request: Request,
+    key: str = Path(..., pattern="^[0-9a-f]{40}$"),
+    w: Optional[int] = Query(None, ge=1, description="Желаемая ширина превью"),
+    format: Optional[str] = Query(None, pattern="^(webp|jpeg)$"),
+    catalog: CatalogStore = Depends(get_product_catalog),
+):
+    """
+    Картинка товара из локального кэша (скачивается из СБИС один раз)
+    """
+    width = image_cache.pick_width(w)
+    fmt = format or ("webp" if "image/webp" in request.headers.get("accept", "") else "jpeg")
+    headers = {
+        "ETag": f'"{key}-{width}-{fmt}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if format is None:
+        headers["Vary"] = "Accept"
+    snapshot = catalog.snapshot
+    source = snapshot.images.get(key) if snapshot is not None else None
+    if source is None and not image_cache.contains(key):
+        raise HTTPException(status_code=404, detail="Image not found")
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        path = await image_cache.get(key, source, width, fmt)
+    except SBISUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except SBISError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, media_type=FORMATS[fmt], headers=headers)
+
+@sbisRouter.get("/images/status")
+async def get_image_cache_status():
+    return image_cache.status()
@@ -5,7 +5,7 @@ from sqlalchemy import delete, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from auth.database import get_async_session
-from models.models import Order, User, Food
+from models.models import Order, OrderItem, OrderOutbox, User, Food
 
 userRouter = APIRouter()
 
@@ -53,7 +53,11 @@ class UserCRUD:
     
     @staticmethod
     async def delete_user_order(id: str, session: AsyncSession):
-        query = delete(Order).where(Order.client == id)
+        # У order_item и order_outbox нет внешнего ключа на секционированную
+        # order, поэтому их строки удаляются тем же запросом
+        orders = delete(Order).where(Order.client == id).returning(Order.id).cte("deleted_orders")
+        items = delete(OrderItem).where(OrderItem.orderId.in_(select(orders.c.id))).cte("deleted_items")
+        query = delete(OrderOutbox).where(OrderOutbox.orderId.in_(select(orders.c.id))).add_cte(items)
         await session.execute(query)
         await session.commit()
 
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from config import AVAILABILITY_POLL_INTERVAL, ORDER_STOCK_POLICY
+from services.catalog import CatalogSnapshot, CatalogStore, product_catalog
+from services.sbis_resolver import SBISResolver, sbis_resolver
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("flag", "reject", "off")
+
+
+class AvailabilityTracker:
+    """
+    Наличие товаров СБИС в памяти.
+
+    Карта остатков заполняется из каждого снимка каталога (он
+    выгружается с withBalance и noStopList) и между снимками уточняется
+    коротким опросом одного /nomenclature/balances. Отдельного метода
+    для стоп-листа у API нет, поэтому он берётся как разница между всем
+    прайс-листом и снимком: id прайс-листа выгружаются один раз на
+    каждый новый снимок, а не на каждый опрос, — номенклатура грузится
+    с частотой обновления каталога. Проверка заказа идёт только по
+    памяти и не обращается к СБИС.
+
+    id, которых нет в прайс-листе СБИС (старые корзины с id из таблицы
+    food), считаются неизвестными и не проверяются.
+    """
+
+    def __init__(
+        self,
+        catalog: CatalogStore = product_catalog,
+        resolver: SBISResolver = sbis_resolver,
+        interval: float = AVAILABILITY_POLL_INTERVAL,
+        policy: str = ORDER_STOCK_POLICY,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"ORDER_STOCK_POLICY must be one of {POLICIES}, got {policy!r}")
+        self.catalog = catalog
+        self.resolver = resolver
+        self.interval = interval
+        self.policy = policy
+        self._balances: Dict[int, Optional[float]] = {}
+        # Все товары прайс-листа, включая стоп-лист, и сам стоп-лист
+        self._known: Set[int] = set()
+        self._stopped: Set[int] = set()
+        self._seeded = False
+        self._task: Optional[asyncio.Task] = None
+        self._stop_list_task: Optional[asyncio.Task] = None
+        self.updated_at: Optional[float] = None
+        self.stop_list_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.polls = 0
+
+    def seed(self, snapshot: CatalogSnapshot):
+        """
+        Полная замена карты из нового снимка каталога
+        """
+        self._balances = {
+            item["id"]: item.get("balance")
+            for item in snapshot.items
+            if item.get("cost") is not None
+        }
+        # Снимок выгружается с noStopList: всё, что в нём есть, продаётся
+        selling = set(self._balances)
+        self._known.update(selling)
+        self._stopped.difference_update(selling)
+        self._seeded = True
+        self.updated_at = time.time()
+        if self.policy != "off":
+            if self._stop_list_task is not None:
+                self._stop_list_task.cancel()
+            self._stop_list_task = asyncio.get_running_loop().create_task(self._refresh_stop_list(selling))
+
+    async def _product_ids(self, **flags) -> Set[int]:
+        request = await self.resolver.foods_request(
+            "products", withBalance=False, withBarcode=False, onlyPublished=False, **flags
+        )
+        ids = set()
+        async for page in self.resolver.sbis.iter_foods(request):
+            ids.update(item["id"] for item in page if item.get("cost") is not None)
+        return ids
+
+    async def _refresh_stop_list(self, selling: Set[int]):
+        """
+        Стоп-лист к новому снимку: товары прайс-листа, которых нет в снимке
+        """
+        try:
+            listed = await self._product_ids(noStopList=False)
+        except Exception as e:
+            self.last_error = str(e) or repr(e)
+            logger.warning("SBIS stop list refresh failed: %s", e)
+            return
+        self._known = listed | set(self._balances)
+        self._stopped = listed - selling
+        self.stop_list_at = time.time()
+
+    async def poll(self):
+        price_list = await self.resolver.price_list("products")
+        balances = await self.resolver.sbis.get_balances(price_list["id"])
+        current = self._balances
+        for nomenclature, balance in balances.items():
+            if nomenclature in current:
+                current[nomenclature] = balance
+        self._seeded = True
+        self.polls += 1
+        self.last_error = None
+        self.updated_at = time.time()
+
+    def balance(self, nomenclature: int) -> Optional[float]:
+        return self._balances.get(nomenclature)
+
+    def check(self, items: Iterable[dict]) -> List[dict]:
+        """
+        Позиции заказа, которых нет в наличии; пустой список, если всё есть.
+        reason: stop_list — в стоп-листе, out_of_stock — не хватает остатка,
+        not_available — товар прайс-листа, который сейчас не продаётся
+        """
+        if not self._seeded:
+            return []
+        balances = self._balances
+        problems = []
+        for item in items:
+            nomenclature = item.get("id")
+            if not isinstance(nomenclature, int):
+                continue
+            count = item.get("count") or 1
+            if nomenclature in self._stopped:
+                problems.append({"id": nomenclature, "foodName": item.get("foodName"), "reason": "stop_list"})
+                continue
+            if nomenclature not in balances:
+                if nomenclature in self._known:
+                    problems.append({"id": nomenclature, "foodName": item.get("foodName"), "reason": "not_available"})
+                continue
+            balance = balances[nomenclature]
+            # Остаток не ведётся (блюда собственного производства) — не ограничиваем
+            if balance is not None and balance < count:
+                problems.append({
+                    "id": nomenclature,
+                    "foodName": item.get("foodName"),
+                    "reason": "out_of_stock",
+                    "requested": count,
+                    "available": max(balance, 0),
+                })
+        return problems
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                self.last_error = str(e) or repr(e)
+                logger.warning("SBIS availability poll failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.policy == "off":
+            return
+        self.catalog.subscribe(self.seed)
+        if self.catalog.snapshot is not None:
+            self.seed(self.catalog.snapshot)
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._stop_list_task is not None:
+            self._stop_list_task.cancel()
+            self._stop_list_task = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        return {
+            "policy": self.policy,
+            "tracked": len(self._balances),
+            "stopped": len(self._stopped),
+            "updatedAt": self.updated_at,
+            "stopListAt": self.stop_list_at,
+            "polls": self.polls,
+            "lastError": self.last_error,
+        }
+
+
+availability = AvailabilityTracker()
+
+
+def get_availability() -> AvailabilityTracker:
+    return availability
@@ -0,0 +1,299 @@
+import asyncio
+import base64
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from config import (
+    CATALOG_EXCLUDED_CATEGORIES,
+    PUBLIC_BASE_URL,
+    SBIS_CATALOG_REFRESH_INTERVAL,
+    SBIS_CATALOG_RETRY_INTERVAL,
+)
+from services.category_tree import CategoryTree
+from services.images import image_key
+from services.search import SearchIndex
+from services.sbis_resolver import SBISResolver, sbis_resolver
+
+logger = logging.getLogger(__name__)
+
+# Поддеревья, скрытые из витрины (по умолчанию — электронные сигареты, 2382)
+EXCLUDED_CATEGORIES = frozenset(CATALOG_EXCLUDED_CATEGORIES)
+
+
+def decode_photo_url(image_url: str) -> Optional[str]:
+    """
+    Декодирует параметр base64 из ссылки СБИС и извлекает PhotoURL
+    """
+    try:
+        encoded_param = image_url.split('?params=')[-1]
+        decoded_json = json.loads(base64.b64decode(encoded_param).decode('utf-8'))
+        return decoded_json.get('PhotoURL')
+    except (ValueError, AttributeError):
+        return None
+
+
+def image_url(key: str) -> str:
+    """
+    Ссылка на картинку через локальный прокси /sbis/image
+    """
+    return f"{PUBLIC_BASE_URL}/sbis/image/{key}"
+
+
+def format_product(item: dict) -> dict:
+    images = item.get('images')
+    photo_url = decode_photo_url(images[0]) if images else None
+    return {
+        "id": item["id"],
+        "name": item["name"],
+        "status": "Image available",
+        # Клиенты грузят картинку через наш кэш, а не напрямую из СБИС
+        "image": image_url(image_key(images[0])) if photo_url else None,
+        "imageOriginal": photo_url,
+        "price": item.get("cost"),
+        "description": item.get("description_simple"),
+        "category": item.get("hierarchicalParent"),
+    }
+
+
+@dataclass
+class CatalogSnapshot:
+    """
+    Неизменяемый после сборки срез номенклатуры СБИС с индексами
+    """
+    version: int
+    built_at: float
+    items: List[dict]
+    by_id: Dict[int, dict]
+    by_parent: Dict[Optional[int], List[dict]]
+    products_by_id: Dict[int, dict]
+    products: List[dict]
+    images: Dict[str, str]
+    tree: CategoryTree
+    search: SearchIndex
+    _rendered: Dict[Any, bytes] = field(default_factory=dict, repr=False)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.built_at
+
+    def render(self, key: Any, value: Any) -> bytes:
+        """
+        JSON-ответ, сериализованный один раз на версию снимка
+        """
+        body = self._rendered.get(key)
+        if body is None:
+            body = json.dumps(value, ensure_ascii=False).encode('utf-8')
+            self._rendered[key] = body
+        return body
+
+
+class SnapshotBuilder:
+    """
+    Инкрементальная сборка снимка: страницы номенклатуры индексируются
+    по мере поступления, не дожидаясь конца выгрузки
+    """
+
+    def __init__(self, excluded: frozenset = EXCLUDED_CATEGORIES):
+        self.excluded = excluded
+        self.items: List[dict] = []
+        self.by_id: Dict[int, dict] = {}
+        self.by_parent: Dict[Optional[int], List[dict]] = {}
+        self.products_by_id: Dict[int, dict] = {}
+        self.images: Dict[str, str] = {}
+
+    def add(self, nomenclatures: List[dict]):
+        self.items.extend(nomenclatures)
+        for item in nomenclatures:
+            parent = item.get("hierarchicalParent")
+            self.by_id[item["id"]] = item
+            self.by_parent.setdefault(parent, []).append(item)
+
+            product = format_product(item)
+            self.products_by_id[item["id"]] = product
+            if product["image"]:
+                self.images[image_key(item["images"][0])] = item["images"][0]
+
+    def build(self, version: int) -> CatalogSnapshot:
+        # В витрину попадают только товары с картинкой; исключённые поддеревья
+        # известны только после загрузки всех страниц
+        with_image = [product for product in self.products_by_id.values() if product["image"]]
+        tree = CategoryTree(self.items, with_image, self.excluded)
+        products = [product for product in with_image if not tree.is_excluded(product["category"])]
+        return CatalogSnapshot(
+            version=version,
+            built_at=time.time(),
+            items=self.items,
+            by_id=self.by_id,
+            by_parent=self.by_parent,
+            products_by_id=self.products_by_id,
+            products=products,
+            images=self.images,
+            tree=tree,
+            search=SearchIndex(products),
+        )
+
+
+def build_snapshot(nomenclatures: List[dict], version: int) -> CatalogSnapshot:
+    builder = SnapshotBuilder()
+    builder.add(nomenclatures)
+    return builder.build(version)
+
+
+class CatalogStore:
+    """
+    Фоновое обновление снимка каталога.
+
+    Эндпоинты читают `snapshot` из памяти; новый снимок собирается
+    целиком и подменяется одним присваиванием, поэтому читатели никогда
+    не видят частично обновлённые данные.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        load: Callable[[], AsyncIterator[List[dict]]],
+        interval: float = SBIS_CATALOG_REFRESH_INTERVAL,
+        retry_interval: float = SBIS_CATALOG_RETRY_INTERVAL,
+    ):
+        self.name = name
+        self._load = load
+        self._interval = interval
+        self._retry_interval = min(retry_interval, interval)
+        self.last_error: Optional[str] = None
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._version = 0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[CatalogSnapshot], None]] = []
+
+    def subscribe(self, listener: Callable[[CatalogSnapshot], None]):
+        """
+        Вызывается после каждой подмены снимка
+        """
+        self._listeners.append(listener)
+
+    @property
+    def snapshot(self) -> Optional[CatalogSnapshot]:
+        return self._snapshot
+
+    @property
+    def is_stale(self) -> bool:
+        """
+        Снимок устарел: последнее обновление не удалось или давно не было
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return False
+        return self.last_error is not None or snapshot.age > 2 * self._interval
+
+    async def get(self) -> CatalogSnapshot:
+        """
+        Текущий снимок; до первой загрузки дожидается её
+        """
+        if self._snapshot is not None:
+            return self._snapshot
+        return await asyncio.shield(self._start_refresh())
+
+    async def refresh(self) -> CatalogSnapshot:
+        return await asyncio.shield(self._start_refresh())
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh())
+            self._refresh_task.add_done_callback(self._on_refresh_done)
+        return self._refresh_task
+
+    async def _refresh(self) -> CatalogSnapshot:
+        started = time.monotonic()
+        builder = SnapshotBuilder()
+        async for page in self._load():
+            builder.add(page)
+        snapshot = builder.build(self._version + 1)
+        self._version = snapshot.version
+        self._snapshot = snapshot
+        self.last_error = None
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.warning("Catalog %s listener failed: %s", self.name, e)
+        logger.info(
+            "Catalog %s v%s: %s items in %.3fs",
+            self.name, snapshot.version, len(snapshot.items), time.monotonic() - started,
+        )
+        return snapshot
+
+    def _on_refresh_done(self, task: asyncio.Task):
+        self._refresh_task = None
+        if not task.cancelled() and task.exception() is not None:
+            self.last_error = str(task.exception()) or repr(task.exception())
+            logger.warning("Catalog %s refresh failed: %s", self.name, task.exception())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+                delay = self._interval
+            except Exception:
+                # Ошибка уже залогирована: отдаём прошлый снимок и пробуем раньше обычного
+                delay = self._retry_interval
+            await asyncio.sleep(delay)
+
+    def start(self):
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+
+    def status(self) -> dict:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"name": self.name, "version": None, "age": None, "items": 0, "lastError": self.last_error}
+        return {
+            "name": self.name,
+            "stale": self.is_stale,
+            "lastError": self.last_error,
+            "version": snapshot.version,
+            "builtAt": snapshot.built_at,
+            "age": round(snapshot.age, 3),
+            "items": len(snapshot.items),
+            "products": len(snapshot.products),
+        }
+
+
+async def _load_nomenclatures(resolver: SBISResolver, role: str, **flags) -> AsyncIterator[List[dict]]:
+    # Точка и прайс-лист берутся из кэша резолвера, к СБИС идёт только выгрузка номенклатуры
+    request = await resolver.foods_request(role, **flags)
+    async for page in resolver.sbis.iter_foods(request):
+        yield page
+
+
+def load_products(resolver: SBISResolver = sbis_resolver) -> AsyncIterator[List[dict]]:
+    return _load_nomenclatures(resolver, "products", withBalance=True, withBarcode=False, onlyPublished=False)
+
+
+def load_categories(resolver: SBISResolver = sbis_resolver) -> AsyncIterator[List[dict]]:
+    return _load_nomenclatures(resolver, "categories")
+
+
+# Снимки для витрины товаров и для списка категорий (разные прайс-листы)
+product_catalog = CatalogStore("products", load_products)
+category_catalog = CatalogStore("categories", load_categories)
+
+
+def get_product_catalog() -> CatalogStore:
+    return product_catalog
+
+
+def get_category_catalog() -> CatalogStore:
+    return category_catalog
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth.database import async_session_maker
+from config import FOOD_SYNC_BATCH_SIZE, FOOD_SYNC_INTERVAL
+from models.models import Food
+from services.catalog import CatalogSnapshot, CatalogStore, product_catalog
+from services.menu import menu_cache
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_advisory_xact_lock: синхронизацию выполняет только один воркер
+SYNC_LOCK_KEY = 20250401
+
+# category (локальная категория) синхронизация не трогает: родитель в
+# иерархии СБИС — другое пространство id, он хранится в externalCategory
+SYNC_COLUMNS = ("foodName", "price", "description", "image", "externalCategory", "externalImage")
+
+
+def food_row(product: dict) -> dict:
+    """
+    Строка таблицы food из товара снимка каталога. image — ссылка через
+    прокси /sbis/image, исходная ссылка СБИС сохраняется в externalImage
+    """
+    price = product.get("price")
+    return {
+        "externalId": product["id"],
+        "foodName": product.get("name"),
+        "price": int(round(price)) if price is not None else None,
+        "description": product.get("description"),
+        "image": product.get("image"),
+        "externalCategory": product.get("category"),
+        "externalImage": product.get("imageOriginal"),
+        "isDeleted": False,
+    }
+
+
+def name_key(name: Optional[str]) -> Optional[str]:
+    return " ".join(name.split()).casefold() if name else None
+
+
+def _chunks(rows: List, size: int):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+class CatalogSyncService:
+    """
+    Инкрементальная синхронизация номенклатуры СБИС с таблицей food.
+
+    Строки сравниваются по externalId (id номенклатуры СБИС), в базу
+    пишутся только изменившиеся: одним INSERT ... ON CONFLICT DO UPDATE
+    на пачку. Пропавшие из СБИС блюда помечаются isDeleted. Весь прогон
+    выполняется в одной транзакции.
+
+    Блюда, заведённые до синхронизации (POST /food, externalId пустой),
+    не дублируются: новый товар СБИС сначала занимает такую строку с тем
+    же названием, сохраняя её id, на который ссылаются категории и заказы.
+    """
+
+    def __init__(self, catalog: CatalogStore = product_catalog, batch_size: int = FOOD_SYNC_BATCH_SIZE):
+        self.catalog = catalog
+        self.batch_size = batch_size
+        self.last_report: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def sync(self, session: AsyncSession) -> dict:
+        started = time.monotonic()
+        snapshot: CatalogSnapshot = await self.catalog.get()
+        fetched = time.monotonic()
+
+        locked = await session.scalar(select(func.pg_try_advisory_xact_lock(SYNC_LOCK_KEY)))
+        if not locked:
+            return {"status": "skipped", "reason": "sync already running"}
+
+        result = await session.execute(
+            select(Food.externalId, Food.isDeleted, *(getattr(Food, c) for c in SYNC_COLUMNS))
+            .where(Food.externalId.isnot(None))
+        )
+        existing: Dict[int, dict] = {row.externalId: row._asdict() for row in result}
+        result = await session.execute(
+            select(Food.id, Food.foodName)
+            .where(Food.externalId.is_(None), Food.isDeleted.is_(False))
+            .order_by(Food.id)
+        )
+        unclaimed: Dict[str, int] = {}
+        for row in result:
+            key = name_key(row.foodName)
+            if key:
+                unclaimed.setdefault(key, row.id)
+        loaded = time.monotonic()
+
+        desired = [
+            food_row(product)
+            for product in snapshot.products_by_id.values()
+            if product.get("price") is not None and not snapshot.tree.is_excluded(product.get("category"))
+        ]
+        seen = {row["externalId"] for row in desired}
+        inserted = []
+        claimed = []
+        for row in desired:
+            if row["externalId"] in existing:
+                continue
+            food_id = unclaimed.pop(name_key(row["foodName"]), None)
+            if food_id is None:
+                inserted.append(row)
+            else:
+                claimed.append({"id": food_id, **row})
+        updated = [
+            row for row in desired
+            if row["externalId"] in existing and existing[row["externalId"]] != row
+        ]
+        deleted = [
+            external_id for external_id, row in existing.items()
+            if external_id not in seen and not row["isDeleted"]
+        ]
+        diffed = time.monotonic()
+
+        # Занятые строки обновляются по первичному ключу до вставки новых
+        for batch in _chunks(claimed, self.batch_size):
+            await session.execute(update(Food), batch)
+        changed = inserted + updated
+        for batch in _chunks(changed, self.batch_size):
+            stmt = insert(Food).values(batch)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Food.externalId],
+                set_={c: stmt.excluded[c] for c in SYNC_COLUMNS + ("isDeleted",)},
+            )
+            await session.execute(stmt)
+        for batch in _chunks(deleted, self.batch_size):
+            await session.execute(
+                update(Food).where(Food.externalId.in_(batch)).values(isDeleted=True)
+            )
+        await session.commit()
+        if changed or claimed or deleted:
+            await menu_cache.invalidate()
+        finished = time.monotonic()
+
+        report = {
+            "status": "success",
+            "catalogVersion": snapshot.version,
+            "total": len(desired),
+            "inserted": len(inserted),
+            "claimed": len(claimed),
+            "updated": len(updated),
+            "deleted": len(deleted),
+            "unchanged": len(desired) - len(changed) - len(claimed),
+            "timings": {
+                "catalog": round(fetched - started, 4),
+                "load": round(loaded - fetched, 4),
+                "diff": round(diffed - loaded, 4),
+                "write": round(finished - diffed, 4),
+                "total": round(finished - started, 4),
+            },
+        }
+        self.last_report = report
+        logger.info("Food sync: %s", report)
+        return report
+
+    async def _run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with async_session_maker() as session:
+                    await self.sync(session)
+            except Exception as e:
+                logger.warning("Food sync failed: %s", e)
+
+    def start(self, interval: float = FOOD_SYNC_INTERVAL):
+        """
+        Периодическая синхронизация; interval <= 0 — только по запросу
+        """
+        if interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+catalog_sync = CatalogSyncService()
@@ -0,0 +1,110 @@
+import logging
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def node_id(item: dict) -> Optional[int]:
+    """
+    Узел дерева СБИС: hierarchicalId, у старых записей его может не быть
+    """
+    value = item.get("hierarchicalId")
+    return value if value is not None else item.get("id")
+
+
+class CategoryTree:
+    """
+    Дерево категорий номенклатуры СБИС по hierarchicalId/hierarchicalParent.
+
+    Собирается один раз на снимок каталога: дети, путь от корня и товары
+    всего поддерева каждой категории лежат в словарях, поэтому запросы
+    к дереву не требуют обхода номенклатуры. Поддеревья `excluded`
+    целиком скрыты из витрины.
+    """
+
+    def __init__(self, items: List[dict], products: Iterable[dict], excluded: Iterable[int] = ()):
+        parents = {item.get("hierarchicalParent") for item in items}
+        # Категория — папка без цены или любая позиция, у которой есть вложенные
+        self.nodes: Dict[int, dict] = {}
+        for item in items:
+            key = node_id(item)
+            if key is not None and (item.get("cost") is None or key in parents):
+                self.nodes[key] = item
+        self.parent: Dict[int, Optional[int]] = {
+            key: item.get("hierarchicalParent") for key, item in self.nodes.items()
+        }
+        self.children: Dict[Optional[int], List[dict]] = {}
+        for key, item in self.nodes.items():
+            self.children.setdefault(self.parent[key], []).append(item)
+
+        self.paths: Dict[int, List[int]] = {}
+        for key in self.nodes:
+            self.paths[key] = self._path(key)
+        self.excluded: FrozenSet[int] = frozenset(
+            key for key, path in self.paths.items() if any(p in excluded for p in path)
+        ) | frozenset(excluded)
+
+        # Товары поддерева: каждый товар добавляется ко всем предкам своей категории
+        self.products: Dict[int, List[dict]] = {}
+        for product in products:
+            category = product.get("category")
+            if category is None or category in self.excluded:
+                continue
+            for ancestor in self.paths.get(category, [category]):
+                self.products.setdefault(ancestor, []).append(product)
+
+    def _path(self, key: int) -> List[int]:
+        path = []
+        seen = set()
+        current: Optional[int] = key
+        while current is not None and current not in seen:
+            seen.add(current)
+            path.append(current)
+            current = self.parent.get(current)
+        if current is not None:
+            logger.warning("SBIS category %s has a cycle in hierarchicalParent", key)
+        path.reverse()
+        return path
+
+    def is_excluded(self, category: Optional[int]) -> bool:
+        return category in self.excluded
+
+    def child_categories(self, category: Optional[int]) -> List[dict]:
+        return [
+            item for item in self.children.get(category, [])
+            if node_id(item) not in self.excluded
+        ]
+
+    def subtree_products(self, category: int) -> List[dict]:
+        return self.products.get(category, [])
+
+    def breadcrumbs(self, category: int) -> Optional[List[dict]]:
+        """
+        Путь от корня дерева до категории; None, если категории нет
+        """
+        if category not in self.nodes or category in self.excluded:
+            return None
+        return [
+            {"id": key, "name": self.nodes[key].get("name")}
+            for key in self.paths[category] if key in self.nodes
+        ]
+
+    def nested(self, root: Optional[int] = None) -> List[dict]:
+        """
+        Вложенное представление поддерева для /sbis/category-tree
+        """
+        def build(category: Optional[int], seen: FrozenSet[int]) -> List[dict]:
+            result = []
+            for item in self.child_categories(category):
+                key = node_id(item)
+                if key in seen:
+                    continue
+                result.append({
+                    "id": key,
+                    "name": item.get("name"),
+                    "productCount": len(self.products.get(key, [])),
+                    "children": build(key, seen | {key}),
+                })
+            return result
+
+        return build(root, frozenset() if root is None else frozenset({root}))
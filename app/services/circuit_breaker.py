@@ -0,0 +1,113 @@
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Вызов отклонён: предохранитель разомкнут
+    """
+
+
+class CircuitBreaker:
+    """
+    Предохранитель по доле неудачных и медленных вызовов.
+
+    В замкнутом состоянии ведёт скользящее окно последних `window`
+    вызовов; при доле ошибок не меньше `failure_rate` (медленный вызов
+    тоже считается ошибкой) размыкается на `open_seconds`. Затем
+    пропускает не более `half_open_calls` пробных вызовов: если все они
+    успешны, предохранитель замыкается, любая ошибка размыкает его снова.
+    На каждый before_call() приходится ровно один record() или release().
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 5.0,
+        open_seconds: float = 30.0,
+        half_open_calls: int = 2,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self.rejected = 0
+
+    def before_call(self):
+        """
+        Проверка перед вызовом; бросает CircuitOpenError, если вызывать нельзя
+        """
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            self.state = HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_calls:
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name} circuit is half-open, probe limit reached")
+            self._probes += 1
+
+    def record(self, success: bool, duration: float):
+        failed = not success or duration > self.slow_call_seconds
+        if self.state == HALF_OPEN:
+            if failed:
+                self._open()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_calls:
+                self.state = CLOSED
+                self._outcomes.clear()
+            return
+        if self.state == OPEN:
+            return
+        self._outcomes.append(failed)
+        if len(self._outcomes) >= self.min_calls:
+            if sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+                self._open()
+
+    def release(self):
+        """
+        Вызов не завершился (например, отменён): исход не учитывается,
+        слот пробного вызова освобождается
+        """
+        if self.state == HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    @property
+    def retry_after(self) -> int:
+        if self.state != OPEN:
+            return 0
+        return max(int(self.open_seconds - (time.monotonic() - self._opened_at)), 1)
+
+    def status(self) -> dict:
+        calls = len(self._outcomes)
+        return {
+            "name": self.name,
+            "state": self.state,
+            "failureRate": round(sum(self._outcomes) / calls, 3) if calls else 0.0,
+            "calls": calls,
+            "rejected": self.rejected,
+            "retryAfter": self.retry_after,
+        }
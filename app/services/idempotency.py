@@ -0,0 +1,235 @@
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Tuple
+
+from redis.exceptions import RedisError
+
+from config import IDEMPOTENCY_LOCK_TTL, IDEMPOTENCY_TTL, IDEMPOTENCY_WAIT
+from services.redis_pool import MeteredRedis, redis_client
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+DONE = "done"
+
+# Через сколько секунд повторить запрос, если Redis недоступен
+UNAVAILABLE_RETRY_AFTER = 5
+
+# Продление ключа, только пока он занят этим же исполнителем
+EXTEND_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class IdempotencyError(Exception):
+    pass
+
+
+class IdempotencyKeyReused(IdempotencyError):
+    """
+    Ключ уже использован с другим телом запроса
+    """
+
+
+class IdempotencyInProgress(IdempotencyError):
+    """
+    Запрос с этим ключом ещё выполняется и не успел завершиться
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__("request with this Idempotency-Key is still in progress")
+        self.retry_after = retry_after
+
+
+class IdempotencyUnavailable(IdempotencyError):
+    """
+    Redis недоступен: занять ключ нельзя, а выполнять запрос без гарантии
+    нельзя тоже — повтор клиента создал бы второй заказ
+    """
+
+    def __init__(self, retry_after: int = UNAVAILABLE_RETRY_AFTER):
+        super().__init__("Idempotency-Key storage is unavailable, retry later")
+        self.retry_after = retry_after
+
+
+class StoredResponse(NamedTuple):
+    status_code: int
+    body: Any
+    replayed: bool
+
+
+def fingerprint(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Ответы на запросы с Idempotency-Key в Redis.
+
+    Первый запрос занимает ключ через SET NX с коротким TTL и выполняется;
+    его ответ (код и тело, которые возвращает обработчик) сохраняется на
+    IDEMPOTENCY_TTL. Повторы получают сохранённый ответ, не выполняя
+    обработчик. Одновременные дубликаты ждут завершения первого: в этом
+    процессе — на событии, между процессами — опросом ключа. Пока
+    обработчик выполняется, ключ продлевается каждые lock_ttl / 3; если
+    исполнитель упал, ключ освобождается по истечении
+    IDEMPOTENCY_LOCK_TTL. Ответ после выполненного обработчика (заказ
+    уже в базе) записывается с повторами, пока ключ ещё занят, — иначе
+    повтор запроса выполнился бы второй раз. Ошибки 5xx и исключения не
+    сохраняются, чтобы клиент мог повторить запрос. Если Redis не
+    отвечает, пока ключ не занят, запрос не выполняется —
+    IdempotencyUnavailable.
+    """
+
+    def __init__(
+        self,
+        redis: MeteredRedis = redis_client,
+        prefix: str = "idempotency:",
+        ttl: int = IDEMPOTENCY_TTL,
+        lock_ttl: int = IDEMPOTENCY_LOCK_TTL,
+        wait: float = IDEMPOTENCY_WAIT,
+    ):
+        self.redis = redis
+        self.prefix = prefix
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait = wait
+        self._inflight: Dict[str, asyncio.Event] = {}
+        self.metrics = {
+            "executed": 0, "replayed": 0, "waited": 0, "conflicts": 0,
+            "extended": 0, "saveRetries": 0, "unsaved": 0, "unavailable": 0,
+        }
+
+    async def run(
+        self,
+        scope: str,
+        key: str,
+        request_fingerprint: str,
+        handler: Callable[[], Awaitable[Tuple[int, Any]]],
+    ) -> StoredResponse:
+        redis_key = f"{self.prefix}{scope}:{key}"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait
+        delay = 0.05
+        waited = False
+        while True:
+            pending = json.dumps({"state": PENDING, "fingerprint": request_fingerprint, "owner": uuid.uuid4().hex})
+            try:
+                claimed = await self.redis.set(redis_key, pending, nx=True, ex=self.lock_ttl)
+                raw = None if claimed else await self.redis.get(redis_key)
+            except RedisError as e:
+                raise self._unavailable(redis_key, e)
+            if claimed:
+                return await self._execute(redis_key, pending, request_fingerprint, handler)
+            if raw is None:
+                # Ключ освободился между SET NX и GET — пробуем занять снова
+                continue
+            stored = json.loads(raw)
+            if stored["fingerprint"] != request_fingerprint:
+                self.metrics["conflicts"] += 1
+                raise IdempotencyKeyReused("Idempotency-Key was already used with a different request")
+            if stored["state"] == DONE:
+                self.metrics["replayed"] += 1
+                return StoredResponse(stored["status_code"], stored["body"], True)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                try:
+                    ttl = await self.redis.ttl(redis_key)
+                except RedisError as e:
+                    raise self._unavailable(redis_key, e)
+                raise IdempotencyInProgress(retry_after=max(int(ttl), 1))
+            if not waited:
+                waited = True
+                self.metrics["waited"] += 1
+            event = self._inflight.get(redis_key)
+            try:
+                if event is not None:
+                    await asyncio.wait_for(event.wait(), remaining)
+                else:
+                    await asyncio.sleep(min(delay, remaining))
+                    delay = min(delay * 2, 0.5)
+            except asyncio.TimeoutError:
+                pass
+
+    def _unavailable(self, redis_key: str, error: RedisError) -> IdempotencyUnavailable:
+        self.metrics["unavailable"] += 1
+        logger.warning("Idempotency key %s is not available: %s", redis_key, error)
+        return IdempotencyUnavailable()
+
+    async def _execute(self, redis_key: str, pending: str, request_fingerprint: str, handler) -> StoredResponse:
+        event = self._inflight[redis_key] = asyncio.Event()
+        keep_alive = asyncio.create_task(self._keep_alive(redis_key, pending))
+        try:
+            try:
+                status_code, body = await handler()
+            except BaseException:
+                keep_alive.cancel()
+                await self.redis.delete(redis_key)
+                raise
+            if status_code >= 500:
+                keep_alive.cancel()
+                await self.redis.delete(redis_key)
+            else:
+                record = {"state": DONE, "fingerprint": request_fingerprint, "status_code": status_code, "body": body}
+                await self._save(redis_key, json.dumps(record, ensure_ascii=False, default=str))
+            self.metrics["executed"] += 1
+            return StoredResponse(status_code, body, False)
+        finally:
+            keep_alive.cancel()
+            del self._inflight[redis_key]
+            event.set()
+
+    async def _keep_alive(self, redis_key: str, pending: str):
+        """
+        Продление занятого ключа, пока выполняется обработчик и пишется ответ
+        """
+        extend = self.redis.register_script(EXTEND_LUA)
+        while True:
+            await asyncio.sleep(self.lock_ttl / 3)
+            try:
+                if not await extend(keys=[redis_key], args=[pending, self.lock_ttl]):
+                    logger.warning("Idempotency key %s expired while the request was running", redis_key)
+                    return
+                self.metrics["extended"] += 1
+            except RedisError as e:
+                logger.warning("Idempotency key %s was not extended: %s", redis_key, e)
+
+    async def _save(self, redis_key: str, record: str):
+        """
+        Запись ответа с повторами не дольше lock_ttl; ключ тем временем
+        продлевает _keep_alive. Если Redis так и не ответил, ответ всё
+        равно возвращается клиенту — действие уже выполнено
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_ttl
+        delay = 0.1
+        while True:
+            try:
+                await self.redis.set(redis_key, record, ex=self.ttl)
+                return
+            except RedisError as e:
+                if loop.time() + delay > deadline:
+                    self.metrics["unsaved"] += 1
+                    logger.error("Idempotency response for %s was not saved: %s", redis_key, e)
+                    return
+                self.metrics["saveRetries"] += 1
+                logger.warning("Idempotency response for %s not saved yet: %s", redis_key, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    def status(self) -> dict:
+        return {**self.metrics, "inflight": len(self._inflight)}
+
+
+idempotency_store = IdempotencyStore()
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    return idempotency_store
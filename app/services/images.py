@@ -0,0 +1,292 @@
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, IMAGE_WIDTHS, IMAGE_WORKERS
+from services.sbis import SBIService, sbis_service
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+# mtime каталога ключа — время последнего использования, обновляется не чаще раза в минуту
+TOUCH_INTERVAL = 60
+# Каталоги, использованные за это время, не вытесняются
+EVICT_GRACE = 300
+
+
+def image_key(source: str) -> str:
+    """
+    Адрес картинки в кэше: хеш параметров ссылки СБИС /img?params=...
+    """
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()[:40]
+
+
+def variant_name(width: int, fmt: str) -> str:
+    return f"w{width}.{fmt}"
+
+
+def _render_variants(original: str, out_dir: str, widths: Tuple[int, ...]) -> int:
+    """
+    Нарезка превью (выполняется в пуле процессов, не в event loop)
+    """
+    from PIL import Image
+
+    written = 0
+    with Image.open(original) as img:
+        img.load()
+        for width in widths:
+            resized = img.copy()
+            if resized.width > width:
+                resized.thumbnail((width, resized.height))
+            for fmt in FORMATS:
+                target = os.path.join(out_dir, variant_name(width, fmt))
+                tmp = f"{target}.{os.getpid()}.tmp"
+                if fmt == "jpeg":
+                    frame = resized
+                    if frame.mode in ("RGBA", "LA", "P"):
+                        frame = frame.convert("RGBA")
+                        background = Image.new("RGB", frame.size, (255, 255, 255))
+                        background.paste(frame, mask=frame.split()[-1])
+                        frame = background
+                    elif frame.mode != "RGB":
+                        frame = frame.convert("RGB")
+                    frame.save(tmp, "JPEG", quality=82, optimize=True, progressive=True)
+                else:
+                    resized.save(tmp, "WEBP", quality=80, method=4)
+                os.replace(tmp, target)
+                written += os.path.getsize(target)
+    return written
+
+
+class ImageCache:
+    """
+    Дисковый кэш картинок СБИС с LRU-ограничением по размеру.
+
+    Оригинал скачивается один раз на ключ, превью фиксированных ширин
+    в WebP и JPEG готовятся в пуле процессов. Каталог общий для всех
+    воркеров, поэтому состояние LRU хранится на диске: время
+    использования — mtime каталога ключа (обновляется не чаще
+    TOUCH_INTERVAL), размер считается сканированием. Вытесняет воркер,
+    взявший файловую блокировку, остальные в это время пропускают
+    проверку. Каталоги, использованные за последние EVICT_GRACE секунд,
+    не удаляются: их файл может отдаваться другим воркером.
+    """
+
+    def __init__(
+        self,
+        root: str = IMAGE_CACHE_DIR,
+        max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+        widths: Iterable[int] = IMAGE_WIDTHS,
+        sbis: SBIService = sbis_service,
+        workers: int = IMAGE_WORKERS,
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.widths = tuple(sorted(widths))
+        self.sbis = sbis
+        self._workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._touched: Dict[str, float] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._warm_task: Optional[asyncio.Task] = None
+        # Результат последнего сканирования: число ключей и байт на диске
+        self._entries = 0
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, key: str, name: str) -> str:
+        return os.path.join(self.root, key[:2], key, name)
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self.path(key, "original"))
+
+    def pick_width(self, width: Optional[int]) -> int:
+        if width is None:
+            return self.widths[len(self.widths) // 2]
+        for candidate in self.widths:
+            if candidate >= width:
+                return candidate
+        return self.widths[-1]
+
+    async def get(self, key: str, source: Optional[str], width: int, fmt: str) -> Optional[str]:
+        """
+        Путь к готовому варианту; None, если картинка неизвестна
+        """
+        target = self.path(key, variant_name(width, fmt))
+        if os.path.exists(target):
+            # Файл мог подготовить и другой воркер
+            self.hits += 1
+            self._touch(key)
+            return target
+        if source is None:
+            return None
+        self.misses += 1
+        await self._ensure(key, source)
+        return target if os.path.exists(target) else None
+
+    def _touch(self, key: str):
+        now = time.monotonic()
+        if now - self._touched.get(key, -TOUCH_INTERVAL) < TOUCH_INTERVAL:
+            return
+        if len(self._touched) > 10000:
+            self._touched.clear()
+        self._touched[key] = now
+        try:
+            os.utime(os.path.dirname(self.path(key, "original")))
+        except FileNotFoundError:
+            pass
+
+    async def _ensure(self, key: str, source: str):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._populate(key, source))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        await asyncio.shield(task)
+
+    async def _populate(self, key: str, source: str):
+        if os.path.exists(self.path(key, variant_name(self.widths[-1], "jpeg"))):
+            self._touch(key)
+            return
+        started = time.monotonic()
+        content = await self.sbis.fetch_image(source)
+        directory = os.path.dirname(self.path(key, "original"))
+        original = self.path(key, "original")
+        await asyncio.to_thread(self._write, directory, original, content)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._get_pool(), _render_variants, original, directory, self.widths)
+        logger.info("Image %s cached in %.3fs", key, time.monotonic() - started)
+        await asyncio.to_thread(self._enforce)
+
+    @staticmethod
+    def _write(directory: str, path: str, content: bytes):
+        os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _dir_size(directory: str) -> int:
+        try:
+            return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+        except FileNotFoundError:
+            return 0
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        """
+        Ключи на диске: (mtime каталога, ключ, размер), от давно не использованных
+        """
+        entries = []
+        if os.path.isdir(self.root):
+            for prefix in os.scandir(self.root):
+                if not prefix.is_dir() or prefix.name.startswith("."):
+                    continue
+                for entry in os.scandir(prefix.path):
+                    if entry.is_dir():
+                        try:
+                            mtime = entry.stat().st_mtime
+                        except FileNotFoundError:
+                            continue
+                        entries.append((mtime, entry.name, self._dir_size(entry.path)))
+        entries.sort()
+        return entries
+
+    def _enforce(self):
+        """
+        Вытеснение по результатам сканирования диска (выполняется в потоке)
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".lock"), "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Кэш сейчас проверяет другой воркер
+                return
+            entries = self._scan()
+            size = sum(entry[2] for entry in entries)
+            count = len(entries)
+            now = time.time()
+            for mtime, key, entry_size in entries:
+                if size <= self.max_bytes or now - mtime < EVICT_GRACE:
+                    break
+                self._remove(key)
+                size -= entry_size
+                count -= 1
+                self.evictions += 1
+            self._entries, self._size = count, size
+
+    def _remove(self, key: str):
+        # Сначала переименование: другие воркеры сразу перестают видеть
+        # ключ и не отдают файлы из наполовину удалённого каталога
+        directory = os.path.dirname(self.path(key, "original"))
+        trash = os.path.join(self.root, f".evicted-{key}-{os.getpid()}")
+        try:
+            os.rename(directory, trash)
+        except FileNotFoundError:
+            return
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self._workers)
+        return self._pool
+
+    def warm(self, sources: Dict[str, str], concurrency: int = 4):
+        """
+        Фоновая подготовка превью для новых картинок каталога
+        """
+        if not sources or (self._warm_task is not None and not self._warm_task.done()):
+            return
+        self._warm_task = asyncio.create_task(self._warm(dict(sources), concurrency))
+
+    async def _warm(self, sources: Dict[str, str], concurrency: int):
+        missing = await asyncio.to_thread(
+            lambda: {key: source for key, source in sources.items() if not self.contains(key)}
+        )
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def warm_one(key: str, source: str):
+            async with semaphore:
+                try:
+                    await self._ensure(key, source)
+                except Exception as e:
+                    logger.warning("Image %s warm-up failed: %s", key, e)
+
+        await asyncio.gather(*(warm_one(key, source) for key, source in missing.items()))
+
+    async def start(self):
+        await asyncio.to_thread(self._enforce)
+
+    async def stop(self):
+        if self._warm_task is not None:
+            self._warm_task.cancel()
+            try:
+                await self._warm_task
+            except asyncio.CancelledError:
+                pass
+            self._warm_task = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def status(self) -> dict:
+        return {
+            "entries": self._entries,
+            "bytes": self._size,
+            "maxBytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+image_cache = ImageCache()
@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import select
+
+from auth.database import async_session_maker
+from config import MENU_STALE_TTL
+from models.models import Category, Food
+from services.redis_pool import MeteredRedis, redis_client
+
+logger = logging.getLogger(__name__)
+
+FOOD_FIELDS = tuple(column.name for column in Food.__table__.columns)
+
+
+class Menu(NamedTuple):
+    body: bytes
+    etag: str
+
+
+class MenuCache:
+    """
+    Меню витрины (категории с блюдами) для GET /category/dis.
+
+    Собирается одним запросом — category LEFT JOIN food ON food.id =
+    ANY(category.food) — и хранится в памяти уже сериализованным вместе
+    с ETag (хеш тела, одинаковый во всех воркерах). Записи в category и
+    food увеличивают счётчик версии в Redis; каждый запрос сверяет с ним
+    свою копию, так что изменение видят все воркеры. Версия читается до
+    запроса к базе, поэтому меню, собранное параллельно с записью, не
+    переживёт её. Если Redis недоступен, последнее собранное меню
+    отдаётся stale_ttl секунд, затем собирается заново — без общей
+    блокировки, чтобы запросы не выстраивались в очередь за сборкой.
+    """
+
+    def __init__(
+        self,
+        redis: MeteredRedis = redis_client,
+        session_maker=async_session_maker,
+        key: str = "menu:version",
+        stale_ttl: float = MENU_STALE_TTL,
+    ):
+        self.redis = redis
+        self.session_maker = session_maker
+        self.key = key
+        self.stale_ttl = stale_ttl
+        self._menu: Optional[Menu] = None
+        self._version: Optional[str] = None
+        # Последнее собранное меню и время сборки — на время недоступности Redis
+        self._last: Optional[Tuple[float, Menu]] = None
+        self._lock = asyncio.Lock()
+        self.metrics = {"hits": 0, "staleHits": 0, "builds": 0, "invalidations": 0}
+
+    async def _current_version(self) -> Optional[str]:
+        try:
+            return await self.redis.get(self.key) or "0"
+        except RedisError as e:
+            # Пока Redis недоступен, записи могли пройти мимо счётчика:
+            # после восстановления копия будет собрана заново
+            self._version = None
+            logger.warning("Menu version unavailable, serving the last menu: %s", e)
+            return None
+
+    async def get(self) -> Menu:
+        version = await self._current_version()
+        if version is None:
+            return await self._get_stale()
+        if self._menu is not None and self._version == version:
+            self.metrics["hits"] += 1
+            return self._menu
+        async with self._lock:
+            # Пока ждали, меню этой версии мог собрать другой запрос
+            if self._menu is not None and self._version == version:
+                self.metrics["hits"] += 1
+                return self._menu
+            menu = await self._build()
+            self._menu, self._version = menu, version
+            return menu
+
+    async def _get_stale(self) -> Menu:
+        if self._last is not None and time.monotonic() - self._last[0] < self.stale_ttl:
+            self.metrics["staleHits"] += 1
+            return self._last[1]
+        return await self._build()
+
+    async def _build(self) -> Menu:
+        query = (
+            select(Category.id.label("categoryId"), Category.categoryName, *Food.__table__.columns)
+            .outerjoin(Food, (Food.id == Category.food.any_()) & Food.isDeleted.is_(False))
+            .order_by(Category.id, Food.id)
+        )
+        async with self.session_maker() as session:
+            result = await session.execute(query)
+            categories: Dict[int, dict] = {}
+            for row in result.mappings():
+                category = categories.get(row["categoryId"])
+                if category is None:
+                    category = categories[row["categoryId"]] = {"categoryName": row["categoryName"], "foods": []}
+                if row["id"] is not None:
+                    category["foods"].append({name: row[name] for name in FOOD_FIELDS})
+        menu: List[dict] = list(categories.values())
+        body = json.dumps(menu, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+        self.metrics["builds"] += 1
+        menu = Menu(body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+        self._last = (time.monotonic(), menu)
+        return menu
+
+    async def invalidate(self):
+        """
+        Вызывается после коммита записи в category или food
+        """
+        self._version = None
+        self._last = None
+        self.metrics["invalidations"] += 1
+        try:
+            await self.redis.incr(self.key)
+        except RedisError as e:
+            logger.warning("Menu version was not bumped: %s", e)
+
+    def status(self) -> dict:
+        return {**self.metrics, "version": self._version, "bytes": len(self._menu.body) if self._menu else 0}
+
+
+menu_cache = MenuCache()
+
+
+def get_menu_cache() -> MenuCache:
+    return menu_cache
@@ -0,0 +1,561 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from config import (
+    BOT_TOKEN,
+    CLIENT_BOT_TOKEN,
+    NOTIFY_DEAD_LETTER_PATH,
+    NOTIFY_DIGEST_MAX,
+    NOTIFY_DIGEST_THRESHOLD,
+    NOTIFY_MAX_ATTEMPTS,
+    NOTIFY_QUEUE_SIZE,
+    NOTIFY_RETRY_BASE,
+    NOTIFY_RETRY_MAX,
+    NOTIFY_WORKERS,
+    TELEGRAM_API_URL,
+    TELEGRAM_CHAT_RATE,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_GROUP_RATE,
+)
+
+logger = logging.getLogger(__name__)
+
+_ids = itertools.count(1)
+
+# Лимиты сообщения Bot API: 4096 символов текста, 100 кнопок клавиатуры
+DIGEST_TEXT_LIMIT = 3800
+DIGEST_BUTTON_ROWS = 50
+
+
+@dataclass
+class Notification:
+    """
+    Сообщение в очереди; бот указывается по имени, токены в очередь не попадают
+    """
+    bot: str
+    chat_id: int
+    text: str
+    reply_markup: Optional[dict] = None
+    id: int = field(default_factory=lambda: next(_ids))
+    created_at: float = field(default_factory=time.time)
+    attempts: int = 0
+    last_error: Optional[str] = None
+    # Можно объединить со соседними в сводку при перегрузке
+    digestible: bool = False
+
+
+class PermanentError(Exception):
+    """
+    Повтор не поможет: чат не найден, бот заблокирован, неверный запрос
+    """
+
+
+class RetryLater(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeliveryFailed(Exception):
+    """
+    Сообщение из send() не отправлено (очередь полна, остановка, ошибка
+    сети, 5xx или 429) — повторять должен вызывающий
+    """
+
+
+class TokenBucket:
+    """
+    Ведро токенов: `rate` отправок в секунду, не больше `capacity` подряд
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self) -> float:
+        """
+        0 — токен списан и можно отправлять, иначе сколько секунд ждать
+        """
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    @property
+    def idle(self) -> float:
+        return time.monotonic() - max(self.updated, self.blocked_until)
+
+
+Lane = Tuple[str, int]
+
+
+class TelegramNotifier:
+    """
+    Асинхронная доставка сообщений в Telegram с учётом лимитов Bot API.
+
+    Обработчики ставят сообщение в очередь и сразу возвращаются.
+    Сообщения раскладываются по дорожкам (бот, чат): внутри дорожки
+    порядок сохраняется, разные чаты отправляются параллельно общим
+    пулом воркеров через один keep-alive клиент. Частоту ограничивают
+    вёдра токенов — общее на бота и отдельное на чат (для групп строже);
+    ответ 429 блокирует чат на retry_after.
+
+    Сетевые ошибки, 5xx и 429 повторяются с экспоненциальной задержкой;
+    после `max_attempts` попыток или при постоянной ошибке сообщение
+    уходит в dead-letter: в память и в JSONL-файл (пишется в отдельном
+    потоке, не в event loop). Если в дорожке
+    накопилось `digest_threshold` сообщений с пометкой digestible
+    (уведомления администраторам), они отправляются одной сводкой.
+
+    send() проходит ту же очередь и лимиты, но ждёт ответа Telegram и
+    внутри не повторяется: временная ошибка возвращается вызывающему
+    (outbox, поток заказов) как DeliveryFailed, чтобы повтор шёл по его
+    расписанию. В сводки такие сообщения объединяются только между собой.
+    """
+
+    def __init__(
+        self,
+        bots: Optional[Dict[str, Optional[str]]] = None,
+        workers: int = NOTIFY_WORKERS,
+        max_attempts: int = NOTIFY_MAX_ATTEMPTS,
+        retry_base: float = NOTIFY_RETRY_BASE,
+        retry_max: float = NOTIFY_RETRY_MAX,
+        queue_size: int = NOTIFY_QUEUE_SIZE,
+        dead_letter_path: Optional[str] = NOTIFY_DEAD_LETTER_PATH,
+        api_url: str = TELEGRAM_API_URL,
+        client: Optional[httpx.AsyncClient] = None,
+        global_rate: float = TELEGRAM_GLOBAL_RATE,
+        chat_rate: float = TELEGRAM_CHAT_RATE,
+        group_rate: float = TELEGRAM_GROUP_RATE,
+        digest_threshold: int = NOTIFY_DIGEST_THRESHOLD,
+        digest_max: int = NOTIFY_DIGEST_MAX,
+    ):
+        self._tokens = {name: token for name, token in (bots or {}).items() if token}
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.queue_size = queue_size
+        self.dead_letter_path = dead_letter_path
+        self.api_url = api_url.rstrip('/')
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.digest_threshold = digest_threshold
+        self.digest_max = digest_max
+        self._client = client
+        self._lanes: Dict[Lane, Deque[Notification]] = {}
+        # Дорожки, которые стоят в _ready, ждут таймера или обрабатываются воркером
+        self._active: Set[Lane] = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._timers: Dict[Lane, asyncio.TimerHandle] = {}
+        self._inflight: Dict[Lane, List[Notification]] = {}
+        # id сообщения из send() → future, которую ждёт вызывающий
+        self._waiters: Dict[int, asyncio.Future] = {}
+        self._pending = 0
+        self._global_buckets: Dict[str, TokenBucket] = {}
+        self._chat_buckets: Dict[Lane, TokenBucket] = {}
+        self._tasks: List[asyncio.Task] = []
+        self.dead: Deque[Notification] = deque(maxlen=1000)
+        self._dead_lines: List[str] = []
+        self._dead_writer: Optional[asyncio.Task] = None
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self.metrics = {
+            "enqueued": 0, "sent": 0, "retried": 0, "failed": 0, "dead": 0, "dropped": 0,
+            "throttled": 0, "rateLimited": 0, "digests": 0, "digested": 0,
+        }
+
+    def register(self, bot: str, token: Optional[str]):
+        if token:
+            self._tokens[bot] = token
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.api_url,
+                limits=httpx.Limits(max_connections=self.workers * 2, max_keepalive_connections=self.workers),
+                timeout=httpx.Timeout(10, connect=5),
+            )
+        return self._client
+
+    def enqueue(
+        self,
+        chat_id: int,
+        text: str,
+        bot: str = "client",
+        reply_markup: Optional[dict] = None,
+        digestible: bool = False,
+    ) -> Notification:
+        """
+        Поставить сообщение в очередь; не ждёт отправки
+        """
+        notification = Notification(
+            bot=bot, chat_id=int(chat_id), text=text, reply_markup=reply_markup, digestible=digestible
+        )
+        self.metrics["enqueued"] += 1
+        self._push(notification)
+        return notification
+
+    async def send(
+        self,
+        chat_id: int,
+        text: str,
+        bot: str = "client",
+        reply_markup: Optional[dict] = None,
+        digestible: bool = False,
+    ) -> Notification:
+        """
+        Отправить и дождаться ответа Telegram. Временная ошибка —
+        DeliveryFailed, постоянная — PermanentError (сообщение в dead-letter)
+        """
+        notification = Notification(
+            bot=bot, chat_id=int(chat_id), text=text, reply_markup=reply_markup, digestible=digestible
+        )
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[notification.id] = waiter
+        self.metrics["enqueued"] += 1
+        self._push(notification)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Вызывающий повторит сам: ещё не отправленное сообщение не нужно
+            self._discard(notification)
+            raise
+        finally:
+            self._waiters.pop(notification.id, None)
+        return notification
+
+    def _discard(self, notification: Notification):
+        queue = self._lanes.get((notification.bot, notification.chat_id))
+        if queue and notification in queue:
+            queue.remove(notification)
+            self._pending -= 1
+
+    def _awaited(self, notification: Notification) -> bool:
+        return notification.id in self._waiters
+
+    def _settle(self, notification: Notification, error: Optional[Exception] = None):
+        waiter = self._waiters.pop(notification.id, None)
+        if waiter is None or waiter.done():
+            return
+        if error is None:
+            waiter.set_result(None)
+        else:
+            waiter.set_exception(error)
+
+    def _push(self, notification: Notification):
+        self.start()
+        if self._pending >= self.queue_size:
+            self.metrics["dropped"] += 1
+            self._dead_letter(notification, "queue is full")
+            return
+        lane = (notification.bot, notification.chat_id)
+        self._lanes.setdefault(lane, deque()).append(notification)
+        self._pending += 1
+        if lane not in self._active:
+            self._active.add(lane)
+            self._ready.put_nowait(lane)
+
+    def _chat_bucket(self, lane: Lane) -> TokenBucket:
+        bucket = self._chat_buckets.get(lane)
+        if bucket is None:
+            # Отрицательные id — группы и каналы, у них лимит строже
+            bucket = TokenBucket(self.group_rate if lane[1] < 0 else self.chat_rate)
+            self._chat_buckets[lane] = bucket
+            if len(self._chat_buckets) > 10000:
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items()
+                    if value.idle < 60 or key in self._active
+                }
+        return bucket
+
+    def _global_bucket(self, bot: str) -> TokenBucket:
+        bucket = self._global_buckets.get(bot)
+        if bucket is None:
+            bucket = TokenBucket(self.global_rate)
+            self._global_buckets[bot] = bucket
+        return bucket
+
+    async def _worker(self):
+        while True:
+            lane = await self._ready.get()
+            try:
+                await self._serve(lane)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Notification lane %s failed unexpectedly", lane)
+                self._reschedule(lane)
+
+    async def _serve(self, lane: Lane):
+        queue = self._lanes.get(lane)
+        if not queue:
+            self._reschedule(lane)
+            return
+        wait = self._chat_bucket(lane).delay()
+        if wait > 0:
+            # Чат ещё не остыл: воркер не ждёт, дорожка вернётся по таймеру
+            self.metrics["throttled"] += 1
+            self._wake_later(lane, wait)
+            return
+        bucket = self._global_bucket(lane[0])
+        wait = bucket.delay()
+        while wait > 0:
+            self.metrics["throttled"] += 1
+            await asyncio.sleep(wait)
+            wait = bucket.delay()
+
+        notification, parts = self._take(queue)
+        self._pending -= len(parts)
+        self._inflight[lane] = parts
+        try:
+            await self._deliver(lane, notification, parts)
+        except asyncio.CancelledError:
+            for part in parts:
+                self._dead_letter(part, "shutdown")
+            raise
+        finally:
+            self._inflight.pop(lane, None)
+        self._reschedule(lane)
+
+    def _take(self, queue: Deque[Notification]) -> Tuple[Notification, List[Notification]]:
+        """
+        Следующее сообщение дорожки; при перегрузке — сводка из нескольких
+        """
+        head = queue.popleft()
+        if not head.digestible or len(queue) + 1 < self.digest_threshold:
+            return head, [head]
+        parts = [head]
+        length = len(head.text)
+        # В сводку не смешиваются ожидаемые send() и поставленные enqueue():
+        # при ошибке первые возвращаются вызывающему, вторые повторяются здесь
+        awaited = self._awaited(head)
+        while (
+            queue and queue[0].digestible and self._awaited(queue[0]) == awaited and len(parts) < self.digest_max
+            and length + len(queue[0].text) < DIGEST_TEXT_LIMIT
+        ):
+            length += len(queue[0].text)
+            parts.append(queue.popleft())
+        if len(parts) == 1:
+            return head, parts
+        rows = [
+            row
+            for part in parts if part.reply_markup
+            for row in part.reply_markup.get("inline_keyboard", [])
+        ]
+        digest = Notification(
+            bot=head.bot,
+            chat_id=head.chat_id,
+            text=f"Сводка: {len(parts)} уведомлений\n\n" + "\n\n— — —\n\n".join(part.text for part in parts),
+            reply_markup={"inline_keyboard": rows[:DIGEST_BUTTON_ROWS]} if rows else None,
+            digestible=True,
+            created_at=head.created_at,
+        )
+        self.metrics["digests"] += 1
+        self.metrics["digested"] += len(parts)
+        return digest, parts
+
+    async def _deliver(self, lane: Lane, notification: Notification, parts: List[Notification]):
+        notification.attempts += 1
+        awaited = any(self._awaited(part) for part in parts)
+        try:
+            await self._send(notification)
+        except PermanentError as e:
+            self._dead_letter(notification, str(e), permanent=True)
+            for part in parts:
+                self._settle(part, PermanentError(str(e)))
+            return
+        except (RetryLater, httpx.HTTPError) as e:
+            notification.last_error = str(e) or repr(e)
+            delay = min(self.retry_base * 2 ** (notification.attempts - 1), self.retry_max)
+            delay = delay * random.uniform(0.5, 1.0)
+            if isinstance(e, RetryLater) and e.retry_after:
+                self.metrics["rateLimited"] += 1
+                delay = max(delay, e.retry_after)
+            if awaited:
+                # Повторяет вызывающий send(); чат всё равно остывает
+                self._chat_bucket(lane).block(delay)
+                for part in parts:
+                    self._dead_letter(part, notification.last_error)
+                return
+            if notification.attempts >= self.max_attempts:
+                self._dead_letter(notification, notification.last_error)
+                return
+            self.metrics["retried"] += 1
+            # Повтор встаёт в начало дорожки, чтобы не нарушить порядок в чате
+            self._chat_bucket(lane).block(delay)
+            self._lanes.setdefault(lane, deque()).appendleft(notification)
+            self._pending += 1
+            return
+        now = time.time()
+        self.metrics["sent"] += len(parts)
+        for part in parts:
+            self._latencies.append(now - part.created_at)
+            self._settle(part)
+
+    def _wake_later(self, lane: Lane, delay: float):
+        self._timers[lane] = asyncio.get_running_loop().call_later(delay, self._wake, lane)
+
+    def _wake(self, lane: Lane):
+        self._timers.pop(lane, None)
+        self._ready.put_nowait(lane)
+
+    def _reschedule(self, lane: Lane):
+        if self._lanes.get(lane):
+            self._ready.put_nowait(lane)
+        else:
+            self._lanes.pop(lane, None)
+            self._active.discard(lane)
+
+    async def _send(self, notification: Notification):
+        token = self._tokens.get(notification.bot)
+        if token is None:
+            raise PermanentError(f"bot '{notification.bot}' is not configured")
+        payload = {"chat_id": notification.chat_id, "text": notification.text}
+        if notification.reply_markup is not None:
+            payload["reply_markup"] = notification.reply_markup
+        response = await self.client.post(f"/bot{token}/sendMessage", json=payload)
+        if response.status_code == 200:
+            return
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        description = body.get("description") or response.text[:200]
+        if response.status_code == 429:
+            retry_after = (body.get("parameters") or {}).get("retry_after")
+            raise RetryLater(f"429: {description}", retry_after)
+        if response.status_code >= 500:
+            raise RetryLater(f"{response.status_code}: {description}")
+        raise PermanentError(f"{response.status_code}: {description}")
+
+    def _dead_letter(self, notification: Notification, reason: str, permanent: bool = False):
+        notification.last_error = reason
+        if notification.id in self._waiters:
+            if not permanent:
+                # Сообщение остаётся у вызывающего send() (строка outbox), в dead-letter не пишется
+                self.metrics["failed"] += 1
+                self._settle(notification, DeliveryFailed(reason))
+                return
+            self._settle(notification, PermanentError(reason))
+        self.dead.append(notification)
+        self.metrics["dead"] += 1
+        logger.warning("Notification %s to %s dead-lettered: %s", notification.id, notification.chat_id, reason)
+        if self.dead_letter_path:
+            self._dead_lines.append(json.dumps(asdict(notification), ensure_ascii=False) + "\n")
+            if self._dead_writer is None or self._dead_writer.done():
+                self._dead_writer = asyncio.get_running_loop().create_task(self._write_dead_letters())
+
+    async def _write_dead_letters(self):
+        """
+        Дозапись накопленных строк dead-letter в файл одним вызовом в потоке
+        """
+        while self._dead_lines:
+            lines, self._dead_lines = self._dead_lines, []
+            try:
+                await asyncio.to_thread(self._append, "".join(lines))
+            except OSError as e:
+                logger.warning("Dead-letter write failed: %s", e)
+
+    def _append(self, text: str):
+        directory = os.path.dirname(self.dead_letter_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(text)
+
+    def retry_dead(self) -> int:
+        """
+        Повторная отправка всех сообщений из dead-letter в памяти
+        """
+        count = 0
+        while self.dead:
+            notification = self.dead.popleft()
+            notification.attempts = 0
+            self._push(notification)
+            count += 1
+        return count
+
+    def start(self):
+        if self._tasks:
+            return
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 5):
+        """
+        Дожидается отправки очереди не дольше `timeout`, остальное — в dead-letter
+        """
+        deadline = time.monotonic() + timeout
+        while self._tasks and (self._pending or self._inflight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for handle in self._timers.values():
+            handle.cancel()
+        self._timers.clear()
+        for queue in self._lanes.values():
+            for notification in queue:
+                self._dead_letter(notification, "shutdown")
+        self._lanes.clear()
+        self._active.clear()
+        self._pending = 0
+        self._ready = None
+        if self._dead_writer is not None:
+            await self._dead_writer
+            self._dead_writer = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def status(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(int(q * len(latencies)), len(latencies) - 1)], 4)
+
+        return {
+            **self.metrics,
+            "queueDepth": self._pending,
+            "lanes": len(self._lanes),
+            "deepestLane": max((len(queue) for queue in self._lanes.values()), default=0),
+            "inflight": sum(len(parts) for parts in self._inflight.values()),
+            "deadLetters": len(self.dead),
+            "workers": len(self._tasks),
+            "latency": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99)},
+        }
+
+
+notifier = TelegramNotifier(bots={"admin": BOT_TOKEN, "client": CLIENT_BOT_TOKEN})
+
+
+def get_notifier() -> TelegramNotifier:
+    return notifier
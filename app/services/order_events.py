@@ -0,0 +1,234 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from redis.exceptions import ConnectionError, TimeoutError
+from starlette import status
+from starlette.websockets import WebSocket
+
+from config import ORDER_EVENTS_CHANNEL, WS_QUEUE_SIZE, WS_SEND_TIMEOUT
+from services.redis_pool import MeteredRedis, redis_client
+
+logger = logging.getLogger(__name__)
+
+
+def order_event(order_id: int, client: Optional[int], state: Optional[str], **extra) -> dict:
+    """
+    Событие изменения заказа для подписчиков WebSocket
+    """
+    return {"type": "order.state", "orderId": order_id, "client": client, "state": state, "at": time.time(), **extra}
+
+
+class Subscriber:
+    """
+    Подписчик: ограниченная очередь исходящих сообщений. У WebSocket
+    своя задача-писатель; поток SSE читает очередь сам.
+    """
+
+    __slots__ = ("websocket", "client", "orders", "everything", "queue", "writer")
+
+    def __init__(
+        self,
+        websocket: Optional[WebSocket],
+        client: Optional[int],
+        orders: Tuple[int, ...],
+        everything: bool,
+        queue_size: int,
+    ):
+        self.websocket = websocket
+        self.client = client
+        self.orders = orders
+        self.everything = everything
+        self.queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+
+
+class OrderEventHub:
+    """
+    Рассылка событий заказов по WebSocket и SSE между воркерами.
+
+    Каждый воркер держит одну подписку на канал Redis pub/sub и своих
+    подписчиков в индексах «клиент → подписчики» и «заказ →
+    подписчики»; доска кухни получает все события. Событие публикуется
+    в Redis один раз, каждый воркер доставляет его только своим
+    подписчикам, поэтому неважно, какой воркер принял соединение.
+
+    У каждого подписчика своя очередь на WS_QUEUE_SIZE сообщений.
+    Рассылка только кладёт уже закодированное сообщение в очереди и
+    ничего не ждёт; медленный подписчик, у которого очередь
+    переполнилась, отключается (WebSocket — с кодом 1013, поток SSE
+    получает None и завершается), закрытые сокеты убираются писателем.
+    """
+
+    def __init__(
+        self,
+        redis: MeteredRedis = redis_client,
+        channel: str = ORDER_EVENTS_CHANNEL,
+        send_timeout: float = WS_SEND_TIMEOUT,
+        queue_size: int = WS_QUEUE_SIZE,
+    ):
+        self.redis = redis
+        self.channel = channel
+        self.send_timeout = send_timeout
+        self.queue_size = queue_size
+        self._by_client: Dict[int, Set[Subscriber]] = {}
+        self._by_order: Dict[int, Set[Subscriber]] = {}
+        self._everything: Set[Subscriber] = set()
+        self._subscribers: Set[Subscriber] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._closing: Set[asyncio.Task] = set()
+        self.metrics = {"published": 0, "received": 0, "queued": 0, "delivered": 0, "slow": 0, "closed": 0}
+
+    def subscribe(
+        self,
+        client: Optional[int] = None,
+        orders: Iterable[int] = (),
+        everything: bool = False,
+        websocket: Optional[WebSocket] = None,
+    ) -> Subscriber:
+        subscriber = Subscriber(websocket, client, tuple(orders), everything, self.queue_size)
+        self._subscribers.add(subscriber)
+        if everything:
+            self._everything.add(subscriber)
+        if client is not None:
+            self._by_client.setdefault(client, set()).add(subscriber)
+        for order_id in subscriber.orders:
+            self._by_order.setdefault(order_id, set()).add(subscriber)
+        return subscriber
+
+    def connect(self, websocket: WebSocket, client: Optional[int] = None, orders: Iterable[int] = ()) -> Subscriber:
+        subscriber = self.subscribe(client, orders, websocket=websocket)
+        subscriber.writer = asyncio.create_task(self._write(subscriber))
+        return subscriber
+
+    def disconnect(self, subscriber: Subscriber):
+        if subscriber not in self._subscribers:
+            return
+        self._subscribers.discard(subscriber)
+        self._everything.discard(subscriber)
+        for index, key in [(self._by_client, subscriber.client)] + [(self._by_order, order_id) for order_id in subscriber.orders]:
+            subscribers = index.get(key)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del index[key]
+        if subscriber.writer is not None and subscriber.writer is not asyncio.current_task():
+            subscriber.writer.cancel()
+
+    async def publish(self, event: dict) -> int:
+        """
+        Отправка события всем воркерам; возвращает число подписанных воркеров
+        """
+        self.metrics["published"] += 1
+        return await self.redis.publish(self.channel, json.dumps(event, ensure_ascii=False, default=str))
+
+    def _targets(self, event: dict) -> Set[Subscriber]:
+        targets = set(self._everything)
+        targets.update(self._by_order.get(event.get("orderId"), ()))
+        targets.update(self._by_client.get(event.get("client"), ()))
+        return targets
+
+    async def _write(self, subscriber: Subscriber):
+        websocket = subscriber.websocket
+        try:
+            while True:
+                text = await subscriber.queue.get()
+                await asyncio.wait_for(websocket.send_text(text), self.send_timeout)
+                self.metrics["delivered"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Сокет закрыт или клиент не принимает данные дольше send_timeout
+            self.metrics["closed"] += 1
+            logger.info("Removing order events socket: %s", e)
+            self.disconnect(subscriber)
+            await self._close(websocket, status.WS_1011_INTERNAL_ERROR)
+
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            await asyncio.wait_for(websocket.close(code=code), self.send_timeout)
+        except Exception:
+            pass
+
+    def _drop(self, subscriber: Subscriber):
+        self.metrics["slow"] += 1
+        logger.info("Order events subscriber is too slow, disconnecting")
+        self.disconnect(subscriber)
+        if subscriber.websocket is None:
+            # Поток SSE завершится на None, браузер переподключится сам
+            while not subscriber.queue.empty():
+                subscriber.queue.get_nowait()
+            subscriber.queue.put_nowait(None)
+            return
+        task = asyncio.create_task(self._close(subscriber.websocket, status.WS_1013_TRY_AGAIN_LATER))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def _dispatch(self, data: str):
+        """
+        Раскладка сообщения по очередям подписчиков, без ожиданий
+        """
+        self.metrics["received"] += 1
+        try:
+            event = json.loads(data)
+        except ValueError:
+            logger.warning("Malformed order event: %r", data)
+            return
+        for subscriber in self._targets(event):
+            try:
+                subscriber.queue.put_nowait(data)
+                self.metrics["queued"] += 1
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self._dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except (ConnectionError, TimeoutError) as e:
+                logger.warning("Order events subscription lost, resubscribing: %s", e)
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for subscriber in list(self._subscribers):
+            self.disconnect(subscriber)
+
+    def status(self) -> dict:
+        return {
+            **self.metrics,
+            "sockets": len(self._subscribers),
+            "queuedMessages": sum(subscriber.queue.qsize() for subscriber in self._subscribers),
+            "clients": len(self._by_client),
+            "orders": len(self._by_order),
+            "boards": len(self._everything),
+            "subscribed": self._task is not None,
+        }
+
+
+order_events = OrderEventHub()
+
+
+def get_order_events() -> OrderEventHub:
+    return order_events
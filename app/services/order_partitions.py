@@ -0,0 +1,282 @@
+import asyncio
+import gzip
+import logging
+import os
+import re
+import time
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from auth.database import engine
+from config import (
+    ORDER_ARCHIVE_DIR,
+    ORDER_PARTITION_INTERVAL,
+    ORDER_PARTITIONS_AHEAD,
+    ORDER_RETENTION_MONTHS,
+    SALES_TIMEZONE,
+)
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME = re.compile(r"^order_p(\d{4})_(\d{2})$")
+# Ключ pg_advisory_lock: обслуживание секций выполняет один воркер за раз
+PARTITION_LOCK = 7201
+LOCK_TIMEOUT = "5s"
+
+PARTITIONS_QUERY = text("""
+    SELECT c.relname AS name, (i.inhrelid IS NOT NULL) AS attached
+    FROM pg_class c
+    LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = '"order"'::regclass
+    WHERE c.relkind = 'r' AND c.relname ~ '^order_p[0-9]{4}_[0-9]{2}$'
+    ORDER BY c.relname
+""")
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"order_p{month:%Y_%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = PARTITION_NAME.match(name)
+    return date(int(match[1]), int(match[2]), 1) if match else None
+
+
+class OrderPartitionManager:
+    """
+    Обслуживание месячных секций таблицы order.
+
+    Раз в ORDER_PARTITION_INTERVAL создаются секции текущего месяца и
+    ORDER_PARTITIONS_AHEAD следующих, чтобы новые заказы не попадали в
+    order_default. Если задан ORDER_RETENTION_MONTHS, более старые
+    секции отсоединяются (DETACH) и выгружаются в
+    ORDER_ARCHIVE_DIR/<секция>.ndjson.gz вместе со строками order_item,
+    после чего удаляются. Сводка продаж остаётся в food_sales_daily.
+
+    Шаги идемпотентны: отсоединённая, но не выгруженная секция
+    найдётся при следующем запуске. Между воркерами — pg_try_advisory_lock,
+    DDL ждёт блокировку не дольше LOCK_TIMEOUT, чтобы не задерживать заказы.
+    """
+
+    def __init__(
+        self,
+        db: AsyncEngine = engine,
+        ahead: int = ORDER_PARTITIONS_AHEAD,
+        retention: int = ORDER_RETENTION_MONTHS,
+        archive_dir: str = ORDER_ARCHIVE_DIR,
+        interval: float = ORDER_PARTITION_INTERVAL,
+        timezone: str = SALES_TIMEZONE,
+        batch: int = 1000,
+    ):
+        self.db = db
+        self.ahead = ahead
+        self.retention = retention
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self.timezone = timezone
+        self.batch = batch
+        self.metrics = {"runs": 0, "created": 0, "detached": 0, "archived": 0, "archivedRows": 0}
+        self.last_run: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _current_month(self, conn: AsyncConnection) -> date:
+        today = await conn.scalar(text("SELECT (now() AT TIME ZONE :zone)::date"), {"zone": self.timezone})
+        return today.replace(day=1)
+
+    async def _partitions(self, conn: AsyncConnection) -> dict:
+        result = await conn.execute(PARTITIONS_QUERY)
+        return {row.name: row.attached for row in result}
+
+    async def _ddl(self, conn: AsyncConnection, statement: str):
+        await conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+        await conn.execute(text(statement))
+        await conn.commit()
+
+    async def ensure_partitions(self, conn: AsyncConnection) -> List[str]:
+        """
+        Секции текущего и следующих месяцев; возвращает созданные
+        """
+        current = await self._current_month(conn)
+        existing = await self._partitions(conn)
+        await conn.commit()
+        created = []
+        for offset in range(self.ahead + 1):
+            month = add_months(current, offset)
+            name = partition_name(month)
+            if name in existing:
+                continue
+            try:
+                await self._ddl(conn, (
+                    f'CREATE TABLE "{name}" PARTITION OF "order" '
+                    f"FOR VALUES FROM ('{month} {self.timezone}') TO ('{add_months(month, 1)} {self.timezone}')"
+                ))
+            except DBAPIError as e:
+                # Например, в order_default уже есть заказы этого месяца
+                await conn.rollback()
+                self.last_error = f"{name}: {e.orig}"
+                logger.warning("Cannot create order partition %s: %s", name, e.orig)
+                continue
+            created.append(name)
+            self.metrics["created"] += 1
+        return created
+
+    async def detach_expired(self, conn: AsyncConnection) -> List[str]:
+        """
+        Отсоединение секций старше ORDER_RETENTION_MONTHS месяцев
+        """
+        if self.retention <= 0:
+            return []
+        cutoff = add_months(await self._current_month(conn), -self.retention)
+        existing = await self._partitions(conn)
+        await conn.commit()
+        detached = []
+        for name, attached in existing.items():
+            if not attached or partition_month(name) >= cutoff:
+                continue
+            await self._ddl(conn, f'ALTER TABLE "order" DETACH PARTITION "{name}"')
+            detached.append(name)
+            self.metrics["detached"] += 1
+        return detached
+
+    async def archive_detached(self, conn: AsyncConnection) -> List[str]:
+        """
+        Выгрузка отсоединённых секций в gzip NDJSON и их удаление
+        """
+        existing = await self._partitions(conn)
+        await conn.commit()
+        archived = []
+        for name, attached in existing.items():
+            if attached:
+                continue
+            rows = await self._export(conn, name)
+            await conn.execute(text(f'DELETE FROM order_item WHERE "orderId" IN (SELECT id FROM "{name}")'))
+            await conn.execute(text(f'DELETE FROM order_outbox WHERE "orderId" IN (SELECT id FROM "{name}")'))
+            await conn.execute(text(f'DROP TABLE "{name}"'))
+            await conn.commit()
+            archived.append(name)
+            self.metrics["archived"] += 1
+            self.metrics["archivedRows"] += rows
+            logger.info("Archived order partition %s (%s orders)", name, rows)
+        return archived
+
+    async def _export(self, conn: AsyncConnection, name: str) -> int:
+        """
+        Заказы секции со строками order_item построчно в файл: в памяти
+        не больше одной пачки, файл появляется под своим именем только
+        целиком записанным. Строку JSON собирает Postgres: колонки json
+        (items, lines) попадают в файл как есть, без повторного кодирования
+        """
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{name}.ndjson.gz")
+        tmp = f"{path}.tmp"
+        query = text(f"""
+            SELECT row_to_json(r)::text
+            FROM (
+                SELECT o.*, coalesce(
+                    (SELECT json_agg(i ORDER BY i.id) FROM order_item i WHERE i."orderId" = o.id), '[]'
+                ) AS lines
+                FROM "{name}" o
+            ) r
+            ORDER BY r.id
+        """).execution_options(yield_per=self.batch)
+        rows = 0
+        archive = await asyncio.to_thread(gzip.open, tmp, "wb")
+        try:
+            result = await conn.stream(query)
+            async for partition in result.scalars().partitions():
+                chunk = "".join(line + "\n" for line in partition)
+                await asyncio.to_thread(archive.write, chunk.encode())
+                rows += len(partition)
+        finally:
+            await asyncio.to_thread(archive.close)
+        await conn.commit()
+        await asyncio.to_thread(_fsync, tmp)
+        os.replace(tmp, path)
+        return rows
+
+    async def run_once(self) -> dict:
+        async with self.db.connect() as conn:
+            if not await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": PARTITION_LOCK}):
+                await conn.rollback()
+                return {"skipped": True}
+            try:
+                await conn.commit()
+                report = {
+                    "created": await self.ensure_partitions(conn),
+                    "detached": await self.detach_expired(conn),
+                    "archived": await self.archive_detached(conn),
+                }
+            finally:
+                await conn.rollback()
+                await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": PARTITION_LOCK})
+                await conn.commit()
+        self.metrics["runs"] += 1
+        self.last_run = time.time()
+        return report
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.warning("Order partition maintenance failed: %s", e)
+                self.last_error = str(e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def partitions(self) -> List[dict]:
+        """
+        Секции order с оценкой числа строк (по статистике планировщика)
+        """
+        async with self.db.connect() as conn:
+            result = await conn.execute(text("""
+                SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bounds,
+                       greatest(c.reltuples, 0)::bigint AS rows
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = '"order"'::regclass
+                ORDER BY c.relname
+            """))
+            return [dict(row) for row in result.mappings()]
+
+    def status(self) -> dict:
+        return {
+            **self.metrics,
+            "running": self._task is not None,
+            "retentionMonths": self.retention,
+            "lastRun": self.last_run,
+            "lastError": self.last_error,
+        }
+
+
+def _fsync(path: str):
+    with open(path, "rb") as file:
+        os.fsync(file.fileno())
+
+
+order_partitions = OrderPartitionManager()
+
+
+def get_order_partitions() -> OrderPartitionManager:
+    return order_partitions
@@ -0,0 +1,98 @@
+from typing import Dict, FrozenSet, List, Optional
+
+from sqlalchemy import func, insert, literal, literal_column, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.models import Order, OrderOutbox
+from services.outbox import TOPIC_ORDER_EVENT, jsonb, outbox_relay
+from services.sales import subtract_order_lines
+
+NEW = "new"
+ACCEPTED = "accepted"
+COOKING = "cooking"
+READY = "ready"
+DELIVERED = "delivered"
+DECLINED = "declined"
+
+TRANSITIONS: Dict[str, FrozenSet[str]] = {
+    NEW: frozenset({ACCEPTED, DECLINED}),
+    ACCEPTED: frozenset({COOKING, DECLINED}),
+    COOKING: frozenset({READY}),
+    READY: frozenset({DELIVERED}),
+    DELIVERED: frozenset(),
+    DECLINED: frozenset(),
+}
+STATES = tuple(TRANSITIONS)
+# Заказы на доске кухни
+ACTIVE_STATES = (NEW, ACCEPTED, COOKING, READY)
+
+
+class OrderStateError(Exception):
+    pass
+
+
+class OrderNotFound(OrderStateError):
+    pass
+
+
+class InvalidTransition(OrderStateError):
+    def __init__(self, current: Optional[str], target: str):
+        super().__init__(f"cannot move order from {current!r} to {target!r}")
+        self.current = current
+        self.target = target
+        self.allowed = sorted(TRANSITIONS.get(current, ()))
+
+
+def sources(target: str) -> List[str]:
+    """
+    Состояния, из которых разрешён переход в target
+    """
+    return [state for state, targets in TRANSITIONS.items() if target in targets]
+
+
+async def change_state(session: AsyncSession, order_id: int, target: str, **extra) -> dict:
+    """
+    Переход заказа в состояние target.
+
+    Проверка и запись — один UPDATE ... WHERE state IN (допустимые
+    источники), так что два одновременных перехода не проскочат оба.
+    Событие для WebSocket и доски кухни пишется в order_outbox тем же
+    запросом, при отказе тем же запросом заказ вычитается из сводки
+    продаж. extra попадает в событие (например, причина отказа).
+    """
+    if target not in TRANSITIONS:
+        raise InvalidTransition(None, target)
+    moved = (
+        update(Order)
+        .where(Order.id == order_id, Order.state.in_(sources(target)))
+        .values(state=target)
+        .returning(Order.id, Order.client, Order.number, Order.state)
+        .cte("moved")
+    )
+    payload = jsonb(extra).op("||")(func.jsonb_build_object(
+        literal_column("'client'"), moved.c.client,
+        literal_column("'state'"), moved.c.state,
+        literal_column("'number'"), moved.c.number,
+    ))
+    query = (
+        insert(OrderOutbox)
+        .from_select(
+            ["orderId", "topic", "payload"],
+            select(moved.c.id, literal(TOPIC_ORDER_EVENT), payload),
+            include_defaults=False,
+        )
+        .returning(OrderOutbox.orderId)
+    )
+    if target == DECLINED:
+        query = query.add_cte(subtract_order_lines(select(moved.c.id).scalar_subquery()))
+    result = await session.execute(query)
+    if result.first() is None:
+        await session.rollback()
+        current = await session.execute(select(Order.state).where(Order.id == order_id))
+        row = current.first()
+        if row is None:
+            raise OrderNotFound(f"order {order_id} not found")
+        raise InvalidTransition(row.state, target)
+    await session.commit()
+    outbox_relay.wake()
+    return {"id": order_id, "state": target}
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError, ResponseError, TimeoutError
+
+from config import (
+    ORDER_STREAM,
+    ORDER_STREAM_BATCH,
+    ORDER_STREAM_BLOCK_MS,
+    ORDER_STREAM_CLAIM_IDLE_MS,
+    ORDER_STREAM_GROUP,
+    ORDER_STREAM_MAXLEN,
+)
+
+logger = logging.getLogger(__name__)
+
+Entry = Tuple[str, dict]
+
+
+# INCR номера, SET ключа заказа для кнопок бота и XADD в поток — один
+# обмен с Redis и атомарно: бот не увидит событие без ключа заказа.
+# Ключ order:<id> вычисляется внутри скрипта (Redis без кластера).
+SAVE_ORDER_LUA = """
+local id = redis.call('INCR', KEYS[1])
+redis.call('SET', ARGV[1] .. id, ARGV[2])
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[3], '*', 'order_id', id, 'data', ARGV[2])
+return id
+"""
+
+
+async def save_order(redis: Redis, data: dict, stream: str = ORDER_STREAM) -> int:
+    """
+    Сохранение заказа под новым номером и публикация в поток заказов
+    """
+    payload = json.dumps(data, ensure_ascii=False)
+    script = redis.register_script(SAVE_ORDER_LUA)
+    return await script(keys=["order_id", stream], args=["order:", payload, ORDER_STREAM_MAXLEN])
+
+
+def default_consumer_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class OrderStreamConsumer:
+    """
+    Чтение потока заказов через группу потребителей Redis Streams.
+
+    XREADGROUP блокируется на стороне Redis до прихода записей, поэтому
+    в простое процесс ничего не делает. Запись подтверждается (XACK)
+    только после успешной обработки (обработчик ждёт доставки, а не
+    постановки в очередь); неподтверждённые записи упавших
+    реплик забираются через XAUTOCLAIM. Несколько реплик бота в одной
+    группе делят поток между собой, каждая запись обрабатывается одной.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        handler: Callable[[str, dict], Awaitable[None]],
+        stream: str = ORDER_STREAM,
+        group: str = ORDER_STREAM_GROUP,
+        consumer: Optional[str] = None,
+        batch: int = ORDER_STREAM_BATCH,
+        block_ms: int = ORDER_STREAM_BLOCK_MS,
+        claim_idle_ms: int = ORDER_STREAM_CLAIM_IDLE_MS,
+    ):
+        self.redis = redis
+        self.handler = handler
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or default_consumer_name()
+        self.batch = batch
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.processed = 0
+        self.failed = 0
+        self.claimed = 0
+
+    async def ensure_group(self):
+        try:
+            # id 0: новая группа начинает с начала потока, ни один заказ не теряется
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _handle(self, entries: List[Entry]):
+        """
+        Записи пачки обрабатываются параллельно: обработчик ждёт доставки
+        (например, ответа Telegram), и заказы не должны ждать друг друга
+        """
+        acked = []
+        work = []
+        for entry_id, fields in entries:
+            if fields is None:
+                # Запись удалена обрезкой потока, пока висела в pending
+                acked.append(entry_id)
+                continue
+            try:
+                data = json.loads(fields["data"])
+            except (KeyError, ValueError) as e:
+                logger.error("Order stream entry %s is malformed, dropping: %s", entry_id, e)
+                acked.append(entry_id)
+                continue
+            work.append((entry_id, fields.get("order_id"), data))
+        results = await asyncio.gather(
+            *(self.handler(order_id, data) for _, order_id, data in work), return_exceptions=True
+        )
+        for (entry_id, _, _), result in zip(work, results):
+            if isinstance(result, asyncio.CancelledError):
+                raise result
+            if isinstance(result, BaseException):
+                # Без XACK запись останется в pending и будет забрана повторно
+                self.failed += 1
+                logger.error("Order stream entry %s failed", entry_id, exc_info=result)
+                continue
+            self.processed += 1
+            acked.append(entry_id)
+        if acked:
+            await self.redis.xack(self.stream, self.group, *acked)
+
+    async def _read(self, entry_id: str, block: Optional[int]) -> List[Entry]:
+        response = await self.redis.xreadgroup(
+            self.group, self.consumer, {self.stream: entry_id}, count=self.batch, block=block
+        )
+        return response[0][1] if response else []
+
+    async def _claim(self):
+        start = "0-0"
+        while True:
+            result = await self.redis.xautoclaim(
+                self.stream, self.group, self.consumer, self.claim_idle_ms, start_id=start, count=self.batch
+            )
+            start, entries = result[0], result[1]
+            if entries:
+                self.claimed += len(entries)
+                logger.info("Reclaimed %s pending order events", len(entries))
+                await self._handle(entries)
+            if not entries or start in ("0-0", b"0-0"):
+                return
+
+    async def _drain_pending(self):
+        """
+        Своё неподтверждённое с прошлого запуска
+        """
+        last_id = "0"
+        while True:
+            entries = await self._read(last_id, None)
+            if not entries:
+                return
+            await self._handle(entries)
+            last_id = entries[-1][0]
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        ready = False
+        next_claim = loop.time()
+        while True:
+            try:
+                # Создание группы и разбор pending — под той же обработкой
+                # ошибок: Redis, недоступный при старте, не роняет бота
+                if not ready:
+                    await self.ensure_group()
+                    await self._drain_pending()
+                    ready = True
+                if loop.time() >= next_claim:
+                    await self._claim()
+                    next_claim = loop.time() + self.claim_idle_ms / 1000
+                entries = await self._read(">", self.block_ms)
+                if entries:
+                    await self._handle(entries)
+            except asyncio.CancelledError:
+                raise
+            except (ConnectionError, TimeoutError) as e:
+                logger.warning("Order stream read failed, retrying: %s", e)
+                await asyncio.sleep(1)
+            except ResponseError as e:
+                # Поток или группу удалили — создаём заново на следующем круге
+                if "NOGROUP" not in str(e):
+                    raise
+                ready = False
+
+    def status(self) -> dict:
+        return {
+            "stream": self.stream,
+            "group": self.group,
+            "consumer": self.consumer,
+            "processed": self.processed,
+            "failed": self.failed,
+            "claimed": self.claimed,
+        }
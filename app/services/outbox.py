@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, literal, select, union_all
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql.elements import ColumnElement
+
+from auth.database import async_session_maker
+from config import OUTBOX_BATCH, OUTBOX_MAX_ATTEMPTS, OUTBOX_POLL_INTERVAL, OUTBOX_RETRY_BASE, OUTBOX_RETRY_MAX
+from models.models import Order, OrderOutbox
+from services.notifications import PermanentError, notifier
+from services.order_events import order_event, order_events
+from services.order_stream import save_order
+from services.sales import insert_order_lines
+from services.redis_pool import redis_client
+
+logger = logging.getLogger(__name__)
+
+TOPIC_ORDER_CREATED = "order.created"
+TOPIC_TELEGRAM = "telegram"
+TOPIC_ORDER_EVENT = "order.event"
+
+Handler = Callable[[int, Any], Awaitable[None]]
+
+
+def jsonb(value: Any) -> ColumnElement:
+    return literal(value, JSONB)
+
+
+def insert_order_with_outbox(order_values: dict, events: List[Tuple[str, ColumnElement]], lines: List[dict] = ()):
+    """
+    Один запрос: INSERT заказа в CTE и INSERT ... SELECT событий outbox
+    с его id. Заказ и события фиксируются одной транзакцией — либо всё,
+    либо ничего. Строки заказа (services.sales.order_lines) пишутся в
+    order_item и дневную сводку продаж тем же запросом.
+    """
+    new_order = insert(Order).values(order_values).returning(Order.id).cte("new_order")
+    rows = union_all(*(select(new_order.c.id, literal(topic), payload) for topic, payload in events))
+    return (
+        insert(OrderOutbox)
+        .from_select(["orderId", "topic", "payload"], rows, include_defaults=False)
+        .returning(OrderOutbox.orderId)
+        .add_cte(*insert_order_lines(new_order.c.id, list(lines)))
+    )
+
+
+class OutboxRelay:
+    """
+    Публикация событий из order_outbox.
+
+    Пачка строк забирается SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+    несколько воркеров разбирают таблицу параллельно и не ждут друг
+    друга. Обработчики пачки выполняются параллельно, события одного
+    заказа — по порядку. Опубликованные строки удаляются в той же
+    транзакции, неудачные откладываются с экспоненциальной задержкой,
+    после `max_attempts` попыток получают deadAt и больше не
+    публикуются. Доставка «хотя бы один раз»: если коммит не прошёл,
+    событие уйдёт повторно.
+
+    Темы разложены по дорожкам, у каждой свой цикл: медленная отправка
+    в Telegram (ожидание лимитов чата, блокировка по 429) не задерживает
+    публикацию в Redis. Дорожка с темами None забирает все остальные.
+    """
+
+    def __init__(
+        self,
+        handlers: Dict[str, Handler],
+        session_maker=async_session_maker,
+        batch: int = OUTBOX_BATCH,
+        interval: float = OUTBOX_POLL_INTERVAL,
+        retry_base: float = OUTBOX_RETRY_BASE,
+        retry_max: float = OUTBOX_RETRY_MAX,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        lanes: Optional[Dict[str, Optional[Sequence[str]]]] = None,
+    ):
+        self.handlers = handlers
+        self.session_maker = session_maker
+        self.batch = batch
+        self.interval = interval
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_attempts = max_attempts
+        self.lanes = lanes or {"default": None}
+        self.metrics = {"published": 0, "failed": 0, "dead": 0, "batches": 0}
+        self.last_error: Optional[str] = None
+        self._lag: Deque[float] = deque(maxlen=1000)
+        self._wakeups = {lane: asyncio.Event() for lane in self.lanes}
+        self._tasks: List[asyncio.Task] = []
+
+    def wake(self):
+        """
+        Разбудить циклы сразу после коммита заказа, не дожидаясь опроса
+        """
+        for event in self._wakeups.values():
+            event.set()
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+
+    def _lane_filter(self, lane: Optional[str]) -> Optional[ColumnElement]:
+        if lane is None:
+            return None
+        topics = self.lanes[lane]
+        if topics is not None:
+            return OrderOutbox.topic.in_(topics)
+        claimed = [topic for other in self.lanes.values() if other for topic in other]
+        return OrderOutbox.topic.not_in(claimed) if claimed else None
+
+    async def _publish(self, rows: List[OrderOutbox]) -> List[Optional[Exception]]:
+        """
+        События одного заказа по порядку; результат — ошибка или None по каждой строке
+        """
+        errors = []
+        for row in rows:
+            handler = self.handlers.get(row.topic)
+            try:
+                if handler is None:
+                    raise LookupError(f"no handler for topic {row.topic!r}")
+                await handler(row.orderId, row.payload)
+            except Exception as e:
+                errors.append(e)
+                continue
+            errors.append(None)
+        return errors
+
+    async def relay_once(self, lane: Optional[str] = None) -> int:
+        """
+        Одна пачка дорожки (без lane — всех тем); возвращает число обработанных строк
+        """
+        query = (
+            select(OrderOutbox)
+            .where(OrderOutbox.availableAt <= func.now(), OrderOutbox.deadAt.is_(None))
+            .order_by(OrderOutbox.availableAt, OrderOutbox.id)
+            .limit(self.batch)
+            .with_for_update(skip_locked=True)
+        )
+        condition = self._lane_filter(lane)
+        if condition is not None:
+            query = query.where(condition)
+        async with self.session_maker() as session:
+            result = await session.execute(query)
+            rows = result.scalars().all()
+            if not rows:
+                return 0
+            by_order: Dict[int, List[OrderOutbox]] = {}
+            for row in rows:
+                by_order.setdefault(row.orderId, []).append(row)
+            groups = list(by_order.values())
+            results = await asyncio.gather(*(self._publish(group) for group in groups))
+            published = []
+            for group, errors in zip(groups, results):
+                for row, error in zip(group, errors):
+                    if error is None:
+                        published.append(row.id)
+                        self._lag.append(time.time() - row.createdAt.timestamp())
+                    else:
+                        self._fail(row, error)
+            if published:
+                await session.execute(delete(OrderOutbox).where(OrderOutbox.id.in_(published)))
+            await session.commit()
+            self.metrics["published"] += len(published)
+            self.metrics["batches"] += 1
+            return len(rows)
+
+    def _fail(self, row: OrderOutbox, error: Exception):
+        row.attempts += 1
+        row.lastError = str(error)[:500]
+        self.metrics["failed"] += 1
+        self.last_error = row.lastError
+        if row.attempts >= self.max_attempts:
+            # Отравленная строка не крутится вечно: ждёт разбора, в лаг не попадает
+            row.deadAt = func.now()
+            self.metrics["dead"] += 1
+            logger.error("Outbox event %s (%s) gave up after %s attempts: %s", row.id, row.topic, row.attempts, error)
+            return
+        row.availableAt = func.now() + timedelta(seconds=self._backoff(row.attempts))
+        logger.warning("Outbox event %s (%s) failed, attempt %s: %s", row.id, row.topic, row.attempts, error)
+
+    async def _run(self, lane: str):
+        wakeup = self._wakeups[lane]
+        while True:
+            try:
+                count = await self.relay_once(lane)
+            except Exception as e:
+                logger.warning("Outbox relay %s failed: %s", lane, e)
+                self.last_error = str(e)
+                count = 0
+            if count >= self.batch:
+                continue
+            try:
+                await asyncio.wait_for(wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run(lane)) for lane in self.lanes]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def status(self) -> dict:
+        lag = sorted(self._lag)
+
+        def percentile(q: float) -> Optional[float]:
+            if not lag:
+                return None
+            return round(lag[min(int(q * len(lag)), len(lag) - 1)], 4)
+
+        return {
+            **self.metrics,
+            "running": bool(self._tasks),
+            "lanes": list(self.lanes),
+            "lastError": self.last_error,
+            "lag": {"p50": percentile(0.5), "p99": percentile(0.99)},
+        }
+
+
+async def publish_order_created(order_id: int, payload: dict):
+    # Ключ заказа и запись в потоке для бота администраторов; id из базы
+    # нужен боту, чтобы сообщать об изменениях заказа
+    await save_order(redis_client, {**payload, "id": order_id})
+
+
+async def send_telegram(order_id: int, payload: dict):
+    # Строка удаляется только после ответа Telegram: DeliveryFailed
+    # оставляет её в outbox на повтор с задержкой
+    try:
+        await notifier.send(payload["chatId"], payload["text"], bot=payload.get("bot", "client"))
+    except PermanentError as e:
+        # Чат не найден или бот заблокирован — повтор не поможет, сообщение в dead-letter
+        logger.warning("Telegram message for order %s dropped: %s", order_id, e)
+
+
+async def publish_order_event(order_id: int, payload: dict):
+    await order_events.publish(order_event(order_id, **payload))
+
+
+outbox_relay = OutboxRelay({
+    TOPIC_ORDER_CREATED: publish_order_created,
+    TOPIC_TELEGRAM: send_telegram,
+    TOPIC_ORDER_EVENT: publish_order_event,
+}, lanes={"telegram": (TOPIC_TELEGRAM,), "default": None})
+
+
+def get_outbox_relay() -> OutboxRelay:
+    return outbox_relay
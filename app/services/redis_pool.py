@@ -0,0 +1,144 @@
+import logging
+import time
+from collections import deque
+from typing import Deque, Optional
+
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.asyncio.client import Pipeline
+
+from config import (
+    REDIS_DB,
+    REDIS_HOST,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_POOL_TIMEOUT,
+    REDIS_PORT,
+    REDIS_SOCKET_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values: Deque[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 3)
+
+
+class RedisMetrics:
+    """
+    Ожидание соединения из пула и время выполнения команд (последние 1000)
+    """
+
+    def __init__(self):
+        self.commands = 0
+        self.errors = 0
+        self.waits: Deque[float] = deque(maxlen=1000)
+        self.latencies: Deque[float] = deque(maxlen=1000)
+
+    def observe(self, started: float, ok: bool):
+        self.commands += 1
+        if not ok:
+            self.errors += 1
+        self.latencies.append(time.perf_counter() - started)
+
+
+class MeteredConnectionPool(BlockingConnectionPool):
+    """
+    Пул с ограничением числа соединений: при исчерпании команда ждёт
+    свободное соединение до REDIS_POOL_TIMEOUT, а не открывает новое
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = RedisMetrics()
+
+    async def get_connection(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().get_connection(*args, **kwargs)
+        finally:
+            self.metrics.waits.append(time.perf_counter() - started)
+
+    def status(self) -> dict:
+        in_use = len(self._in_use_connections)
+        return {
+            "maxConnections": self.max_connections,
+            "open": in_use + len(self._available_connections),
+            "inUse": in_use,
+        }
+
+
+class MeteredPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = await super().execute(raise_on_error)
+            ok = True
+            return result
+        finally:
+            self.connection_pool.metrics.observe(started, ok)
+
+
+class MeteredRedis(Redis):
+    """
+    Асинхронный клиент, замеряющий каждую команду; конвейер считается
+    одной командой — это один сетевой обмен
+    """
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = await super().execute_command(*args, **options)
+            ok = True
+            return result
+        finally:
+            self.connection_pool.metrics.observe(started, ok)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> MeteredPipeline:
+        return MeteredPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def create_redis() -> MeteredRedis:
+    pool = MeteredConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=REDIS_DB,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_POOL_TIMEOUT,
+        health_check_interval=30,
+        decode_responses=True,
+    )
+    return MeteredRedis(connection_pool=pool)
+
+
+# Один пул на процесс: им пользуются OrderService, бот и проверки здоровья
+redis_client = create_redis()
+
+
+def get_redis() -> MeteredRedis:
+    return redis_client
+
+
+def redis_status(client: MeteredRedis = redis_client) -> dict:
+    pool = client.connection_pool
+    metrics = pool.metrics
+    return {
+        "pool": pool.status(),
+        "commands": metrics.commands,
+        "errors": metrics.errors,
+        "waitMs": {"p50": _percentile(metrics.waits, 0.5), "p99": _percentile(metrics.waits, 0.99)},
+        "latencyMs": {
+            "p50": _percentile(metrics.latencies, 0.5),
+            "p95": _percentile(metrics.latencies, 0.95),
+            "p99": _percentile(metrics.latencies, 0.99),
+        },
+    }
+
+
+async def close_redis(client: MeteredRedis = redis_client):
+    await client.connection_pool.disconnect()
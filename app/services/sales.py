@@ -0,0 +1,195 @@
+from datetime import date, timedelta
+from typing import Iterable, List, Optional
+
+from sqlalchemy import Date, Integer, String, cast, column, func, literal, select, true, update
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.selectable import CTE
+
+from config import SALES_TIMEZONE
+from models.models import FoodSalesDaily, OrderItem
+
+# Позиции без id (старые корзины) в сводке идут одной строкой
+UNKNOWN_FOOD = 0
+DEFAULT_PERIOD_DAYS = 30
+
+
+def sales_day() -> ColumnElement:
+    """
+    Текущий день в SALES_TIMEZONE по часам базы
+    """
+    return cast(func.timezone(SALES_TIMEZONE, func.now()), Date)
+
+
+def order_lines(items: Optional[Iterable[dict]]) -> List[dict]:
+    """
+    Позиции корзины в строки order_item: id блюда, название, количество,
+    цена за единицу
+    """
+    lines = []
+    for item in items or ():
+        food_id = item.get("id")
+        lines.append({
+            "foodId": food_id if isinstance(food_id, int) and not isinstance(food_id, bool) else None,
+            "foodName": item.get("foodName"),
+            "count": int(item.get("count") or 1),
+            "price": int(item.get("price") or 0),
+        })
+    return lines
+
+
+def insert_order_lines(order_id: ColumnElement, lines: List[dict]) -> List[CTE]:
+    """
+    CTE для запроса создания заказа: строки в order_item и прибавка к
+    дневной сводке (INSERT ... ON CONFLICT DO UPDATE). Сводка меняется
+    в той же транзакции, что и заказ, поэтому отчёты не пересчитывают
+    историю. Строки сводки блокируются по порядку foodId — два заказа
+    с одинаковыми блюдами не попадут во взаимную блокировку.
+    """
+    if not lines:
+        return []
+    rows = (
+        func.jsonb_to_recordset(literal(lines, JSONB))
+        .table_valued(
+            column("foodId", Integer),
+            column("foodName", String),
+            column("count", Integer),
+            column("price", Integer),
+        )
+        .render_derived(name="line", with_types=True)
+    )
+    day = sales_day()
+    items = (
+        insert(OrderItem)
+        .from_select(
+            ["orderId", "foodId", "foodName", "count", "price", "day"],
+            select(order_id, rows.c.foodId, rows.c.foodName, rows.c["count"], rows.c.price, day)
+            .join_from(order_id.table, rows, true()),
+            include_defaults=False,
+        )
+        .cte("new_items")
+    )
+    food = func.coalesce(rows.c.foodId, UNKNOWN_FOOD)
+    totals = (
+        select(
+            day,
+            food,
+            func.max(rows.c.foodName),
+            func.sum(rows.c["count"]),
+            func.sum(rows.c["count"] * rows.c.price),
+            1,
+        )
+        .group_by(food)
+        .order_by(food)
+    )
+    upsert = insert(FoodSalesDaily).from_select(
+        ["day", "foodId", "foodName", "count", "revenue", "orders"], totals, include_defaults=False
+    )
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[FoodSalesDaily.day, FoodSalesDaily.foodId],
+        set_={
+            "foodName": func.coalesce(upsert.excluded.foodName, FoodSalesDaily.foodName),
+            "count": FoodSalesDaily.count + upsert.excluded["count"],
+            "revenue": FoodSalesDaily.revenue + upsert.excluded.revenue,
+            "orders": FoodSalesDaily.orders + upsert.excluded.orders,
+        },
+    )
+    return [items, upsert.cte("new_sales")]
+
+
+def subtract_order_lines(order_id: ColumnElement) -> CTE:
+    """
+    CTE, вычитающий строки заказа из сводки за их день (отказ от заказа)
+    """
+    food = func.coalesce(OrderItem.foodId, UNKNOWN_FOOD)
+    lines = (
+        select(
+            OrderItem.day.label("day"),
+            food.label("foodId"),
+            func.sum(OrderItem.count).label("count"),
+            func.sum(OrderItem.count * OrderItem.price).label("revenue"),
+        )
+        .where(OrderItem.orderId == order_id, OrderItem.day.is_not(None))
+        .group_by(OrderItem.day, food)
+        .subquery("declined_lines")
+    )
+    return (
+        update(FoodSalesDaily)
+        .where(FoodSalesDaily.day == lines.c.day, FoodSalesDaily.foodId == lines.c.foodId)
+        .values(
+            count=FoodSalesDaily.count - lines.c["count"],
+            revenue=FoodSalesDaily.revenue - lines.c.revenue,
+            orders=FoodSalesDaily.orders - 1,
+        )
+        .cte("unsold")
+    )
+
+
+def _period(date_from: Optional[date], date_to: Optional[date]):
+    """
+    Условие на день сводки; по умолчанию — последние DEFAULT_PERIOD_DAYS дней
+    """
+    if date_to is None:
+        until = sales_day()
+        since = date_from if date_from is not None else until - (DEFAULT_PERIOD_DAYS - 1)
+    else:
+        until = date_to
+        since = date_from if date_from is not None else date_to - timedelta(days=DEFAULT_PERIOD_DAYS - 1)
+    return FoodSalesDaily.day.between(since, until)
+
+
+async def top_sellers(
+    session: AsyncSession,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: int = 10,
+) -> List[dict]:
+    """
+    Самые продаваемые блюда за период по количеству. Читается только
+    сводка: дни периода × позиции меню, сколько бы ни было заказов.
+    """
+    count = func.sum(FoodSalesDaily.count)
+    query = (
+        select(
+            FoodSalesDaily.foodId,
+            func.max(FoodSalesDaily.foodName).label("foodName"),
+            count.label("count"),
+            func.sum(FoodSalesDaily.revenue).label("revenue"),
+            func.sum(FoodSalesDaily.orders).label("orders"),
+        )
+        .where(_period(date_from, date_to))
+        .group_by(FoodSalesDaily.foodId)
+        .having(count > 0)
+        .order_by(count.desc(), FoodSalesDaily.foodId)
+        .limit(limit)
+    )
+    result = await session.execute(query)
+    return [dict(row) for row in result.mappings()]
+
+
+async def revenue(
+    session: AsyncSession,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> dict:
+    """
+    Выручка по дням за период (по ценам позиций, без учёта промокодов)
+    """
+    query = (
+        select(
+            FoodSalesDaily.day,
+            func.sum(FoodSalesDaily.count).label("count"),
+            func.sum(FoodSalesDaily.revenue).label("revenue"),
+        )
+        .where(_period(date_from, date_to))
+        .group_by(FoodSalesDaily.day)
+        .order_by(FoodSalesDaily.day)
+    )
+    result = await session.execute(query)
+    days = [dict(row) for row in result.mappings()]
+    return {
+        "days": days,
+        "count": sum(row["count"] for row in days),
+        "revenue": sum(row["revenue"] for row in days),
+    }
@@ -0,0 +1,353 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from io import BytesIO
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+from zoneinfo import ZoneInfo
+
+import httpx
+from pydantic import BaseModel
+
+from config import (
+    APP_CLIENT_ID,
+    APP_SECRET,
+    APP_SECRET_KEY,
+    SALES_TIMEZONE,
+    SBIS_API_URL,
+    SBIS_BREAKER_FAILURE_RATE,
+    SBIS_BREAKER_HALF_OPEN_CALLS,
+    SBIS_BREAKER_MIN_CALLS,
+    SBIS_BREAKER_OPEN_SECONDS,
+    SBIS_BREAKER_SLOW_CALL,
+    SBIS_BREAKER_WINDOW,
+    SBIS_HTTP2,
+    SBIS_LIST_TIMEOUT,
+    SBIS_MAX_CONCURRENCY,
+    SBIS_MAX_CONNECTIONS,
+    SBIS_OAUTH_URL,
+    SBIS_PAGE_CONCURRENCY,
+    SBIS_PAGE_SIZE,
+    SBIS_TIMEOUT,
+    SBIS_TOKEN_REFRESH_MARGIN,
+    SBIS_TOKEN_TTL,
+)
+from services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from services.sbis_token import SBISTokenManager
+
+logger = logging.getLogger(__name__)
+
+
+class SBISError(Exception):
+    """
+    Ошибка ответа API СБИС
+    """
+
+
+class SBISUnavailable(SBISError):
+    """
+    СБИС недоступен: предохранитель разомкнут
+    """
+
+    def __init__(self, message: str, retry_after: int = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenValidation(BaseModel):
+    access_token: str
+    sid: str
+    token: str
+
+class AuthorizationData(BaseModel):
+    app_client_id: str
+    app_secret: str
+    app_secret_key: str
+
+
+class FoodsRequest(BaseModel):
+    pointId: int
+    priceListId: int
+    withBalance: Union[bool, None] = True
+    withBarcode: Union[bool, None] = True
+    onlyPublished: Union[bool, None] = True
+    page: Union[int, None] = None
+    pageSize: Union[int, None] = SBIS_PAGE_SIZE
+    noStopList: Union[bool, None] = True
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _save_image(content: bytes, path: str):
+    from PIL import Image
+
+    img = Image.open(BytesIO(content))
+    img.save(path)
+
+
+class SBIService:
+    """
+    Асинхронный клиент API СБИС.
+
+    Все вызовы идут через один httpx.AsyncClient с keep-alive пулом
+    соединений (и HTTP/2, если установлен h2), ограничены семафором
+    `max_concurrency` и имеют собственные таймауты. Клиент и адреса
+    СБИС можно передать в конструктор, чтобы подменить сервер в тестах.
+    """
+
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        auth: Optional[AuthorizationData] = None,
+        oauth_url: str = SBIS_OAUTH_URL,
+        api_url: str = SBIS_API_URL,
+        max_concurrency: int = SBIS_MAX_CONCURRENCY,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self._client = client
+        self._owns_client = client is None
+        self._auth = auth
+        self.oauth_url = oauth_url
+        self.api_url = api_url.rstrip('/')
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.breaker = breaker or CircuitBreaker(
+            "sbis",
+            window=SBIS_BREAKER_WINDOW,
+            min_calls=SBIS_BREAKER_MIN_CALLS,
+            failure_rate=SBIS_BREAKER_FAILURE_RATE,
+            slow_call_seconds=SBIS_BREAKER_SLOW_CALL,
+            open_seconds=SBIS_BREAKER_OPEN_SECONDS,
+            half_open_calls=SBIS_BREAKER_HALF_OPEN_CALLS,
+        )
+        self.token_manager = SBISTokenManager(
+            self._fetch_token, ttl=SBIS_TOKEN_TTL, refresh_margin=SBIS_TOKEN_REFRESH_MARGIN
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=SBIS_HTTP2 and _http2_available(),
+                limits=httpx.Limits(
+                    max_connections=SBIS_MAX_CONNECTIONS,
+                    max_keepalive_connections=SBIS_MAX_CONNECTIONS,
+                    keepalive_expiry=60,
+                ),
+                timeout=httpx.Timeout(SBIS_TIMEOUT),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None and self._owns_client:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_token(self, data: AuthorizationData) -> TokenValidation:
+        json = {"app_client_id": f'{data.app_client_id}', "app_secret": f"{data.app_secret}", "secret_key": f"{data.app_secret_key}"}
+        response = await self._send("POST", self.oauth_url, json=json, timeout=SBIS_TIMEOUT)
+        response.encoding = 'utf-8'
+        if response.status_code != 200:
+            # Неверные ключи приложения и т.п.: 4xx не сбой предохранителя, но и не токен
+            raise SBISError(f"SBIS authorization failed: {response.status_code}, {response.text[:200]}")
+        try:
+            return TokenValidation(**response.json())
+        except (ValueError, TypeError) as e:
+            raise SBISError(f"SBIS authorization returned no token: {response.text[:200]}") from e
+
+    async def get_point_id(self, token: Optional[TokenValidation] = None) -> dict:
+        parameters = {
+            'withPhones': 'true',
+            'withPrices': 'true'
+        }
+        response = await self._get('/point/list', token, params=parameters)
+        return response.json()
+
+    async def get_price_lists(self, token: Optional[TokenValidation], point_id: int) -> dict:
+        parameters = {
+            'pointId': point_id,
+            # Время магазина: по той же дате SBISResolver сбрасывает кэш прайс-листов
+            'actualDate': f'{datetime.now(ZoneInfo(SALES_TIMEZONE)).strftime("%Y-%m-%d %H:%M:%S")}'
+        }
+        response = await self._get('/nomenclature/price-list', token, params=parameters)
+        return response.json()
+
+    async def get_balances(self, price_list_id: int, token: Optional[TokenValidation] = None) -> Dict[int, float]:
+        """
+        Остатки по прайс-листу без выгрузки номенклатуры: id → остаток
+        (по всем складам)
+        """
+        response = await self._get('/nomenclature/balances', token, params={'priceLists': price_list_id})
+        balances: Dict[int, float] = {}
+        for entry in response.json().get('balances') or []:
+            nomenclature = entry.get('nomenclature')
+            if nomenclature is None or entry.get('balance') is None:
+                continue
+            balances[nomenclature] = balances.get(nomenclature, 0) + entry['balance']
+        return balances
+
+    async def get_foods(self, request: FoodsRequest, token: Optional[TokenValidation] = None) -> dict:
+        nomenclatures = []
+        async for page in self.iter_foods(request, token):
+            nomenclatures.extend(page)
+        return {"nomenclatures": nomenclatures}
+
+    async def iter_foods(
+        self,
+        request: FoodsRequest,
+        token: Optional[TokenValidation] = None,
+        concurrency: int = SBIS_PAGE_CONCURRENCY,
+    ) -> AsyncIterator[List[dict]]:
+        """
+        Постраничная выгрузка номенклатуры.
+
+        Одновременно запрашивается до `concurrency` страниц, страницы
+        отдаются по порядку сразу по готовности, так что вызывающий код
+        обрабатывает начало списка, пока догружается хвост.
+        """
+        pending = deque()
+        next_page = request.page or 0
+
+        def launch():
+            nonlocal next_page
+            page_request = request.model_copy(update={"page": next_page})
+            pending.append(asyncio.create_task(self._get_foods_page(page_request, token)))
+            next_page += 1
+
+        for _ in range(max(concurrency, 1)):
+            launch()
+        try:
+            while pending:
+                items, has_more = await pending.popleft()
+                if items:
+                    yield items
+                if not has_more:
+                    break
+                launch()
+        finally:
+            # Страницы за концом списка уже не нужны
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _get_foods_page(self, request: FoodsRequest, token: Optional[TokenValidation]) -> Tuple[List[dict], bool]:
+        parameters = request.model_dump(exclude_none=True)
+        response = await self._get('/nomenclature/list', token, params=parameters, timeout=SBIS_LIST_TIMEOUT)
+        data = response.json()
+        items = data.get('nomenclatures') or []
+        outcome = data.get('outcome') or {}
+        has_more = outcome.get('hasMore', len(items) >= (request.pageSize or 0) > 0)
+        return items, bool(has_more)
+
+    async def _image_response(self, token, image) -> httpx.Response:
+        headers = {
+            "Content-Type": "application/json; charset=utf-8",
+            "Accept": "image/*",
+        }
+        replaced = image.replace("/img?params=", "")
+        params = {
+            "params": replaced
+        }
+        return await self._get('/img', token, params=params, headers=headers)
+
+    async def fetch_image(self, image: str, token: Optional[TokenValidation] = None) -> bytes:
+        """
+        Байты картинки по ссылке вида /img?params=...
+        """
+        response = await self._image_response(token, image)
+        if response.status_code != 200:
+            raise SBISError(f"Error while reading image: {response.status_code}")
+        return response.content
+
+    async def get_image(self, token, image, name):
+        response = await self._image_response(token, image)
+
+        if response.status_code == 200:
+            try:
+                # Декодирование и сохранение картинки не должны блокировать event loop
+                await asyncio.to_thread(_save_image, response.content, f"images/{name}.png")
+                return f"Image saved as {name}.png"
+            except Exception as e:
+                return f"Failed to process image: {str(e)}"
+        else:
+            return f"Error while reading response: {response.status_code}, {response.text}"
+
+    async def _get(
+        self,
+        path: str,
+        token: Optional[TokenValidation],
+        params: dict,
+        headers: Optional[dict] = None,
+        timeout: float = SBIS_TIMEOUT,
+    ) -> httpx.Response:
+        """
+        GET к API СБИС: на 401 токен обновляется ровно один раз и запрос повторяется
+        """
+        if token is None:
+            token = await self.token_manager.get_token()
+        url = f"{self.api_url}{path}"
+        response = await self._send("GET", url, params=params, headers=self._headers(token, headers), timeout=timeout)
+        if response.status_code == 401:
+            token = await self.token_manager.invalidate(token)
+            response = await self._send("GET", url, params=params, headers=self._headers(token, headers), timeout=timeout)
+        return response
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Запрос через предохранитель: сетевые ошибки, 5xx, 429 и медленные
+        ответы учитываются как сбои, при разомкнутом предохранителе запрос
+        сразу завершается SBISUnavailable вместо ожидания таймаута
+        """
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError as e:
+            raise SBISUnavailable(str(e), self.breaker.retry_after) from e
+        success = None
+        try:
+            async with self._semaphore:
+                # Время в очереди к своему же семафору — не задержка СБИС
+                started = time.monotonic()
+                try:
+                    response = await self.client.request(method, url, **kwargs)
+                except httpx.HTTPError as e:
+                    success = False
+                    raise SBISError(f"SBIS request failed: {e!r}") from e
+                success = response.status_code < 500 and response.status_code != 429
+        finally:
+            if success is None:
+                # Отменён, в том числе в очереди к семафору: ни успех, ни сбой
+                self.breaker.release()
+            else:
+                self.breaker.record(success, time.monotonic() - started)
+        if not success:
+            raise SBISError(f"SBIS responded {response.status_code}")
+        return response
+
+    @staticmethod
+    def _headers(token: TokenValidation, headers: Optional[dict] = None) -> dict:
+        return {**(headers or {}), "X-SBISAccessToken": f"{token.access_token}"}
+
+    async def _fetch_token(self) -> TokenValidation:
+        auth = self._auth or AuthorizationData(
+            app_client_id=APP_CLIENT_ID or '',
+            app_secret=APP_SECRET or '',
+            app_secret_key=APP_SECRET_KEY or ''
+        )
+        return await self.get_token(auth)
+
+
+# Общий на процесс клиент СБИС
+sbis_service = SBIService()
+
+
+def get_sbis_service() -> SBIService:
+    """
+    Зависимость FastAPI; в тестах подменяется через app.dependency_overrides
+    """
+    return sbis_service
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from config import (
+    SALES_TIMEZONE,
+    SBIS_CATEGORY_PRICE_LIST,
+    SBIS_POINT,
+    SBIS_PRODUCTS_PRICE_LIST,
+    SBIS_RESOLVER_TTL,
+)
+from services.sbis import FoodsRequest, SBIService, SBISError, sbis_service
+
+logger = logging.getLogger(__name__)
+
+# Позиции в списках СБИС, которые использовались до появления настроек.
+# Остаются запасным вариантом, если id или имя не заданы.
+LEGACY_POINT_INDEX = 0
+LEGACY_PRICE_LIST_INDEX = {"products": 3, "categories": 1}
+
+_warned = set()
+
+
+def select_entry(entries: List[dict], selector: Optional[str], fallback_index: int, kind: str) -> dict:
+    """
+    Выбор записи по id (если селектор — число) или по имени без учёта регистра
+    """
+    if selector:
+        selector = selector.strip()
+        if selector.isdigit():
+            found = next((e for e in entries if str(e.get("id")) == selector), None)
+        else:
+            found = next((e for e in entries if (e.get("name") or "").strip().casefold() == selector.casefold()), None)
+        if found is None:
+            raise SBISError(f"SBIS {kind} '{selector}' not found")
+        return found
+    if len(entries) <= fallback_index:
+        raise SBISError(f"SBIS {kind} list has no entry #{fallback_index}")
+    if kind not in _warned:
+        _warned.add(kind)
+        logger.warning("SBIS %s is not configured, falling back to list position %s", kind, fallback_index)
+    return entries[fallback_index]
+
+
+class SBISResolver:
+    """
+    Кэш точки продаж и прайс-листов СБИС.
+
+    Точка и прайс-листы выбираются по настроенному id или имени и
+    хранятся `ttl` секунд; прайс-листы дополнительно сбрасываются при
+    смене даты в часовом поясе магазина, так как запрашиваются на
+    actualDate. У каждого значения своя блокировка обновления: медленный
+    запрос прайс-листов не задерживает выбор точки.
+    """
+
+    def __init__(
+        self,
+        sbis: SBIService = sbis_service,
+        ttl: float = SBIS_RESOLVER_TTL,
+        point: Optional[str] = SBIS_POINT,
+        price_lists: Optional[Dict[str, Optional[str]]] = None,
+        timezone: str = SALES_TIMEZONE,
+    ):
+        self.sbis = sbis
+        self.ttl = ttl
+        self.point_selector = point
+        self.price_list_selectors = price_lists or {
+            "products": SBIS_PRODUCTS_PRICE_LIST,
+            "categories": SBIS_CATEGORY_PRICE_LIST,
+        }
+        self.timezone = ZoneInfo(timezone)
+        self._points: Optional[Tuple[float, dict]] = None
+        self._price_lists: Dict[int, Tuple[float, date, dict]] = {}
+        self._points_lock = asyncio.Lock()
+        self._price_list_locks: Dict[int, asyncio.Lock] = {}
+
+    def today(self) -> date:
+        return datetime.now(self.timezone).date()
+
+    async def points(self) -> dict:
+        """
+        Ответ /point/list из кэша
+        """
+        cached = self._points
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        async with self._points_lock:
+            cached = self._points
+            if cached is None or time.monotonic() - cached[0] >= self.ttl:
+                try:
+                    data = await self.sbis.get_point_id()
+                except SBISError as e:
+                    if cached is None:
+                        raise
+                    # stale-if-error: точки продаж меняются редко, отдаём прошлый ответ
+                    logger.warning("SBIS point list refresh failed, serving cached: %s", e)
+                    return cached[1]
+                cached = (time.monotonic(), data)
+                self._points = cached
+        return cached[1]
+
+    async def point(self) -> dict:
+        data = await self.points()
+        return select_entry(data.get('salesPoints') or [], self.point_selector, LEGACY_POINT_INDEX, "sales point")
+
+    async def price_lists(self, point_id: int) -> dict:
+        """
+        Ответ /nomenclature/price-list из кэша; сбрасывается по TTL и в полночь
+        """
+        cached = self._price_lists.get(point_id)
+        if self._fresh_price_lists(cached):
+            return cached[2]
+        async with self._price_list_locks.setdefault(point_id, asyncio.Lock()):
+            cached = self._price_lists.get(point_id)
+            if not self._fresh_price_lists(cached):
+                try:
+                    data = await self.sbis.get_price_lists(None, point_id)
+                except SBISError as e:
+                    if cached is None:
+                        raise
+                    logger.warning("SBIS price lists refresh failed, serving cached: %s", e)
+                    return cached[2]
+                cached = (time.monotonic(), self.today(), data)
+                self._price_lists[point_id] = cached
+        return cached[2]
+
+    def _fresh_price_lists(self, cached: Optional[Tuple[float, date, dict]]) -> bool:
+        return (
+            cached is not None
+            and time.monotonic() - cached[0] < self.ttl
+            and cached[1] == self.today()
+        )
+
+    async def price_list(self, role: str) -> dict:
+        point = await self.point()
+        data = await self.price_lists(point['id'])
+        return select_entry(
+            data.get('priceLists') or [],
+            self.price_list_selectors.get(role),
+            LEGACY_PRICE_LIST_INDEX.get(role, 0),
+            f"price list ({role})",
+        )
+
+    async def foods_request(self, role: str, **flags) -> FoodsRequest:
+        point = await self.point()
+        price_list = await self.price_list(role)
+        return FoodsRequest(pointId=point['id'], priceListId=price_list['id'], **flags)
+
+    def invalidate(self):
+        self._points = None
+        self._price_lists.clear()
+
+    def status(self) -> dict:
+        return {
+            "pointSelector": self.point_selector,
+            "priceListSelectors": self.price_list_selectors,
+            "pointsAge": round(time.monotonic() - self._points[0], 3) if self._points else None,
+            "priceListsCached": len(self._price_lists),
+        }
+
+
+sbis_resolver = SBISResolver()
+
+
+def get_sbis_resolver() -> SBISResolver:
+    return sbis_resolver
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SBISTokenManager:
+    """
+    Общий на процесс кэш OAuth-токена СБИС.
+
+    Токен переиспользуется до приближения срока жизни, за `refresh_margin`
+    секунд до истечения обновляется в фоне. Одновременные запросы ждут один
+    и тот же запрос авторизации (single-flight), а 401 от любого вызова СБИС
+    приводит ровно к одному обновлению через `invalidate`.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], Awaitable[Any]],
+        ttl: float = 3600,
+        refresh_margin: float = 300,
+    ):
+        self._fetch = fetch
+        self._ttl = ttl
+        self._refresh_margin = min(refresh_margin, ttl / 2)
+        self._token: Optional[Any] = None
+        self._expires_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def get_token(self):
+        """
+        Текущий токен; при необходимости дожидается обновления
+        """
+        now = time.monotonic()
+        if self._token is not None and now < self._expires_at:
+            if now >= self._expires_at - self._refresh_margin:
+                # Токен ещё валиден: отдаём его, а новый получаем в фоне
+                self._start_refresh()
+            return self._token
+        return await asyncio.shield(self._start_refresh())
+
+    async def invalidate(self, stale):
+        """
+        Сброс токена, на который СБИС ответил 401.
+
+        Если токен уже обновлён другим запросом, новый логин не выполняется.
+        """
+        if self._token is not None and self._token == stale:
+            self._token = None
+            self._expires_at = 0.0
+        if self._refresh_task is not None:
+            return await asyncio.shield(self._refresh_task)
+        return await self.get_token()
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh())
+            self._refresh_task.add_done_callback(self._on_refresh_done)
+        return self._refresh_task
+
+    async def _refresh(self):
+        started = time.monotonic()
+        token = await self._fetch()
+        self._token = token
+        self._expires_at = started + self._ttl
+        logger.info("SBIS token refreshed in %.3fs", time.monotonic() - started)
+        return token
+
+    def _on_refresh_done(self, task: asyncio.Task):
+        self._refresh_task = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("SBIS token refresh failed: %s", task.exception())
@@ -0,0 +1,185 @@
+import re
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Вес совпадения по полю и по типу совпадения
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+EXACT = 1.0
+PREFIX = 0.7
+FUZZY = 0.5
+MIN_SIMILARITY = 0.35
+CACHE_SIZE = 1024
+
+
+def normalize(text: Optional[str]) -> str:
+    """
+    Нормализация для поиска: регистр, ё → е
+    """
+    if not text:
+        return ""
+    return text.casefold().replace("ё", "е")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return TOKEN_RE.findall(normalize(text))
+
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PrefixTrie:
+    """
+    Префиксное дерево словаря: в каждом узле лежат товары всех терминов
+    с этим началом, поэтому автодополнение — один проход по буквам
+    """
+
+    def __init__(self):
+        self._root: dict = {}
+
+    def insert(self, term: str, postings: Dict[int, float]):
+        node = self._root
+        for char in term:
+            node = node.setdefault(char, {"": {}})
+            docs = node[""]
+            for doc, weight in postings.items():
+                if docs.get(doc, 0) < weight:
+                    docs[doc] = weight
+
+    def docs(self, prefix: str) -> Dict[int, float]:
+        node = self._root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return {}
+        return node.get("", {})
+
+
+class SearchIndex:
+    """
+    Поисковый индекс по товарам снимка каталога.
+
+    Строится один раз на снимок: обратный индекс термин → товары с
+    весом поля, префиксное дерево для автодополнения и триграммы
+    словаря для нечёткого поиска. Все токены запроса должны найтись
+    в товаре (точно, по префиксу или с опечаткой); ранжирование —
+    по сумме весов совпадений.
+    """
+
+    def __init__(self, products: Iterable[dict]):
+        self.products: List[dict] = list(products)
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.names: List[str] = []
+        self.trie = PrefixTrie()
+        self._trigrams: Dict[str, Set[str]] = {}
+
+        for doc, product in enumerate(self.products):
+            self.names.append(" ".join(tokenize(product.get("name"))))
+            for field, weight in ((product.get("description"), DESCRIPTION_WEIGHT), (product.get("name"), NAME_WEIGHT)):
+                for term in tokenize(field):
+                    postings = self.postings.setdefault(term, {})
+                    if postings.get(doc, 0) < weight:
+                        postings[doc] = weight
+        for term, postings in self.postings.items():
+            self.trie.insert(term, postings)
+            for gram in trigrams(term):
+                self._trigrams.setdefault(gram, set()).add(term)
+        # При равной релевантности выше короткие названия, затем по алфавиту
+        order = sorted(range(len(self.names)), key=lambda doc: (len(self.names[doc]), self.names[doc]))
+        self._rank = [0] * len(order)
+        for rank, doc in enumerate(order):
+            self._rank[doc] = rank
+        self._cache: "OrderedDict[str, List[dict]]" = OrderedDict()
+
+    def _fuzzy_terms(self, token: str) -> List[Tuple[str, float]]:
+        grams = trigrams(token)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for term in self._trigrams.get(gram, ()):
+                shared[term] = shared.get(term, 0) + 1
+        result = []
+        for term, count in shared.items():
+            similarity = 2 * count / (len(grams) + len(trigrams(term)))
+            if similarity >= MIN_SIMILARITY:
+                result.append((term, similarity))
+        return result
+
+    def _match_token(self, token: str, prefix: bool) -> Dict[int, float]:
+        """
+        Товары, в которых найден токен, с лучшим весом совпадения
+        """
+        scores: Dict[int, float] = {}
+
+        def add(postings: Dict[int, float], kind: float):
+            for doc, weight in postings.items():
+                score = weight * kind
+                if score > scores.get(doc, 0):
+                    scores[doc] = score
+
+        if prefix:
+            add(self.trie.docs(token), PREFIX)
+        exact = self.postings.get(token)
+        if exact:
+            add(exact, EXACT)
+        if not scores and len(token) >= 3:
+            for term, similarity in self._fuzzy_terms(token):
+                add(self.postings[term], FUZZY * similarity)
+        return scores
+
+    def search(self, query: str) -> List[dict]:
+        """
+        Товары по запросу в порядке релевантности; результат кэшируется
+        на время жизни снимка
+        """
+        phrase = " ".join(tokenize(query))
+        cached = self._cache.get(phrase)
+        if cached is not None:
+            self._cache.move_to_end(phrase)
+            return cached
+        found = self._search(phrase)
+        self._cache[phrase] = found
+        if len(self._cache) > CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return found
+
+    def _search(self, phrase: str) -> List[dict]:
+        tokens = phrase.split()
+        if not tokens:
+            return []
+        scores: Optional[Dict[int, float]] = None
+        for position, token in enumerate(tokens):
+            # Последнее слово пользователь может ещё не допечатать
+            matched = self._match_token(token, prefix=len(token) >= 2 or position == len(tokens) - 1)
+            if scores is None:
+                scores = matched
+            else:
+                scores = {doc: score + matched[doc] for doc, score in scores.items() if doc in matched}
+            if not scores:
+                return []
+
+        names = self.names
+        rank = self._rank
+        for doc in scores:
+            if names[doc].startswith(phrase):
+                scores[doc] += NAME_WEIGHT
+        ranked = sorted(scores, key=lambda doc: (-scores[doc], rank[doc]))
+        return [self.products[doc] for doc in ranked]
+
+    def suggest(self, query: str, limit: int = 10) -> List[str]:
+        """
+        Названия товаров для автодополнения
+        """
+        seen = set()
+        names = []
+        for product in self.search(query):
+            name = product.get("name")
+            if name not in seen:
+                seen.add(name)
+                names.append(name)
+                if len(names) >= limit:
+                    break
+        return names
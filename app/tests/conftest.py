@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def session_maker():
+    """
+    Сессии внутри внешней транзакции: commit() в коде фиксирует
+    точку сохранения, в конце теста всё откатывается
+    """
+    if not os.environ.get("DB_HOST"):
+        pytest.skip("DB_HOST не задан: тесты с Postgres пропущены")
+    from sqlalchemy import delete
+    from sqlalchemy.exc import DBAPIError
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from auth.database import DATABASE_URL
+    from models.models import OrderOutbox
+
+    engine = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    try:
+        conn = await engine.connect()
+    except (OSError, DBAPIError) as e:
+        await engine.dispose()
+        pytest.skip(f"Postgres недоступен: {e}")
+    transaction = await conn.begin()
+    # Relay забирает все готовые строки таблицы — в тесте только свои
+    await conn.execute(delete(OrderOutbox))
+    try:
+        yield async_sessionmaker(
+            bind=conn, class_=AsyncSession, expire_on_commit=False, join_transaction_mode="create_savepoint"
+        )
+    finally:
+        await transaction.rollback()
+        await conn.close()
+        await engine.dispose()
@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services.availability import AvailabilityTracker
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeSBIS:
+    def __init__(self, listed, balances):
+        self.listed = listed
+        self.balances = balances
+        self.listings = 0
+        self.balance_calls = 0
+
+    async def get_balances(self, price_list_id):
+        self.balance_calls += 1
+        return dict(self.balances)
+
+    async def iter_foods(self, request):
+        self.listings += 1
+        assert request["noStopList"] is False
+        yield [{"id": nomenclature, "cost": 100} for nomenclature in self.listed]
+
+
+class FakeResolver:
+    def __init__(self, sbis):
+        self.sbis = sbis
+
+    async def price_list(self, role):
+        return {"id": 7}
+
+    async def foods_request(self, role, **flags):
+        return flags
+
+
+def snapshot(*items):
+    return SimpleNamespace(items=[{"id": nomenclature, "cost": 100, "balance": balance} for nomenclature, balance in items])
+
+
+def make_tracker(sbis) -> AvailabilityTracker:
+    return AvailabilityTracker(catalog=None, resolver=FakeResolver(sbis), interval=0, policy="reject")
+
+
+def order(*ids):
+    return [{"id": nomenclature, "foodName": str(nomenclature), "count": 2} for nomenclature in ids]
+
+
+async def test_stop_list_is_listed_once_per_snapshot():
+    sbis = FakeSBIS(listed=[1, 2, 3], balances={1: 5})
+    tracker = make_tracker(sbis)
+    tracker.seed(snapshot((1, 5), (2, None)))
+    await tracker._stop_list_task
+    for _ in range(3):
+        await tracker.poll()
+    assert sbis.listings == 1
+    assert sbis.balance_calls == 3
+    assert [problem["reason"] for problem in tracker.check(order(3))] == ["stop_list"]
+
+
+async def test_poll_updates_balances_only():
+    sbis = FakeSBIS(listed=[1, 2], balances={1: 1, 99: 10})
+    tracker = make_tracker(sbis)
+    tracker.seed(snapshot((1, 5), (2, None)))
+    await tracker._stop_list_task
+    await tracker.poll()
+    assert tracker.balance(1) == 1
+    # Товара нет в снимке — опрос остатков не добавляет его в продажу
+    assert tracker.balance(99) is None
+    problems = tracker.check(order(1, 2, 12345))
+    assert [(problem["id"], problem["reason"]) for problem in problems] == [(1, "out_of_stock")]
+
+
+async def test_new_snapshot_replaces_stop_list():
+    sbis = FakeSBIS(listed=[1, 2], balances={})
+    tracker = make_tracker(sbis)
+    tracker.seed(snapshot((1, None)))
+    await tracker._stop_list_task
+    assert tracker.check(order(2))[0]["reason"] == "stop_list"
+    # Позицию вернули в продажу: она есть в следующем снимке
+    tracker.seed(snapshot((1, None), (2, None)))
+    assert tracker.check(order(2)) == []
+    await tracker._stop_list_task
+    assert tracker.check(order(2)) == []
+    await tracker.stop()
+
+
+async def test_failed_stop_list_keeps_previous():
+    sbis = FakeSBIS(listed=[1, 2], balances={})
+    tracker = make_tracker(sbis)
+    tracker.seed(snapshot((1, None)))
+    await tracker._stop_list_task
+
+    async def broken(request):
+        raise ConnectionError("sbis is down")
+        yield
+
+    sbis.iter_foods = broken
+    tracker.seed(snapshot((1, None)))
+    await tracker._stop_list_task
+    assert tracker.last_error == "sbis is down"
+    assert tracker.check(order(2))[0]["reason"] == "stop_list"
@@ -0,0 +1,83 @@
+from services.category_tree import CategoryTree
+
+ITEMS = [
+    {"hierarchicalId": 2110, "hierarchicalParent": None, "name": "Меню", "cost": None},
+    {"hierarchicalId": 1, "hierarchicalParent": 2110, "name": "Супы", "cost": None},
+    {"hierarchicalId": 11, "hierarchicalParent": 1, "name": "Острые", "cost": None},
+    {"hierarchicalId": 2, "hierarchicalParent": 2110, "name": "Напитки", "cost": None},
+    {"hierarchicalId": 2382, "hierarchicalParent": 2110, "name": "Служебное", "cost": None},
+    {"hierarchicalId": 23, "hierarchicalParent": 2382, "name": "Упаковка", "cost": None},
+    # Позиция с ценой, у которой есть вложенные (модификаторы), тоже категория
+    {"hierarchicalId": 3, "hierarchicalParent": 2110, "name": "Сет", "cost": 900},
+    {"hierarchicalId": 31, "hierarchicalParent": 3, "name": "Соус к сету", "cost": 0},
+    {"hierarchicalId": 101, "hierarchicalParent": 11, "name": "Кимчи-суп", "cost": 350},
+    {"hierarchicalId": 102, "hierarchicalParent": 2110, "name": "Хлеб", "cost": 50},
+]
+PRODUCTS = [
+    {"id": 101, "name": "Кимчи-суп", "category": 11},
+    {"id": 102, "name": "Хлеб", "category": 2110},
+    {"id": 201, "name": "Пакет", "category": 23},
+    {"id": 202, "name": "Морс", "category": 2},
+]
+
+
+def make_tree() -> CategoryTree:
+    return CategoryTree(ITEMS, PRODUCTS, excluded=[2382])
+
+
+def names(items):
+    return [item["name"] for item in items]
+
+
+def test_categories_are_folders_and_items_with_children():
+    tree = make_tree()
+    assert set(tree.nodes) == {2110, 1, 11, 2, 2382, 23, 3}
+
+
+def test_child_categories_hide_excluded_subtree():
+    tree = make_tree()
+    assert names(tree.child_categories(2110)) == ["Супы", "Напитки", "Сет"]
+    assert tree.is_excluded(2382)
+    assert tree.is_excluded(23)
+    assert not tree.is_excluded(11)
+
+
+def test_products_belong_to_every_ancestor():
+    tree = make_tree()
+    assert names(tree.subtree_products(11)) == ["Кимчи-суп"]
+    assert names(tree.subtree_products(1)) == ["Кимчи-суп"]
+    assert names(tree.subtree_products(2110)) == ["Кимчи-суп", "Хлеб", "Морс"]
+    assert tree.subtree_products(2382) == []
+
+
+def test_breadcrumbs():
+    tree = make_tree()
+    assert tree.breadcrumbs(11) == [
+        {"id": 2110, "name": "Меню"},
+        {"id": 1, "name": "Супы"},
+        {"id": 11, "name": "Острые"},
+    ]
+    assert tree.breadcrumbs(23) is None
+    assert tree.breadcrumbs(999) is None
+
+
+def test_nested_counts_subtree_products():
+    tree = make_tree()
+    nested = tree.nested(2110)
+    assert [(node["id"], node["productCount"]) for node in nested] == [(1, 1), (2, 1), (3, 0)]
+    assert nested[0]["children"] == [{"id": 11, "name": "Острые", "productCount": 1, "children": []}]
+
+
+def test_cycle_does_not_loop():
+    items = [
+        {"hierarchicalId": 1, "hierarchicalParent": 2, "cost": None},
+        {"hierarchicalId": 2, "hierarchicalParent": 1, "cost": None},
+    ]
+    tree = CategoryTree(items, [{"id": 5, "category": 1}])
+    assert tree.paths[1] == [2, 1]
+    assert tree.nested(1) == [{"id": 2, "name": None, "productCount": 1, "children": []}]
+
+
+def test_legacy_items_without_hierarchical_id_use_id():
+    tree = CategoryTree([{"id": 7, "hierarchicalParent": None, "cost": None, "name": "Старая"}], [])
+    assert names(tree.child_categories(None)) == ["Старая"]
@@ -0,0 +1,119 @@
+import pytest
+
+from services import circuit_breaker
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+def make_breaker(**kwargs) -> CircuitBreaker:
+    options = dict(window=10, min_calls=4, failure_rate=0.5, slow_call_seconds=1.0, open_seconds=30, half_open_calls=2)
+    options.update(kwargs)
+    return CircuitBreaker("sbis", **options)
+
+
+def call(breaker: CircuitBreaker, success: bool = True, duration: float = 0.1):
+    breaker.before_call()
+    breaker.record(success, duration)
+
+
+def test_stays_closed_below_min_calls(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        call(breaker, success=False)
+    assert breaker.state == CLOSED
+
+
+def test_opens_at_failure_rate(clock):
+    breaker = make_breaker()
+    call(breaker)
+    call(breaker)
+    call(breaker, success=False)
+    assert breaker.state == CLOSED
+    call(breaker, success=False)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.rejected == 1
+    assert breaker.retry_after == 30
+
+
+def test_slow_calls_count_as_failures(clock):
+    breaker = make_breaker()
+    for _ in range(4):
+        call(breaker, duration=1.5)
+    assert breaker.state == OPEN
+
+
+def test_old_outcomes_leave_the_window(clock):
+    breaker = make_breaker(window=4)
+    call(breaker, success=False)
+    for _ in range(10):
+        call(breaker)
+    call(breaker, success=False)
+    assert breaker.state == CLOSED
+    assert breaker.status()["failureRate"] == 0.25
+
+
+def test_half_open_closes_after_successful_probes(clock):
+    breaker = make_breaker()
+    for _ in range(4):
+        call(breaker, success=False)
+    clock.now += 30
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(True, 0.1)
+    assert breaker.state == HALF_OPEN
+    breaker.record(True, 0.1)
+    assert breaker.state == CLOSED
+    assert breaker.status()["calls"] == 0
+
+
+def test_half_open_failure_reopens(clock):
+    breaker = make_breaker()
+    for _ in range(4):
+        call(breaker, success=False)
+    clock.now += 30
+    call(breaker, success=False)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_released_probes_are_retried(clock):
+    breaker = make_breaker()
+    for _ in range(4):
+        call(breaker, success=False)
+    clock.now += 30
+    breaker.before_call()
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    # Пробный вызов отменён: слот освобождается сразу, без ожидания
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_release_when_closed_changes_nothing(clock):
+    breaker = make_breaker()
+    breaker.before_call()
+    breaker.release()
+    assert breaker.status()["calls"] == 0
+    assert breaker.state == CLOSED
@@ -0,0 +1,23 @@
+from services.etag import etag_matches
+
+ETAG = '"abc"'
+
+
+def test_etag_missing_header():
+    assert not etag_matches(None, ETAG)
+    assert not etag_matches("", ETAG)
+
+
+def test_etag_exact_and_weak():
+    assert etag_matches('"abc"', ETAG)
+    assert etag_matches('W/"abc"', ETAG)
+
+
+def test_etag_list_and_wildcard():
+    assert etag_matches('"x", W/"abc" , "y"', ETAG)
+    assert etag_matches(" * ", ETAG)
+
+
+def test_etag_mismatch():
+    assert not etag_matches('"abcd"', ETAG)
+    assert not etag_matches('abc', ETAG)
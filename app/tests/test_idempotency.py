@@ -0,0 +1,166 @@
+import asyncio
+import json
+
+import pytest
+from redis.exceptions import ConnectionError
+
+from services.idempotency import DONE, IdempotencyKeyReused, IdempotencyStore, IdempotencyUnavailable
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeRedis:
+    """
+    Строки с TTL по часам event loop и скрипт продления ключа
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.expires = {}
+        self.failing_sets = 0
+        self.down = False
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def _alive(self, key):
+        if key in self.expires and self.expires[key] <= self._now():
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+        return self.values.get(key)
+
+    async def set(self, key, value, nx=False, ex=None):
+        if self.down:
+            raise ConnectionError("connection refused")
+        if self.failing_sets and not nx:
+            self.failing_sets -= 1
+            raise ConnectionError("connection reset")
+        if nx and self._alive(key) is not None:
+            return None
+        self.values[key] = value
+        self.expires[key] = self._now() + ex
+        return True
+
+    async def get(self, key):
+        return self._alive(key)
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+        self.expires.pop(key, None)
+
+    async def ttl(self, key):
+        return int(self.expires[key] - self._now()) if self._alive(key) is not None else -2
+
+    def register_script(self, script):
+        async def extend(keys, args):
+            if self._alive(keys[0]) != args[0]:
+                return 0
+            self.expires[keys[0]] = self._now() + args[1]
+            return 1
+        return extend
+
+
+def make_store(redis: FakeRedis, **kwargs) -> IdempotencyStore:
+    options = dict(ttl=3600, lock_ttl=0.3, wait=0.05)
+    options.update(kwargs)
+    return IdempotencyStore(redis, **options)
+
+
+async def test_replays_stored_response():
+    redis = FakeRedis()
+    store = make_store(redis)
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        return 200, {"order": 1}
+
+    first = await store.run("order", "k", "f", handler)
+    second = await store.run("order", "k", "f", handler)
+    assert (first.body, first.replayed) == ({"order": 1}, False)
+    assert (second.body, second.replayed) == ({"order": 1}, True)
+    assert calls == [1]
+
+
+async def test_rejects_key_with_other_request():
+    store = make_store(FakeRedis())
+
+    async def handler():
+        return 200, {}
+
+    await store.run("order", "k", "f", handler)
+    with pytest.raises(IdempotencyKeyReused):
+        await store.run("order", "k", "other", handler)
+
+
+async def test_server_error_is_not_stored():
+    redis = FakeRedis()
+    store = make_store(redis)
+
+    async def handler():
+        return 503, {"detail": "unavailable"}
+
+    await store.run("order", "k", "f", handler)
+    assert await redis.get("idempotency:order:k") is None
+
+
+async def test_lock_is_extended_while_handler_runs():
+    redis = FakeRedis()
+    store = make_store(redis)
+
+    async def handler():
+        # Втрое дольше lock_ttl: без продления ключ бы освободился
+        await asyncio.sleep(0.9)
+        return 200, {"order": 1}
+
+    task = asyncio.create_task(store.run("order", "k", "f", handler))
+    await asyncio.sleep(0.6)
+    stored = json.loads(await redis.get("idempotency:order:k"))
+    assert stored["state"] == "pending"
+    await task
+    assert store.metrics["extended"] >= 2
+
+
+async def test_response_write_is_retried():
+    redis = FakeRedis()
+    redis.failing_sets = 2
+    store = make_store(redis, lock_ttl=5)
+
+    async def handler():
+        return 200, {"order": 1}
+
+    response = await store.run("order", "k", "f", handler)
+    assert response.body == {"order": 1}
+    stored = json.loads(await redis.get("idempotency:order:k"))
+    assert stored["state"] == DONE
+    assert store.metrics["saveRetries"] == 2
+
+
+async def test_unsaved_response_is_still_returned():
+    redis = FakeRedis()
+    redis.failing_sets = 100
+    store = make_store(redis, lock_ttl=0.2)
+
+    async def handler():
+        return 200, {"order": 1}
+
+    response = await store.run("order", "k", "f", handler)
+    assert response.body == {"order": 1}
+    assert store.metrics["unsaved"] == 1
+
+
+async def test_redis_down_rejects_request_without_running_it():
+    redis = FakeRedis()
+    redis.down = True
+    store = make_store(redis)
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        return 200, {"order": 1}
+
+    with pytest.raises(IdempotencyUnavailable) as error:
+        await store.run("order", "k", "f", handler)
+    assert error.value.retry_after > 0
+    assert calls == []
+    assert store.metrics["unavailable"] == 1
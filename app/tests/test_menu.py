@@ -0,0 +1,85 @@
+import asyncio
+import os
+
+import pytest
+
+if not os.environ.get("DB_HOST"):
+    pytest.skip("DB_HOST не задан: тесты с Postgres пропущены", allow_module_level=True)
+
+from redis.exceptions import ConnectionError
+
+from services import menu
+from services.menu import MenuCache
+
+
+class FakeRedis:
+    def __init__(self):
+        self.version = None
+        self.down = False
+
+    async def get(self, key):
+        if self.down:
+            raise ConnectionError("connection refused")
+        return self.version
+
+    async def incr(self, key):
+        if self.down:
+            raise ConnectionError("connection refused")
+        self.version = str(int(self.version or 0) + 1)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(menu.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.mark.anyio
+async def test_menu_is_cached_per_version(session_maker):
+    redis = FakeRedis()
+    cache = MenuCache(redis, session_maker)
+    first = await cache.get()
+    assert await cache.get() is first
+    await cache.invalidate()
+    await cache.get()
+    assert cache.metrics["builds"] == 2
+    assert cache.metrics["hits"] == 1
+
+
+@pytest.mark.anyio
+async def test_redis_down_serves_last_menu_for_stale_ttl(session_maker, clock):
+    redis = FakeRedis()
+    cache = MenuCache(redis, session_maker, stale_ttl=5)
+    first = await cache.get()
+    redis.down = True
+    assert await cache.get() is first
+    clock[0] += 6
+    second = await cache.get()
+    assert second is not first and second.etag == first.etag
+    assert await cache.get() is second
+    assert cache.metrics["builds"] == 2
+    assert cache.metrics["staleHits"] == 2
+
+
+@pytest.mark.anyio
+async def test_redis_down_builds_without_lock(session_maker, clock):
+    redis = FakeRedis()
+    redis.down = True
+    cache = MenuCache(redis, session_maker, stale_ttl=5)
+    async with cache._lock:
+        # Запрос не ждёт блокировку, которую держит сборка по версии
+        built = await asyncio.wait_for(cache.get(), 5)
+    assert built.body.startswith(b"[")
+
+
+@pytest.mark.anyio
+async def test_invalidate_drops_stale_menu(session_maker, clock):
+    redis = FakeRedis()
+    cache = MenuCache(redis, session_maker, stale_ttl=5)
+    await cache.get()
+    redis.down = True
+    await cache.invalidate()
+    await cache.get()
+    assert cache.metrics["builds"] == 2
+    assert cache.metrics["staleHits"] == 0
@@ -0,0 +1,105 @@
+import asyncio
+
+import httpx
+import pytest
+
+from services.notifications import DeliveryFailed, PermanentError, TelegramNotifier
+
+pytestmark = pytest.mark.anyio
+
+
+def make_notifier(*responses) -> TelegramNotifier:
+    replies = list(responses)
+
+    def reply(request: httpx.Request) -> httpx.Response:
+        return replies.pop(0) if len(replies) > 1 else replies[0]
+
+    client = httpx.AsyncClient(base_url="https://telegram.test", transport=httpx.MockTransport(reply))
+    return TelegramNotifier(
+        bots={"client": "token"}, workers=1, retry_base=0.01, dead_letter_path=None,
+        client=client, global_rate=1000, chat_rate=1000,
+    )
+
+
+async def test_send_waits_for_telegram():
+    notifier = make_notifier(httpx.Response(200, json={"ok": True}))
+    notification = await notifier.send(1, "Заказ принят")
+    assert notification.attempts == 1
+    assert notifier.metrics["sent"] == 1
+    await notifier.stop()
+
+
+async def test_send_does_not_retry_transient_errors():
+    notifier = make_notifier(httpx.Response(502, text="Bad Gateway"), httpx.Response(200, json={"ok": True}))
+    with pytest.raises(DeliveryFailed, match="502"):
+        await notifier.send(1, "Заказ принят")
+    # Повтор — забота вызывающего, в dead-letter сообщение не попадает
+    assert notifier.metrics["retried"] == 0
+    assert notifier.metrics["failed"] == 1
+    assert not notifier.dead
+    await notifier.stop()
+
+
+async def test_send_dead_letters_permanent_errors():
+    notifier = make_notifier(httpx.Response(403, json={"description": "bot was blocked by the user"}))
+    with pytest.raises(PermanentError, match="blocked"):
+        await notifier.send(1, "Заказ принят")
+    assert len(notifier.dead) == 1
+    await notifier.stop()
+
+
+async def test_send_fails_when_queue_is_full():
+    notifier = make_notifier(httpx.Response(200, json={"ok": True}))
+    notifier.queue_size = 0
+    with pytest.raises(DeliveryFailed, match="queue is full"):
+        await notifier.send(1, "Заказ принят")
+    assert not notifier.dead
+    await notifier.stop()
+
+
+async def test_enqueue_still_retries():
+    notifier = make_notifier(httpx.Response(502, text="Bad Gateway"), httpx.Response(200, json={"ok": True}))
+    notifier.enqueue(1, "Заказ принят")
+    await notifier.stop()
+    assert notifier.metrics["retried"] == 1
+    assert notifier.metrics["sent"] == 1
+
+
+async def test_cancelled_send_leaves_queue():
+    notifier = make_notifier(httpx.Response(200, json={"ok": True}))
+    notifier.chat_rate = 0.001
+    await notifier.send(1, "первое")
+    # Второе сообщение ждёт остывания чата; отмена убирает его из очереди
+    task = asyncio.create_task(notifier.send(1, "второе"))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert notifier.status()["queueDepth"] == 0
+    await notifier.stop()
+
+
+async def test_awaited_sends_are_digested_together():
+    notifier = make_notifier(httpx.Response(200, json={"ok": True}))
+    notifier.digest_threshold = 3
+    await notifier.send(1, "первое", digestible=True)
+    # Чат остывает, три заказа копятся в дорожке и уходят одной сводкой
+    notifier._chat_bucket(("client", 1)).block(0.05)
+    sends = [notifier.send(1, f"заказ {i}", digestible=True) for i in range(3)]
+    await asyncio.gather(*sends)
+    assert notifier.metrics["digests"] == 1
+    assert notifier.metrics["sent"] == 4
+    await notifier.stop()
+
+
+async def test_failed_digest_fails_every_sender():
+    notifier = make_notifier(httpx.Response(200, json={"ok": True}), httpx.Response(502, text="Bad Gateway"))
+    notifier.digest_threshold = 2
+    await notifier.send(1, "первое", digestible=True)
+    notifier._chat_bucket(("client", 1)).block(0.05)
+    results = await asyncio.gather(
+        *(notifier.send(1, f"заказ {i}", digestible=True) for i in range(2)), return_exceptions=True
+    )
+    assert [type(result) for result in results] == [DeliveryFailed, DeliveryFailed]
+    assert not notifier.dead
+    await notifier.stop()
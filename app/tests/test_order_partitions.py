@@ -0,0 +1,83 @@
+import gzip
+import json
+import os
+
+import pytest
+
+if not os.environ.get("DB_HOST"):
+    pytest.skip("DB_HOST не задан: тесты с Postgres пропущены", allow_module_level=True)
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from auth.database import DATABASE_URL
+from services.order_partitions import OrderPartitionManager, add_months, partition_month
+
+pytestmark = pytest.mark.anyio
+
+PARTITION = "order_p2001_01"
+
+
+def test_add_months_crosses_year():
+    assert str(add_months(partition_month("order_p2024_11"), 3)) == "2025-02-01"
+    assert partition_month("order_default") is None
+
+
+@pytest.fixture
+async def engine():
+    """
+    Архивация фиксирует DDL сама, поэтому тест работает с настоящими
+    транзакциями и убирает за собой секцию и строки order_item
+    """
+    engine = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    try:
+        async with engine.connect():
+            pass
+    except (OSError, DBAPIError) as e:
+        await engine.dispose()
+        pytest.skip(f"Postgres недоступен: {e}")
+    try:
+        yield engine
+    finally:
+        async with engine.begin() as conn:
+            if await conn.scalar(text("SELECT to_regclass(:name)"), {"name": PARTITION}) is not None:
+                await conn.execute(text(f'DELETE FROM order_item WHERE "orderId" IN (SELECT id FROM "{PARTITION}")'))
+                await conn.execute(text(f'DROP TABLE "{PARTITION}"'))
+        await engine.dispose()
+
+
+async def test_archive_writes_json_columns_once(engine, tmp_path):
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            f'CREATE TABLE "{PARTITION}" PARTITION OF "order" '
+            "FOR VALUES FROM ('2001-01-01 UTC') TO ('2001-02-01 UTC')"
+        ))
+        order_id = await conn.scalar(text("""
+            INSERT INTO "order" (number, items, total, state, "createdAt")
+            VALUES (7, ARRAY['{"id": 1, "foodName": "Борщ", "count": 2}'::json], 500, 'delivered', '2001-01-15 12:00+00')
+            RETURNING id
+        """))
+        await conn.execute(text("""
+            INSERT INTO order_item ("orderId", "foodId", "foodName", count, price)
+            VALUES (:order_id, 1, 'Борщ', 2, 250)
+        """), {"order_id": order_id})
+        await conn.execute(text(f'ALTER TABLE "order" DETACH PARTITION "{PARTITION}"'))
+
+    manager = OrderPartitionManager(db=engine, archive_dir=str(tmp_path))
+    async with engine.connect() as conn:
+        assert await manager.archive_detached(conn) == [PARTITION]
+
+    with gzip.open(tmp_path / f"{PARTITION}.ndjson.gz", "rt", encoding="utf-8") as archive:
+        rows = [json.loads(line) for line in archive]
+    assert len(rows) == 1
+    row = rows[0]
+    assert (row["id"], row["number"], row["state"]) == (order_id, 7, "delivered")
+    assert row["items"] == [{"id": 1, "foodName": "Борщ", "count": 2}]
+    assert [(line["foodName"], line["count"], line["price"]) for line in row["lines"]] == [("Борщ", 2, 250)]
+    assert manager.metrics["archivedRows"] == 1
+
+    async with engine.connect() as conn:
+        assert await conn.scalar(text("SELECT to_regclass(:name)"), {"name": PARTITION}) is None
+        assert await conn.scalar(text('SELECT count(*) FROM order_item WHERE "orderId" = :id'), {"id": order_id}) == 0
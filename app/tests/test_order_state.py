@@ -0,0 +1,148 @@
+import os
+
+import pytest
+
+if not os.environ.get("DB_HOST"):
+    pytest.skip("DB_HOST не задан: тесты с Postgres пропущены", allow_module_level=True)
+
+from sqlalchemy import select
+
+from models.models import FoodSalesDaily, Order, OrderOutbox
+from services.order_state import (
+    ACCEPTED,
+    ACTIVE_STATES,
+    COOKING,
+    DECLINED,
+    DELIVERED,
+    NEW,
+    READY,
+    STATES,
+    TRANSITIONS,
+    InvalidTransition,
+    OrderNotFound,
+    change_state,
+    sources,
+)
+from services.outbox import TOPIC_ORDER_EVENT, TOPIC_TELEGRAM, insert_order_with_outbox, jsonb
+from services.sales import order_lines, sales_day
+
+FOOD_ID = 987654322
+
+HAPPY_PATH = [NEW, ACCEPTED, COOKING, READY, DELIVERED]
+
+
+def test_states_match_check_constraint():
+    constraint = next(c for c in Order.__table__.constraints if c.name == "order_state_check")
+    assert set(STATES) == {state.strip(" '") for state in str(constraint.sqltext).split("(")[1].rstrip(")").split(",")}
+
+
+def test_transitions_lead_to_known_states():
+    for targets in TRANSITIONS.values():
+        assert targets <= set(STATES)
+
+
+def test_happy_path_is_allowed():
+    for current, target in zip(HAPPY_PATH, HAPPY_PATH[1:]):
+        assert target in TRANSITIONS[current]
+
+
+def test_final_states_have_no_transitions():
+    assert TRANSITIONS[DELIVERED] == frozenset()
+    assert TRANSITIONS[DECLINED] == frozenset()
+    assert DELIVERED not in ACTIVE_STATES and DECLINED not in ACTIVE_STATES
+
+
+def test_decline_only_before_cooking():
+    assert sources(DECLINED) == [NEW, ACCEPTED]
+
+
+def test_no_state_moves_back():
+    for index, state in enumerate(HAPPY_PATH):
+        assert not TRANSITIONS[state] & set(HAPPY_PATH[:index + 1])
+
+
+def test_invalid_transition_lists_allowed_targets():
+    error = InvalidTransition(NEW, READY)
+    assert error.allowed == [ACCEPTED, DECLINED]
+    assert InvalidTransition(None, "lost").allowed == []
+
+
+async def create_order(session_maker) -> int:
+    items = [{"id": FOOD_ID, "foodName": "Плов", "count": 3, "price": 200}]
+    order = {"number": 77, "items": items, "total": 600, "state": NEW}
+    async with session_maker() as session:
+        query = insert_order_with_outbox(order, [(TOPIC_TELEGRAM, jsonb({}))], order_lines(items))
+        result = await session.execute(query)
+        order_id = result.scalars().first()
+        await session.commit()
+    return order_id
+
+
+async def state_of(session_maker, order_id: int) -> str:
+    async with session_maker() as session:
+        return await session.scalar(select(Order.state).where(Order.id == order_id))
+
+
+@pytest.mark.anyio
+async def test_change_state_writes_event(session_maker):
+    order_id = await create_order(session_maker)
+    async with session_maker() as session:
+        assert await change_state(session, order_id, ACCEPTED, reason="ok") == {"id": order_id, "state": ACCEPTED}
+    assert await state_of(session_maker, order_id) == ACCEPTED
+    async with session_maker() as session:
+        events = (await session.execute(
+            select(OrderOutbox.topic, OrderOutbox.payload)
+            .where(OrderOutbox.orderId == order_id, OrderOutbox.topic == TOPIC_ORDER_EVENT)
+        )).all()
+    assert [tuple(event) for event in events] == [
+        (TOPIC_ORDER_EVENT, {"reason": "ok", "client": None, "state": ACCEPTED, "number": 77}),
+    ]
+
+
+@pytest.mark.anyio
+async def test_change_state_rejects_skipped_step(session_maker):
+    order_id = await create_order(session_maker)
+    async with session_maker() as session:
+        with pytest.raises(InvalidTransition) as error:
+            await change_state(session, order_id, READY)
+    assert (error.value.current, error.value.allowed) == (NEW, [ACCEPTED, DECLINED])
+    assert await state_of(session_maker, order_id) == NEW
+
+
+@pytest.mark.anyio
+async def test_change_state_rejects_unknown_state(session_maker):
+    order_id = await create_order(session_maker)
+    async with session_maker() as session:
+        with pytest.raises(InvalidTransition):
+            await change_state(session, order_id, "lost")
+
+
+@pytest.mark.anyio
+async def test_change_state_unknown_order(session_maker):
+    async with session_maker() as session:
+        with pytest.raises(OrderNotFound):
+            await change_state(session, -1, ACCEPTED)
+
+
+@pytest.mark.anyio
+async def test_second_identical_transition_fails(session_maker):
+    order_id = await create_order(session_maker)
+    async with session_maker() as session:
+        await change_state(session, order_id, ACCEPTED)
+    async with session_maker() as session:
+        with pytest.raises(InvalidTransition) as error:
+            await change_state(session, order_id, ACCEPTED)
+    assert error.value.current == ACCEPTED
+
+
+@pytest.mark.anyio
+async def test_decline_subtracts_sales(session_maker):
+    order_id = await create_order(session_maker)
+    async with session_maker() as session:
+        await change_state(session, order_id, DECLINED)
+    async with session_maker() as session:
+        sales = (await session.execute(
+            select(FoodSalesDaily.count, FoodSalesDaily.revenue, FoodSalesDaily.orders)
+            .where(FoodSalesDaily.day == sales_day(), FoodSalesDaily.foodId == FOOD_ID)
+        )).one()
+    assert tuple(sales) == (0, 0, 0)
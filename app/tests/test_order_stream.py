@@ -0,0 +1,50 @@
+import asyncio
+import json
+
+import pytest
+
+from services.order_stream import OrderStreamConsumer
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeRedis:
+    def __init__(self):
+        self.acked = []
+
+    async def xack(self, stream, group, *ids):
+        self.acked.extend(ids)
+
+
+def entry(entry_id, order_id):
+    return entry_id, {"order_id": str(order_id), "data": json.dumps({"number": order_id})}
+
+
+async def test_only_delivered_entries_are_acked():
+    async def handler(order_id, data):
+        if order_id == "2":
+            raise ConnectionError("telegram is down")
+
+    redis = FakeRedis()
+    consumer = OrderStreamConsumer(redis, handler, consumer="test")
+    await consumer._handle([entry("1-0", 1), entry("2-0", 2), ("3-0", None), ("4-0", {"data": "{"})])
+    assert sorted(redis.acked) == ["1-0", "3-0", "4-0"]
+    assert (consumer.processed, consumer.failed) == (1, 1)
+
+
+async def test_batch_is_handled_concurrently():
+    running = 0
+    peak = 0
+
+    async def handler(order_id, data):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    redis = FakeRedis()
+    consumer = OrderStreamConsumer(redis, handler, consumer="test")
+    await consumer._handle([entry(f"{i}-0", i) for i in range(5)])
+    assert peak == 5
+    assert len(redis.acked) == 5
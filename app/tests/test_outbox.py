@@ -0,0 +1,248 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+if not os.environ.get("DB_HOST"):
+    pytest.skip("DB_HOST не задан: тесты с Postgres пропущены", allow_module_level=True)
+
+from sqlalchemy import func, select
+
+from models.models import FoodSalesDaily, Order, OrderItem, OrderOutbox
+from services import outbox
+from services.notifications import DeliveryFailed, TelegramNotifier
+from services.outbox import OutboxRelay, insert_order_with_outbox, jsonb
+from services.sales import order_lines, sales_day
+
+pytestmark = pytest.mark.anyio
+
+FOOD_ID = 987654321
+
+
+async def create_order(session_maker, events) -> int:
+    items = [
+        {"id": FOOD_ID, "foodName": "Борщ", "count": 2, "price": 250},
+        {"foodName": "Хлеб", "count": 1, "price": 30},
+    ]
+    order = {"number": 4242, "items": items, "total": 530, "state": "new"}
+    async with session_maker() as session:
+        result = await session.execute(insert_order_with_outbox(order, events, order_lines(items)))
+        order_id = result.scalars().first()
+        await session.commit()
+    return order_id
+
+
+async def test_order_outbox_and_lines_in_one_statement(session_maker):
+    order_id = await create_order(session_maker, [
+        ("telegram", jsonb({"chatId": 1, "text": "Заказ принят"})),
+        ("order.event", jsonb({"state": "new"})),
+    ])
+    async with session_maker() as session:
+        order = (await session.execute(select(Order).where(Order.id == order_id))).scalar_one()
+        assert (order.number, order.total, order.state) == (4242, 530, "new")
+
+        events = (await session.execute(
+            select(OrderOutbox.topic, OrderOutbox.payload, OrderOutbox.attempts)
+            .where(OrderOutbox.orderId == order_id)
+            .order_by(OrderOutbox.id)
+        )).all()
+        assert [tuple(event) for event in events] == [
+            ("telegram", {"chatId": 1, "text": "Заказ принят"}, 0),
+            ("order.event", {"state": "new"}, 0),
+        ]
+
+        lines = (await session.execute(
+            select(OrderItem.foodId, OrderItem.foodName, OrderItem.count, OrderItem.price)
+            .where(OrderItem.orderId == order_id)
+            .order_by(OrderItem.id)
+        )).all()
+        assert [tuple(line) for line in lines] == [(FOOD_ID, "Борщ", 2, 250), (None, "Хлеб", 1, 30)]
+
+        sales = (await session.execute(
+            select(FoodSalesDaily.count, FoodSalesDaily.revenue, FoodSalesDaily.orders)
+            .where(FoodSalesDaily.day == sales_day(), FoodSalesDaily.foodId == FOOD_ID)
+        )).one()
+        assert tuple(sales) == (2, 500, 1)
+
+
+async def test_sales_summary_accumulates(session_maker):
+    await create_order(session_maker, [("order.event", jsonb({}))])
+    await create_order(session_maker, [("order.event", jsonb({}))])
+    async with session_maker() as session:
+        sales = (await session.execute(
+            select(FoodSalesDaily.count, FoodSalesDaily.revenue, FoodSalesDaily.orders)
+            .where(FoodSalesDaily.day == sales_day(), FoodSalesDaily.foodId == FOOD_ID)
+        )).one()
+    assert tuple(sales) == (4, 1000, 2)
+
+
+async def test_relay_deletes_published_and_backs_off_failed(session_maker):
+    published = []
+
+    async def publish(order_id, payload):
+        published.append((order_id, payload))
+
+    async def fail(order_id, payload):
+        raise ConnectionError("telegram is down")
+
+    order_id = await create_order(session_maker, [
+        ("order.event", jsonb({"state": "new"})),
+        ("telegram", jsonb({"chatId": 1, "text": "Заказ принят"})),
+    ])
+    relay = OutboxRelay({"order.event": publish, "telegram": fail}, session_maker=session_maker, retry_base=60)
+
+    assert await relay.relay_once() == 2
+    assert published == [(order_id, {"state": "new"})]
+    assert relay.metrics["published"] == 1
+    assert relay.metrics["failed"] == 1
+
+    async with session_maker() as session:
+        rows = (await session.execute(
+            select(OrderOutbox.topic, OrderOutbox.attempts, OrderOutbox.lastError, OrderOutbox.availableAt > func.now())
+            .where(OrderOutbox.orderId == order_id)
+        )).all()
+    assert [tuple(row) for row in rows] == [("telegram", 1, "telegram is down", True)]
+
+    # Отложенная строка не видна до availableAt
+    assert await relay.relay_once() == 0
+
+
+async def test_relay_retries_failed_row_when_due(session_maker):
+    calls = []
+
+    async def flaky(order_id, payload):
+        calls.append(order_id)
+        if len(calls) == 1:
+            raise ConnectionError("telegram is down")
+
+    order_id = await create_order(session_maker, [("telegram", jsonb({"chatId": 1, "text": "Заказ принят"}))])
+    relay = OutboxRelay({"telegram": flaky}, session_maker=session_maker)
+
+    assert await relay.relay_once() == 1
+    async with session_maker() as session:
+        await session.execute(
+            OrderOutbox.__table__.update()
+            .where(OrderOutbox.orderId == order_id)
+            .values(availableAt=func.now())
+        )
+        await session.commit()
+
+    assert await relay.relay_once() == 1
+    assert calls == [order_id, order_id]
+    async with session_maker() as session:
+        remaining = await session.scalar(select(func.count()).where(OrderOutbox.orderId == order_id))
+    assert remaining == 0
+
+
+async def test_unknown_topic_stays_in_outbox(session_maker):
+    order_id = await create_order(session_maker, [("unknown", jsonb({}))])
+    relay = OutboxRelay({}, session_maker=session_maker)
+
+    assert await relay.relay_once() == 1
+    async with session_maker() as session:
+        error = await session.scalar(select(OrderOutbox.lastError).where(OrderOutbox.orderId == order_id))
+    assert error == "no handler for topic 'unknown'"
+
+
+
+async def test_row_is_dead_after_max_attempts(session_maker):
+    async def fail(order_id, payload):
+        raise ValueError("bad payload")
+
+    order_id = await create_order(session_maker, [("order.event", jsonb({}))])
+    relay = OutboxRelay({"order.event": fail}, session_maker=session_maker, retry_base=0, max_attempts=2)
+
+    assert await relay.relay_once() == 1
+    assert await relay.relay_once() == 1
+    assert relay.metrics["dead"] == 1
+    # Мёртвая строка больше не выбирается и не попадает в лаг
+    assert await relay.relay_once() == 0
+    async with session_maker() as session:
+        row = (await session.execute(
+            select(OrderOutbox.attempts, OrderOutbox.deadAt.is_not(None)).where(OrderOutbox.orderId == order_id)
+        )).one()
+    assert tuple(row) == (2, True)
+    assert relay.status()["lag"]["p50"] is None
+
+
+async def test_batch_handlers_run_concurrently(session_maker):
+    running = []
+    peak = [0]
+
+    async def publish(order_id, payload):
+        running.append(order_id)
+        peak[0] = max(peak[0], len(running))
+        await asyncio.sleep(0.05)
+        running.remove(order_id)
+
+    await create_order(session_maker, [("order.event", jsonb({}))])
+    await create_order(session_maker, [("order.event", jsonb({}))])
+    relay = OutboxRelay({"order.event": publish}, session_maker=session_maker)
+
+    assert await relay.relay_once() == 2
+    assert peak[0] == 2
+    assert relay.metrics["published"] == 2
+
+
+async def test_order_events_keep_their_order(session_maker):
+    published = []
+
+    async def publish(order_id, payload):
+        await asyncio.sleep(0.01 * (3 - payload["step"]))
+        published.append(payload["step"])
+
+    await create_order(session_maker, [("order.event", jsonb({"step": step})) for step in range(3)])
+    relay = OutboxRelay({"order.event": publish}, session_maker=session_maker)
+
+    assert await relay.relay_once() == 3
+    assert published == [0, 1, 2]
+
+
+async def test_telegram_lane_does_not_hold_other_topics(session_maker):
+    release = asyncio.Event()
+    published = []
+
+    async def slow_telegram(order_id, payload):
+        await release.wait()
+
+    async def publish(order_id, payload):
+        published.append(order_id)
+
+    order_id = await create_order(session_maker, [
+        ("telegram", jsonb({"chatId": 1, "text": "Заказ принят"})),
+        ("order.event", jsonb({"state": "new"})),
+    ])
+    relay = OutboxRelay(
+        {"telegram": slow_telegram, "order.event": publish},
+        session_maker=session_maker, lanes={"telegram": ("telegram",), "default": None},
+    )
+
+    telegram = asyncio.create_task(relay.relay_once("telegram"))
+    await asyncio.sleep(0.05)
+    # Отправка в Telegram ещё ждёт, а событие заказа уже опубликовано
+    assert await asyncio.wait_for(relay.relay_once("default"), 5) == 1
+    assert published == [order_id]
+    release.set()
+    assert await telegram == 1
+
+
+def make_notifier(response: httpx.Response) -> TelegramNotifier:
+    client = httpx.AsyncClient(base_url="https://telegram.test", transport=httpx.MockTransport(lambda request: response))
+    return TelegramNotifier(bots={"client": "token"}, workers=1, dead_letter_path=None, client=client)
+
+
+async def test_outbox_handler_raises_on_transient_error(monkeypatch):
+    notifier = make_notifier(httpx.Response(502, text="Bad Gateway"))
+    monkeypatch.setattr(outbox, "notifier", notifier)
+    with pytest.raises(DeliveryFailed):
+        await outbox.send_telegram(1, {"chatId": 1, "text": "Заказ принят"})
+    await notifier.stop()
+
+
+async def test_outbox_handler_drops_permanent_error(monkeypatch):
+    notifier = make_notifier(httpx.Response(400, json={"description": "chat not found"}))
+    monkeypatch.setattr(outbox, "notifier", notifier)
+    await outbox.send_telegram(1, {"chatId": 1, "text": "Заказ принят"})
+    assert len(notifier.dead) == 1
+    await notifier.stop()
@@ -0,0 +1,71 @@
+import asyncio
+
+import httpx
+import pytest
+
+from services.circuit_breaker import CLOSED, HALF_OPEN, CircuitBreaker
+from services.sbis import AuthorizationData, SBISError, SBIService
+
+pytestmark = pytest.mark.anyio
+
+AUTH = AuthorizationData(app_client_id="id", app_secret="secret", app_secret_key="key")
+
+
+def make_service(handler, **kwargs) -> SBIService:
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return SBIService(client=client, auth=AUTH, oauth_url="https://sbis.test/oauth", api_url="https://sbis.test", **kwargs)
+
+
+async def test_token_parsed():
+    service = make_service(lambda request: httpx.Response(200, json={"access_token": "a", "sid": "s", "token": "t"}))
+    token = await service.get_token(AUTH)
+    assert token.access_token == "a"
+
+
+async def test_token_rejected_raises_sbis_error():
+    breaker = CircuitBreaker("sbis", min_calls=1)
+    service = make_service(lambda request: httpx.Response(401, json={"error": "invalid_client"}), breaker=breaker)
+    with pytest.raises(SBISError, match="401.*invalid_client"):
+        await service.get_token(AUTH)
+    # Неверные ключи — не сбой СБИС
+    assert breaker.state == CLOSED
+
+
+async def test_token_missing_fields_raises_sbis_error():
+    service = make_service(lambda request: httpx.Response(200, json={"error": "oops"}))
+    with pytest.raises(SBISError, match="no token"):
+        await service.get_token(AUTH)
+
+
+async def test_semaphore_wait_is_not_sbis_latency():
+    async def slow(request):
+        await asyncio.sleep(0.06)
+        return httpx.Response(200, json={})
+
+    breaker = CircuitBreaker("sbis", min_calls=1, slow_call_seconds=0.1)
+    service = make_service(slow, breaker=breaker, max_concurrency=1)
+    # Третий запрос ждёт семафор ~0.12 с, но сам СБИС отвечает за 0.06
+    await asyncio.gather(*(service._send("GET", "https://sbis.test/x") for _ in range(3)))
+    assert breaker.status()["failureRate"] == 0.0
+    assert breaker.state == CLOSED
+
+
+async def test_cancelled_probe_is_released():
+    started = asyncio.Event()
+
+    async def hang(request):
+        started.set()
+        await asyncio.sleep(10)
+
+    breaker = CircuitBreaker("sbis", min_calls=1, open_seconds=0, half_open_calls=1)
+    breaker.before_call()
+    breaker.record(False, 0)
+    service = make_service(hang, breaker=breaker)
+    task = asyncio.create_task(service._send("GET", "https://sbis.test/x"))
+    await started.wait()
+    assert breaker.state == HALF_OPEN
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    # Слот пробы свободен: следующий вызов пропускается
+    breaker.before_call()
@@ -0,0 +1,74 @@
+from services.search import SearchIndex, normalize, tokenize, trigrams
+
+PRODUCTS = [
+    {"id": 1, "name": "Кимчи суп", "description": "Острый суп с капустой"},
+    {"id": 2, "name": "Кимчи", "description": "Квашеная капуста"},
+    {"id": 3, "name": "Рамён с говядиной", "description": "Лапша, бульон"},
+    {"id": 4, "name": "Токпокки", "description": "Рисовые клёцки в остром соусе"},
+    {"id": 5, "name": "Суп из морепродуктов", "description": None},
+    {"id": 6, "name": "Морс ягодный", "description": "Клюква"},
+]
+
+
+def ids(products):
+    return [product["id"] for product in products]
+
+
+def make_index() -> SearchIndex:
+    return SearchIndex(PRODUCTS)
+
+
+def test_normalize_and_tokenize():
+    assert normalize("Ёжик В Тумане") == "ежик в тумане"
+    assert tokenize("Рамён, с говядиной!") == ["рамен", "с", "говядиной"]
+    assert normalize(None) == ""
+    assert "  к" in trigrams("кимчи")
+
+
+def test_name_match_ranks_above_description():
+    index = SearchIndex(PRODUCTS + [{"id": 8, "name": "Соус чили", "description": None}])
+    # У Токпокки «соус» только в описании
+    assert ids(index.search("соус")) == [8, 4]
+    assert ids(index.search("клюква")) == [6]
+
+
+def test_shorter_name_wins_ties():
+    assert ids(make_index().search("кимчи")) == [2, 1]
+
+
+def test_phrase_prefix_of_name_gets_bonus():
+    # «суп» есть в обоих названиях, но с него начинается только «Суп из морепродуктов»
+    assert ids(make_index().search("суп")) == [5, 1]
+    assert ids(make_index().search("суп из")) == [5]
+    assert ids(make_index().search("кимчи суп")) == [1]
+
+
+def test_all_tokens_must_match():
+    assert ids(make_index().search("кимчи лапша")) == []
+
+
+def test_prefix_completion_of_last_word():
+    assert ids(make_index().search("рам")) == [3]
+    assert ids(make_index().search("мор")) == [6, 5]
+
+
+def test_typos_and_word_forms():
+    assert ids(make_index().search("токпоки")) == [4]
+    assert ids(make_index().search("рамен")) == [3]
+    assert ids(make_index().search("капусту")) == [2, 1]
+
+
+def test_empty_query():
+    assert make_index().search("  ,. ") == []
+
+
+def test_results_are_cached_per_phrase():
+    index = make_index()
+    first = index.search("Кимчи")
+    assert index.search("кимчи") is first
+
+
+def test_suggest_returns_unique_names():
+    index = SearchIndex(PRODUCTS + [{"id": 7, "name": "Кимчи", "description": "Большая порция"}])
+    assert index.suggest("ким") == ["Кимчи", "Кимчи суп"]
+    assert index.suggest("ким", limit=1) == ["Кимчи"]
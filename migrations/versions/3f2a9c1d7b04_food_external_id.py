@@ -0,0 +1,30 @@
+"""food external id and soft delete
+
+Revision ID: 3f2a9c1d7b04
+Revises: 
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f2a9c1d7b04'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('food', sa.Column('externalId', sa.Integer(), nullable=True))
+    op.add_column('food', sa.Column('isDeleted', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+    op.create_unique_constraint('food_externalId_key', 'food', ['externalId'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('food_externalId_key', 'food', type_='unique')
+    op.drop_column('food', 'isDeleted')
+    op.drop_column('food', 'externalId')
@@ -0,0 +1,41 @@
+"""order outbox
+
+Revision ID: 8c41d5e07a13
+Revises: 3f2a9c1d7b04
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c41d5e07a13'
+down_revision: Union[str, None] = '3f2a9c1d7b04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'order_outbox',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('orderId', sa.Integer(), nullable=False),
+        sa.Column('topic', sa.String(), nullable=False),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('lastError', sa.String(), nullable=True),
+        sa.Column('createdAt', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('availableAt', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['orderId'], ['order.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('order_outbox_available_idx', 'order_outbox', ['availableAt', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('order_outbox_available_idx', table_name='order_outbox')
+    op.drop_table('order_outbox')
@@ -0,0 +1,34 @@
+"""order_outbox dead letters
+
+Revision ID: a8d3e6f0b214
+Revises: f1c7a2d94b36
+Create Date: 2026-10-20 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8d3e6f0b214'
+down_revision: Union[str, None] = 'f1c7a2d94b36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('order_outbox', sa.Column('deadAt', sa.DateTime(timezone=True), nullable=True))
+    # Relay выбирает только живые строки; отложенные навсегда в индекс не попадают
+    op.drop_index('order_outbox_available_idx', table_name='order_outbox')
+    op.create_index(
+        'order_outbox_available_idx', 'order_outbox', ['availableAt', 'id'],
+        postgresql_where=sa.text('"deadAt" IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('order_outbox_available_idx', table_name='order_outbox')
+    op.create_index('order_outbox_available_idx', 'order_outbox', ['availableAt', 'id'])
+    op.drop_column('order_outbox', 'deadAt')
@@ -0,0 +1,35 @@
+"""order state machine
+
+Revision ID: b7e2f4a91c58
+Revises: 8c41d5e07a13
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2f4a91c58'
+down_revision: Union[str, None] = '8c41d5e07a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+STATES = "('new', 'accepted', 'cooking', 'ready', 'delivered', 'declined')"
+
+
+def upgrade() -> None:
+    # Раньше state никто не вёл: прошлые заказы считаются завершёнными,
+    # иначе вся история оказалась бы на доске кухни
+    op.execute(f'UPDATE "order" SET state = \'delivered\' WHERE state IS NULL OR state NOT IN {STATES}')
+    op.alter_column('order', 'state', existing_type=sa.String(), nullable=False, server_default=sa.text("'new'"))
+    op.create_check_constraint('order_state_check', 'order', f'state IN {STATES}')
+    op.create_index('order_state_idx', 'order', ['state', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('order_state_idx', table_name='order')
+    op.drop_constraint('order_state_check', 'order', type_='check')
+    op.alter_column('order', 'state', existing_type=sa.String(), nullable=True, server_default=None)
@@ -0,0 +1,103 @@
+"""order items and daily sales rollup
+
+Revision ID: d3a6c8e15f20
+Revises: b7e2f4a91c58
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3a6c8e15f20'
+down_revision: Union[str, None] = 'b7e2f4a91c58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'order_item',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('orderId', sa.Integer(), nullable=False),
+        sa.Column('foodId', sa.Integer(), nullable=True),
+        sa.Column('foodName', sa.String(), nullable=True),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('price', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=True),
+        sa.ForeignKeyConstraint(['orderId'], ['order.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('order_item_order_idx', 'order_item', ['orderId'], unique=False)
+    op.create_index('order_item_food_day_idx', 'order_item', ['foodId', 'day'], unique=False)
+    op.create_table(
+        'food_sales_daily',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('foodId', sa.Integer(), nullable=False),
+        sa.Column('foodName', sa.String(), nullable=True),
+        sa.Column('count', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column('revenue', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column('orders', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'foodId'),
+    )
+
+    # Старые корзины и даты — произвольные строки от клиента: всё, что
+    # не разбирается, становится NULL, а не обрывает миграцию
+    op.execute("""
+        CREATE FUNCTION pg_temp.to_int(value text) RETURNS integer LANGUAGE plpgsql IMMUTABLE AS $$
+        BEGIN
+            RETURN round(value::numeric)::integer;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;
+        END $$
+    """)
+    op.execute("""
+        CREATE FUNCTION pg_temp.order_day(value text) RETURNS date LANGUAGE plpgsql IMMUTABLE AS $$
+        BEGIN
+            IF value ~ '^\\d{4}-\\d{2}-\\d{2}' THEN
+                RETURN substr(value, 1, 10)::date;
+            ELSIF value ~ '^\\d{2}\\.\\d{2}\\.\\d{4}' THEN
+                RETURN to_date(substr(value, 1, 10), 'DD.MM.YYYY');
+            END IF;
+            RETURN NULL;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;
+        END $$
+    """)
+    op.execute("""
+        INSERT INTO order_item ("orderId", "foodId", "foodName", "count", "price", "day")
+        SELECT o.id,
+               CASE WHEN json_typeof(item -> 'id') = 'number' THEN pg_temp.to_int(item ->> 'id') END,
+               item ->> 'foodName',
+               coalesce(pg_temp.to_int(item ->> 'count'), 1),
+               coalesce(pg_temp.to_int(item ->> 'price'), 0),
+               pg_temp.order_day(o.date)
+        FROM "order" o
+        CROSS JOIN LATERAL unnest(o.items) AS item
+        WHERE json_typeof(item) = 'object'
+        ORDER BY o.id
+    """)
+    # Отказанные заказы в сводку не входят — так же, как при отказе в работе
+    op.execute("""
+        INSERT INTO food_sales_daily ("day", "foodId", "foodName", "count", "revenue", "orders")
+        SELECT i.day,
+               coalesce(i."foodId", 0),
+               max(i."foodName"),
+               sum(i.count),
+               sum(i.count::bigint * i.price),
+               count(DISTINCT i."orderId")
+        FROM order_item i
+        JOIN "order" o ON o.id = i."orderId"
+        WHERE i.day IS NOT NULL AND o.state <> 'declined'
+        GROUP BY i.day, coalesce(i."foodId", 0)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('food_sales_daily')
+    op.drop_index('order_item_food_day_idx', table_name='order_item')
+    op.drop_index('order_item_order_idx', table_name='order_item')
+    op.drop_table('order_item')
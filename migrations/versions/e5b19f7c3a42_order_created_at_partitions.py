@@ -0,0 +1,154 @@
+"""order createdAt and monthly partitions
+
+Revision ID: e5b19f7c3a42
+Revises: d3a6c8e15f20
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.config import ORDER_PARTITIONS_AHEAD, SALES_TIMEZONE
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b19f7c3a42'
+down_revision: Union[str, None] = 'd3a6c8e15f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = '"id", "number", "items", "total", "date", "address", "state", "isDelivery", "payment", "comment", "client", "cutlery"'
+STATES = "('new', 'accepted', 'cooking', 'ready', 'delivered', 'declined')"
+
+
+def upgrade() -> None:
+    # Уникальный ключ секционированной таблицы обязан включать ключ
+    # секционирования, поэтому внешний ключ на один order.id невозможен:
+    # строки order_item и order_outbox чистят удаление пользователя и архивация
+    op.execute('ALTER TABLE order_outbox DROP CONSTRAINT "order_outbox_orderId_fkey"')
+    op.execute('ALTER TABLE order_item DROP CONSTRAINT "order_item_orderId_fkey"')
+    op.execute('ALTER TABLE "order" RENAME TO order_legacy')
+    op.execute('ALTER INDEX order_pkey RENAME TO order_legacy_pkey')
+    op.execute('ALTER INDEX order_state_idx RENAME TO order_legacy_state_idx')
+
+    op.execute(f"""
+        CREATE TABLE "order" (
+            "id" integer NOT NULL DEFAULT nextval('order_id_seq'),
+            "number" integer,
+            "items" json[],
+            "total" integer,
+            "date" varchar,
+            "address" varchar,
+            "state" varchar NOT NULL DEFAULT 'new',
+            "isDelivery" boolean,
+            "payment" varchar,
+            "comment" varchar,
+            "client" integer REFERENCES "user" (id),
+            "cutlery" integer,
+            "createdAt" timestamptz NOT NULL DEFAULT now(),
+            CONSTRAINT order_pkey PRIMARY KEY ("id", "createdAt"),
+            CONSTRAINT order_state_check CHECK (state IN {STATES})
+        ) PARTITION BY RANGE ("createdAt")
+    """)
+    op.execute('ALTER SEQUENCE order_id_seq OWNED BY "order".id')
+    op.execute('CREATE INDEX order_state_idx ON "order" (state, id)')
+    op.execute('CREATE INDEX order_created_idx ON "order" ("createdAt")')
+    # Строки вне созданных месяцев не теряются, а ждут здесь
+    op.execute('CREATE TABLE order_default PARTITION OF "order" DEFAULT')
+
+    # date — строка от клиента в местном времени магазина. Что не
+    # разбирается, получает время ближайшего предыдущего заказа по id
+    # (id растут вместе со временем), затем следующего, затем now()
+    op.execute("""
+        CREATE FUNCTION pg_temp.order_time(value text, zone text) RETURNS timestamptz LANGUAGE plpgsql STABLE AS $$
+        BEGIN
+            IF value ~ '^\\d{4}-\\d{2}-\\d{2}.*([+-]\\d{2}(:?\\d{2})?|Z)$' THEN
+                RETURN value::timestamptz;
+            ELSIF value ~ '^\\d{4}-\\d{2}-\\d{2}' THEN
+                RETURN value::timestamp AT TIME ZONE zone;
+            ELSIF value ~ '^\\d{2}\\.\\d{2}\\.\\d{4} \\d{1,2}:\\d{2}' THEN
+                RETURN to_timestamp(value, 'DD.MM.YYYY HH24:MI')::timestamp AT TIME ZONE zone;
+            ELSIF value ~ '^\\d{2}\\.\\d{2}\\.\\d{4}' THEN
+                RETURN to_date(substr(value, 1, 10), 'DD.MM.YYYY')::timestamp AT TIME ZONE zone;
+            END IF;
+            RETURN NULL;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;
+        END $$
+    """)
+    op.execute(f"""
+        CREATE TEMPORARY TABLE order_created ON COMMIT DROP AS
+        SELECT id,
+               coalesce(
+                   parsed,
+                   max(parsed) OVER (ORDER BY id ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW),
+                   min(parsed) OVER (ORDER BY id ROWS BETWEEN CURRENT ROW AND UNBOUNDED FOLLOWING),
+                   now()
+               ) AS "createdAt"
+        FROM (SELECT id, pg_temp.order_time(date, '{SALES_TIMEZONE}') AS parsed FROM order_legacy) AS legacy
+    """)
+    # Месячные секции по местному времени: от самого старого заказа до
+    # ORDER_PARTITIONS_AHEAD месяцев вперёд
+    op.execute(f"""
+        DO $$
+        DECLARE
+            month date;
+        BEGIN
+            FOR month IN
+                SELECT generate_series(
+                    date_trunc('month', coalesce(min("createdAt"), now()) AT TIME ZONE '{SALES_TIMEZONE}'),
+                    date_trunc('month', now() AT TIME ZONE '{SALES_TIMEZONE}') + interval '{ORDER_PARTITIONS_AHEAD} months',
+                    interval '1 month'
+                )::date
+                FROM order_created
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF "order" FOR VALUES FROM (%L) TO (%L)',
+                    'order_p' || to_char(month, 'YYYY_MM'),
+                    month || ' {SALES_TIMEZONE}',
+                    (month + interval '1 month')::date || ' {SALES_TIMEZONE}'
+                );
+            END LOOP;
+        END $$
+    """)
+    op.execute(f"""
+        INSERT INTO "order" ({COLUMNS}, "createdAt")
+        SELECT {', '.join(f'o.{name}' for name in COLUMNS.split(', '))}, c."createdAt"
+        FROM order_legacy o
+        JOIN order_created c ON c.id = o.id
+    """)
+    op.execute('DROP TABLE order_legacy')
+    op.execute('ANALYZE "order"')
+
+
+def downgrade() -> None:
+    op.execute('ALTER TABLE "order" RENAME TO order_partitioned')
+    op.execute('ALTER INDEX order_pkey RENAME TO order_partitioned_pkey')
+    op.execute('ALTER INDEX order_state_idx RENAME TO order_partitioned_state_idx')
+    op.execute(f"""
+        CREATE TABLE "order" (
+            "id" integer NOT NULL DEFAULT nextval('order_id_seq'),
+            "number" integer,
+            "items" json[],
+            "total" integer,
+            "date" varchar,
+            "address" varchar,
+            "state" varchar NOT NULL DEFAULT 'new',
+            "isDelivery" boolean,
+            "payment" varchar,
+            "comment" varchar,
+            "client" integer REFERENCES "user" (id),
+            "cutlery" integer,
+            CONSTRAINT order_pkey PRIMARY KEY ("id"),
+            CONSTRAINT order_state_check CHECK (state IN {STATES})
+        )
+    """)
+    op.execute(f'INSERT INTO "order" ({COLUMNS}) SELECT {COLUMNS} FROM order_partitioned')
+    op.execute('ALTER SEQUENCE order_id_seq OWNED BY "order".id')
+    op.execute('DROP TABLE order_partitioned')
+    op.execute('CREATE INDEX order_state_idx ON "order" (state, id)')
+    op.execute('DELETE FROM order_item WHERE "orderId" NOT IN (SELECT id FROM "order")')
+    op.execute('DELETE FROM order_outbox WHERE "orderId" NOT IN (SELECT id FROM "order")')
+    op.create_foreign_key('order_item_orderId_fkey', 'order_item', 'order', ['orderId'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('order_outbox_orderId_fkey', 'order_outbox', 'order', ['orderId'], ['id'], ondelete='CASCADE')
@@ -0,0 +1,32 @@
+"""food SBIS category and image source
+
+Revision ID: f1c7a2d94b36
+Revises: e5b19f7c3a42
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c7a2d94b36'
+down_revision: Union[str, None] = 'e5b19f7c3a42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('food', sa.Column('externalCategory', sa.Integer(), nullable=True))
+    op.add_column('food', sa.Column('externalImage', sa.String(), nullable=True))
+    # Синхронизация писала hierarchicalParent СБИС в category при каждом
+    # прогоне, так что у строк с externalId там id СБИС, а не локальной категории
+    op.execute('UPDATE food SET "externalCategory" = category, category = NULL WHERE "externalId" IS NOT NULL')
+
+
+def downgrade() -> None:
+    op.execute('UPDATE food SET category = "externalCategory" WHERE "externalId" IS NOT NULL AND category IS NULL')
+    op.drop_column('food', 'externalImage')
+    op.drop_column('food', 'externalCategory')
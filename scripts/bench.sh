@@ -0,0 +1,29 @@
+#!/usr/bin/env bash
+
+set -e
+set -x
+
+# Замена СБИС + приложение + нагрузочный прогон /sbis
+# Параметры bench_sbis.py передаются как есть: bash scripts/bench.sh --duration 30 --baseline bench.json
+
+STANDIN_PORT=${STANDIN_PORT:-8100}
+APP_PORT=${APP_PORT:-8001}
+
+python scripts/sbis_standin.py --port "$STANDIN_PORT" --latency "${SBIS_LATENCY:-40}" --jitter "${SBIS_JITTER:-20}" --error-rate "${SBIS_ERROR_RATE:-0}" &
+STANDIN_PID=$!
+(
+    cd app
+    SBIS_OAUTH_URL="http://127.0.0.1:$STANDIN_PORT/oauth/service/" \
+    SBIS_API_URL="http://127.0.0.1:$STANDIN_PORT/retail" \
+    SBIS_HTTP2=0 IMAGE_WARM=0 \
+    exec uvicorn app:app --port "$APP_PORT" --log-level warning
+) &
+APP_PID=$!
+trap 'kill $APP_PID $STANDIN_PID 2>/dev/null' EXIT
+
+for _ in $(seq 50); do
+    curl -sf "http://127.0.0.1:$APP_PORT/sbis/health" >/dev/null && break
+    sleep 0.2
+done
+
+python scripts/bench_sbis.py --base-url "http://127.0.0.1:$APP_PORT" "$@"
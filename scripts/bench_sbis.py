@@ -0,0 +1,162 @@
+"""
+Нагрузочный прогон эндпоинтов /sbis.
+
+Держит фиксированное число одновременных запросов к запущенному
+приложению и выводит по каждому эндпоинту пропускную способность и
+задержки p50/p95/p99. С --baseline сравнивает p99 с прошлым прогоном
+и завершается с кодом 1 при регрессии; с --max-p99 — при превышении
+абсолютного порога.
+
+    python scripts/bench_sbis.py --base-url http://127.0.0.1:8001 --concurrency 32 --duration 20 --out bench.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(q / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class Scenario:
+    """
+    Набор запросов: id категорий и товаров берутся из самого приложения
+    """
+
+    def __init__(self, categories: List[int], products: List[int]):
+        self.categories = categories or [0]
+        self.products = products or [0]
+
+    def next(self) -> tuple:
+        roll = random.random()
+        if roll < 0.25:
+            return "categories", "/sbis/categories"
+        if roll < 0.45:
+            return "sbis-products", "/sbis/sbis-products"
+        if roll < 0.7:
+            return "sbis-products?categoryId", f"/sbis/sbis-products?categoryId={random.choice(self.categories)}"
+        return "sbis-product/{id}", f"/sbis/sbis-product/{random.choice(self.products)}"
+
+
+async def discover(client: httpx.AsyncClient) -> Scenario:
+    categories = (await client.get("/sbis/categories", timeout=120)).json()
+    products = (await client.get("/sbis/sbis-products", timeout=120)).json()
+    return Scenario(
+        [item.get("hierarchicalId", item.get("id")) for item in categories],
+        [item["id"] for item in products],
+    )
+
+
+async def run(args) -> Dict[str, dict]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        scenario = await discover(client)
+        samples: Dict[str, List[float]] = {}
+        errors: Dict[str, int] = {}
+        measuring = False
+
+        async def worker(deadline: float):
+            while time.monotonic() < deadline:
+                name, url = scenario.next()
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                elapsed = time.perf_counter() - started
+                if not measuring:
+                    continue
+                if ok:
+                    samples.setdefault(name, []).append(elapsed)
+                else:
+                    errors[name] = errors.get(name, 0) + 1
+
+        if args.warmup > 0:
+            await asyncio.gather(*(worker(time.monotonic() + args.warmup) for _ in range(args.concurrency)))
+        measuring = True
+        started = time.monotonic()
+        await asyncio.gather(*(worker(started + args.duration) for _ in range(args.concurrency)))
+        elapsed = time.monotonic() - started
+
+    report = {}
+    for name in sorted(set(samples) | set(errors)):
+        values = sorted(samples.get(name, []))
+        report[name] = {
+            "requests": len(values),
+            "errors": errors.get(name, 0),
+            "rps": round(len(values) / elapsed, 1),
+            "p50": round(percentile(values, 50) * 1000, 2),
+            "p95": round(percentile(values, 95) * 1000, 2),
+            "p99": round(percentile(values, 99) * 1000, 2),
+            "max": round(values[-1] * 1000, 2) if values else 0.0,
+        }
+    return report
+
+
+def print_report(report: Dict[str, dict]):
+    header = f"{'endpoint':28} {'req':>8} {'err':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, row in report.items():
+        print(
+            f"{name:28} {row['requests']:>8} {row['errors']:>6} {row['rps']:>9} "
+            f"{row['p50']:>9} {row['p95']:>9} {row['p99']:>9} {row['max']:>9}"
+        )
+
+
+def check(report: Dict[str, dict], args) -> List[str]:
+    failures = []
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    for name, row in report.items():
+        if row["errors"] and row["errors"] / (row["errors"] + row["requests"]) > args.max_error_rate:
+            failures.append(f"{name}: error rate {row['errors']}/{row['errors'] + row['requests']}")
+        if args.max_p99 and row["p99"] > args.max_p99:
+            failures.append(f"{name}: p99 {row['p99']} ms > {args.max_p99} ms")
+        previous = baseline.get(name)
+        if previous and row["p99"] > previous["p99"] * (1 + args.tolerance):
+            failures.append(f"{name}: p99 {row['p99']} ms vs baseline {previous['p99']} ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8001")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20, help="длительность замера, с")
+    parser.add_argument("--warmup", type=float, default=3, help="прогрев без учёта результатов, с")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--out", help="сохранить отчёт в JSON")
+    parser.add_argument("--baseline", help="отчёт прошлого прогона для сравнения p99")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимый рост p99 относительно baseline")
+    parser.add_argument("--max-p99", type=float, default=0, help="абсолютный порог p99, мс")
+    parser.add_argument("--max-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    failures = check(report, args)
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Локальная замена СБИС для разработки и нагрузочных тестов.
+
+Отдаёт записанные ответы из scripts/fixtures/sbis для эндпоинтов,
+которыми пользуется приложение: oauth, /point/list,
+/nomenclature/price-list, /nomenclature/list (постранично),
+/nomenclature/balances и /img. Задержка и ошибки настраиваются
+флагами. В режиме --record запросы проксируются в настоящий СБИС,
+а ответы сохраняются как новые фикстуры.
+
+    python scripts/sbis_standin.py --port 8100 --latency 40 --jitter 20 --error-rate 0.02
+
+Приложение направляется на замену через окружение:
+
+    SBIS_OAUTH_URL=http://127.0.0.1:8100/oauth/service/
+    SBIS_API_URL=http://127.0.0.1:8100/retail
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import random
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "sbis")
+UPSTREAM_OAUTH = "https://online.sbis.ru/oauth/service/"
+UPSTREAM_API = "https://api.sbis.ru/retail"
+
+
+class Fixtures:
+    """
+    Файлы фикстур: по одному JSON на эндпоинт, картинки — по хешу params
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._cache = {}
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def load(self, name: str):
+        if name not in self._cache:
+            with open(self.path(name), encoding="utf-8") as f:
+                self._cache[name] = json.load(f)
+        return self._cache[name]
+
+    def save(self, name: str, data):
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        with open(self.path(name), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        self._cache[name] = data
+
+    def image(self, params: str) -> Optional[bytes]:
+        path = self.path(os.path.join("img", hashlib.sha256(params.encode()).hexdigest()[:40]))
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return f.read()
+        return None
+
+    def save_image(self, params: str, content: bytes):
+        directory = self.path("img")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, hashlib.sha256(params.encode()).hexdigest()[:40]), "wb") as f:
+            f.write(content)
+
+
+def placeholder_image(params: str) -> bytes:
+    """
+    Картинка-заглушка, если в фикстурах нет записанной
+    """
+    from PIL import Image
+
+    seed = int(hashlib.sha256(params.encode()).hexdigest()[:6], 16)
+    color = (seed >> 16 & 255, seed >> 8 & 255, seed & 255)
+    buffer = io.BytesIO()
+    Image.new("RGB", (1200, 900), color).save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def create_app(args) -> FastAPI:
+    fixtures = Fixtures(args.fixtures)
+    stats = {"requests": 0, "errors": 0}
+    upstream: Optional[httpx.AsyncClient] = httpx.AsyncClient(timeout=60) if args.record else None
+    # Записанные страницы номенклатуры: приложение запрашивает их параллельно
+    recorded_pages: Dict[int, Dict[int, List[dict]]] = {}
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        if upstream is not None:
+            await upstream.aclose()
+
+    app = FastAPI(title="SBIS stand-in", lifespan=lifespan)
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        stats["requests"] += 1
+        if request.url.path == "/_stats":
+            return await call_next(request)
+        delay = max(args.latency + random.uniform(-args.jitter, args.jitter), 0) / 1000
+        if delay:
+            await asyncio.sleep(delay)
+        roll = random.random()
+        if roll < args.error_rate:
+            stats["errors"] += 1
+            return Response(status_code=503, content=b'{"error": "injected"}', media_type="application/json")
+        if roll < args.error_rate + args.hang_rate:
+            stats["errors"] += 1
+            await asyncio.sleep(args.hang_seconds)
+        return await call_next(request)
+
+    async def record(method: str, url: str, request: Request, **kwargs) -> httpx.Response:
+        headers = {k: v for k, v in request.headers.items() if k.lower() in ("x-sbissessionid", "x-sbisaccesstoken", "content-type", "accept")}
+        return await upstream.request(method, url, params=dict(request.query_params), headers=headers, **kwargs)
+
+    @app.post("/oauth/service/")
+    async def oauth(request: Request):
+        if upstream is not None:
+            response = await record("POST", UPSTREAM_OAUTH, request, content=await request.body())
+            return Response(response.content, response.status_code, media_type="application/json")
+        return fixtures.load("oauth.json")
+
+    @app.get("/retail/point/list")
+    async def point_list(request: Request):
+        if upstream is not None:
+            response = await record("GET", f"{UPSTREAM_API}/point/list", request)
+            if response.status_code == 200:
+                fixtures.save("point_list.json", response.json())
+            return Response(response.content, response.status_code, media_type="application/json")
+        return fixtures.load("point_list.json")
+
+    @app.get("/retail/nomenclature/price-list")
+    async def price_list(request: Request):
+        if upstream is not None:
+            response = await record("GET", f"{UPSTREAM_API}/nomenclature/price-list", request)
+            if response.status_code == 200:
+                fixtures.save("price_list.json", response.json())
+            return Response(response.content, response.status_code, media_type="application/json")
+        return fixtures.load("price_list.json")
+
+    @app.get("/retail/nomenclature/list")
+    async def nomenclature_list(request: Request, priceListId: int, page: int = 0, pageSize: int = 200):
+        name = f"nomenclature_{priceListId}.json"
+        if upstream is not None:
+            response = await record("GET", f"{UPSTREAM_API}/nomenclature/list", request)
+            if response.status_code == 200:
+                # Страницы складываются в один файл, при воспроизведении режутся заново
+                pages = recorded_pages.setdefault(priceListId, {})
+                pages[page] = response.json().get("nomenclatures") or []
+                fixtures.save(name, {"nomenclatures": [item for number in sorted(pages) for item in pages[number]]})
+            return Response(response.content, response.status_code, media_type="application/json")
+        if not os.path.exists(fixtures.path(name)):
+            name = "nomenclature.json"
+        items = fixtures.load(name)["nomenclatures"]
+        chunk = items[page * pageSize:(page + 1) * pageSize]
+        return {"nomenclatures": chunk, "outcome": {"hasMore": (page + 1) * pageSize < len(items)}}
+
+    @app.get("/retail/nomenclature/balances")
+    async def balances(request: Request):
+        if upstream is not None:
+            response = await record("GET", f"{UPSTREAM_API}/nomenclature/balances", request)
+            if response.status_code == 200:
+                fixtures.save("balances.json", response.json())
+            return Response(response.content, response.status_code, media_type="application/json")
+        if os.path.exists(fixtures.path("balances.json")):
+            return fixtures.load("balances.json")
+        items = fixtures.load("nomenclature.json")["nomenclatures"]
+        return {"balances": [
+            {"nomenclature": item["id"], "balance": item["balance"]}
+            for item in items if item.get("balance") is not None
+        ]}
+
+    @app.get("/retail/img")
+    async def image(request: Request, params: str):
+        if upstream is not None:
+            response = await record("GET", f"{UPSTREAM_API}/img", request)
+            if response.status_code == 200:
+                fixtures.save_image(params, response.content)
+            return Response(response.content, response.status_code, media_type=response.headers.get("content-type"))
+        content = fixtures.image(params) or placeholder_image(params)
+        return Response(content, media_type="image/jpeg")
+
+    @app.get("/_stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--latency", type=float, default=0, help="средняя задержка ответа, мс")
+    parser.add_argument("--jitter", type=float, default=0, help="разброс задержки, ± мс")
+    parser.add_argument("--error-rate", type=float, default=0, help="доля ответов 503")
+    parser.add_argument("--hang-rate", type=float, default=0, help="доля зависающих запросов")
+    parser.add_argument("--hang-seconds", type=float, default=30)
+    parser.add_argument("--record", action="store_true", help="проксировать в СБИС и записывать фикстуры")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()